@@ -3,15 +3,43 @@
 import asyncio
 import json
 import os
-from typing import Any, Dict, List
+import re
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 
+import numpy as np
+
 # LangChain
 # pip install langchain_openai langchain_core
 from langchain_openai import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.callbacks import AsyncCallbackHandler
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import Runnable
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.runnables import Runnable, RunnableSequence
+
+from azure_.openai_service import AzureOpenAIService
+from services.disk_cache import get_disk_cache, make_cache_key
+from services.knowledge_vectors import get_valid_knowledge_vector, knowledge_vector_text
+from services.llm_rate_limiter import get_rate_limiter, parse_retry_after
+from services.run_ledger import (
+    CLAUSE_SUMMARY,
+    KNOWLEDGE_REVIEW,
+    MAPPING_CHUNK,
+    RunLedger,
+)
+from services.structured_output import (
+    build_response_format,
+    get_structured_output_stats,
+    is_structured_output_enabled,
+    repair_json_text,
+    validate_json_text,
+)
+from services.token_counter import count_tokens
+from services.vector_index import VectorIndex, normalize_rows
 
 load_dotenv()
 azure_endpoint = os.getenv(
@@ -21,69 +49,175 @@ azure_api_key = os.getenv("OPENAI_API_KEY")
 azure_api_version = os.getenv("OPENAI_API_VERSION", "2024-12-01-preview")
 
 
-# 共有リソース
-def get_llm(model: str = "gpt-4.1") -> AzureChatOpenAI:
-    params: dict[str, Any] = {
-        "api_key": azure_api_key,
-        "api_version": azure_api_version,
-        "azure_endpoint": azure_endpoint,
-        "azure_deployment": model,
-        "timeout": None,
-        "max_retries": 1,
-    }
-    if model not in ["gpt-5-nano", "gpt-5-mini", "gpt-5.1"]:
-        params["temperature"] = 0.0
-    return AzureChatOpenAI(**params)
+DEFAULT_MODEL = "gpt-4.1"
+
+# 審査・要約が失敗した場合に結果の concern に入れる接頭辞
+REVIEW_ERROR_PREFIX = "LLMエラー: "
+SUMMARY_ERROR_PREFIX = "要約エラー: "
+
+
+def is_error_concern(concern: Any) -> bool:
+    """審査・要約の失敗時の結果（error_result / 要約エラー）か"""
+    return isinstance(concern, str) and concern.startswith(
+        (REVIEW_ERROR_PREFIX, SUMMARY_ERROR_PREFIX)
+    )
+
+# 共有リソース: モデル（デプロイメント）ごとのクライアントとイベントループごとのセマフォ
+_llm_clients: dict[str, AzureChatOpenAI] = {}
+_llm_clients_lock = threading.Lock()
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
 
+def get_llm(model: str = DEFAULT_MODEL, schema: Optional[str] = None) -> Runnable:
+    """
+    モデルごとのクライアントを返す（プロセス内で共有し、HTTP接続を再利用）
+    schema を指定すると `configs/examination/<schema>.schema.json` を
+    response_format（json_schema, strict）として付与したRunnableを返す（`LLM_STRUCTURED_OUTPUT=0` で無効）
+    """
+    with _llm_clients_lock:
+        client = _llm_clients.get(model)
+        if client is None:
+            params: dict[str, Any] = {
+                "api_key": azure_api_key,
+                "api_version": azure_api_version,
+                "azure_endpoint": azure_endpoint,
+                "azure_deployment": model,
+                "timeout": None,
+                "max_retries": 1,
+                # x-ratelimit-* ヘッダをレートリミッタへ渡すため
+                "include_response_headers": True,
+            }
+            if model not in ["gpt-5-nano", "gpt-5-mini", "gpt-5.1"]:
+                params["temperature"] = 0.0
+            client = AzureChatOpenAI(**params)
+            _llm_clients[model] = client
+    if schema and is_structured_output_enabled():
+        return client.bind(response_format=build_response_format(schema))
+    return client
+
+
+def get_max_concurrency(model: str) -> int:
+    """
+    デプロイメントごとの同時実行上限
+    `LLM_MAX_CONCURRENCY_<MODEL>`（例: LLM_MAX_CONCURRENCY_GPT_4_1）→ `LLM_MAX_CONCURRENCY` → 8 の順で決定
+    """
+    key = "LLM_MAX_CONCURRENCY_" + re.sub(r"\W", "_", model).upper()
+    return int(os.getenv(key, os.getenv("LLM_MAX_CONCURRENCY", "8")))
+
+
+def get_llm_semaphore(model: str = DEFAULT_MODEL) -> asyncio.Semaphore:
+    """実行中のイベントループ上で、モデルごとのセマフォを返す"""
+    loop = asyncio.get_running_loop()
+    per_loop = _semaphores.setdefault(loop, {})
+    sem = per_loop.get(model)
+    if sem is None:
+        sem = asyncio.Semaphore(get_max_concurrency(model))
+        per_loop[model] = sem
+    return sem
 
-def get_llm_semaphore(max_concurrency: int = 8) -> asyncio.Semaphore:
-    return asyncio.Semaphore(max_concurrency)
 
+class _ResponseHeadersHandler(AsyncCallbackHandler):
+    """LLM応答メッセージのresponse_metadataからHTTPヘッダを取り出すコールバック"""
 
-llm = get_llm()
-sem = get_llm_semaphore()
+    def __init__(self):
+        self.headers: dict = {}
 
+    async def on_llm_end(self, response, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                headers = getattr(message, "response_metadata", {}).get("headers")
+                if headers:
+                    self.headers = dict(headers)
 
-# LangChain用: セマフォ+バックオフ付き非同期呼び出し
-async def ainvoke_with_limit(chain: Runnable, inp: dict | str) -> str:
+
+async def estimate_prompt_tokens(chain: Runnable, variables: dict) -> int:
+    """
+    送信前に入力トークン数を推定する（先頭がプロンプトテンプレートならレンダリングして計数）
+    出力分として `LLM_COMPLETION_TOKEN_ESTIMATE`（既定1000）を加算する
+    """
+    completion = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", "1000"))
+    first = chain.first if isinstance(chain, RunnableSequence) else None
+    try:
+        if isinstance(first, BasePromptTemplate):
+            rendered = await first.ainvoke(variables)
+            return count_tokens(rendered.to_string()) + completion
+    except Exception:
+        pass
+    return count_tokens(json.dumps(variables, ensure_ascii=False)) + completion
+
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    status = getattr(e, "status_code", None) or getattr(
+        getattr(e, "response", None), "status_code", None
+    )
+    return status == 429 or "429" in str(e) or "rate limit" in str(e).lower()
+
+
+# LangChain用: レートリミッタ+セマフォ+バックオフ付き非同期呼び出し
+async def ainvoke_with_limit(
+    chain: Runnable, inp: dict | str, model: str = DEFAULT_MODEL
+) -> str:
+    """
+    1. デプロイメントごとのトークンバケットで RPM/TPM を確保（推定トークン数で予約）
+    2. モデルごとのセマフォで同時実行数を制限して呼び出し
+    3. 応答ヘッダ（x-ratelimit-remaining-*）でバケットを補正
+    429時は `retry-after` に従いバケット全体を停止し、待機中はセマフォを解放する
+    """
+    variables = {"input": inp} if isinstance(inp, str) else inp
+    limiter = get_rate_limiter(model)
+    estimated_tokens = await estimate_prompt_tokens(chain, variables)
     delay = 0.5
     last_error = None
-    async with sem:
-        for _ in range(5):
-            try:
-                variables = {"input": inp} if isinstance(inp, str) else inp
-                return await chain.ainvoke(variables)
-            except Exception as e:
-                last_error = e
-                msg = str(e).lower()
-
-                # トークン制限超過エラーの判定
-                if any(
-                    keyword in msg
-                    for keyword in [
-                        "context_length_exceeded",
-                        "maximum context length",
-                        "token limit",
-                        "too many tokens",
-                        "tokens exceeded",
-                        "max_tokens",
-                    ]
-                ):
-                    raise Exception(
-                        f"トークン制限超過エラー: 入力データが大きすぎます。\n"
-                        f"詳細: {str(e)}"
-                    )
-
-                # レート制限またはタイムアウトエラーの判定
-                if any(
-                    keyword in msg
-                    for keyword in ["429", "timeout", "timed out", "temporarily"]
-                ):
-                    await asyncio.sleep(delay)
-                    delay = min(delay * 2, 8)
-                else:
-                    # その他のエラーは即座に再送出
-                    raise
+    for _ in range(5):
+        await limiter.acquire(estimated_tokens)
+        handler = _ResponseHeadersHandler()
+        try:
+            async with get_llm_semaphore(model):
+                result = await chain.ainvoke(variables, config={"callbacks": [handler]})
+            limiter.update_from_headers(handler.headers)
+            return result
+        except Exception as e:
+            last_error = e
+            msg = str(e).lower()
+
+            # トークン制限超過エラーの判定
+            if any(
+                keyword in msg
+                for keyword in [
+                    "context_length_exceeded",
+                    "maximum context length",
+                    "token limit",
+                    "too many tokens",
+                    "tokens exceeded",
+                    "max_tokens",
+                ]
+            ):
+                raise Exception(
+                    f"トークン制限超過エラー: 入力データが大きすぎます。\n"
+                    f"詳細: {str(e)}"
+                )
+
+            # レート制限: retry-after の間は同一デプロイメントの全呼び出しを止める
+            if _is_rate_limit_error(e):
+                retry_after = parse_retry_after(
+                    getattr(getattr(e, "response", None), "headers", None)
+                )
+                wait = retry_after if retry_after is not None else delay
+                limiter.penalize(wait)
+                await asyncio.sleep(wait)
+                delay = min(delay * 2, 8)
+            # タイムアウト/一時エラーは指数バックオフ（セマフォは解放済み）
+            elif any(
+                keyword in msg for keyword in ["timeout", "timed out", "temporarily"]
+            ):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 8)
+            else:
+                # その他のエラーは即座に再送出
+                raise
 
     # 全てのリトライが失敗した場合
     raise Exception(
@@ -92,12 +226,189 @@ async def ainvoke_with_limit(chain: Runnable, inp: dict | str) -> str:
     )
 
 
+REPAIR_SYSTEM_PROMPT = (
+    "あなたはJSONの整形担当です。入力されたJSONを、指定のJSON Schemaに適合するよう形式だけを最小限に修正して出力してください。\n"
+    "文言・値の内容は変更・追加・削除しないでください。JSON以外は出力しないでください。"
+)
+
+
+def get_repair_model() -> str:
+    """スキーマ検証に失敗した応答の修復に使うモデル（`LLM_REPAIR_MODEL`、既定 gpt-4.1-mini）"""
+    return os.getenv("LLM_REPAIR_MODEL", "gpt-4.1-mini")
+
+
+async def aparse_structured_output(raw: str, schema: str) -> Any:
+    """
+    LLM応答をパースして `configs/examination/<schema>.schema.json` で検証する
+    検証に失敗した場合のみ修復する:
+      1. 機械的な修復（コードブロック・前後の説明文・末尾カンマの除去）
+      2. 軽量モデルによる修復（検証エラーと元の応答のみを送り、形式だけを直させる）
+    Raises:
+        ValueError: 修復後も検証に失敗した場合
+    """
+    stats = get_structured_output_stats()
+    payload, error = validate_json_text(raw, schema)
+    if error is None:
+        stats.record("valid")
+        return payload
+    payload, _ = validate_json_text(repair_json_text(raw), schema)
+    if payload is not None:
+        stats.record("local_repaired")
+        return payload
+
+    repair_model = get_repair_model()
+    chain: Runnable = (
+        ChatPromptTemplate.from_messages(
+            [("system", REPAIR_SYSTEM_PROMPT), ("human", "{input}")]
+        )
+        | get_llm(repair_model, schema=schema)
+        | StrOutputParser()
+    )
+    prompt = (
+        f"【検証エラー】\n{error}\n\n"
+        f"【修正対象の出力】\n{raw}"
+    )
+    try:
+        repaired = await ainvoke_with_limit(chain, prompt, model=repair_model)
+    except Exception as e:
+        stats.record("failed")
+        raise ValueError(f"{error}（修復呼び出しに失敗: {e}）")
+    payload, repair_error = validate_json_text(repair_json_text(repaired), schema)
+    if payload is None:
+        stats.record("failed")
+        raise ValueError(f"{error}（修復後: {repair_error}）")
+    stats.record("llm_repaired")
+    return payload
+
+
+def get_review_cache():
+    """審査結果のディスクキャッシュ（`LLM_REVIEW_CACHE_MAX_ENTRIES` / `_MAX_MB` で上限指定）"""
+    return get_disk_cache("llm_review")
+
+
+REVIEW_KNOWLEDGE_FIELDS = [
+    "id",
+    "target_clause",
+    "knowledge_title",
+    "review_points",
+    "action_plan",
+    "clause_sample",
+]
+
+
+def _review_clauses_min(item: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # 【審査対象データ】は["clause_number", "clause"]のみ抽出
+    return [
+        {"clause_number": c.get("clause_number"), "clause": c.get("clause")}
+        for c in item.get("clauses", [])
+        if "clause_number" in c and "clause" in c
+    ]
+
+
+def _review_knowledge_min(item: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # 【審査知見（knowledge）】は指定の6項目のみ抽出
+    return [
+        {f: k.get(f) for f in REVIEW_KNOWLEDGE_FIELDS}
+        for k in item.get("knowledge", [])
+        if all(x in k for x in REVIEW_KNOWLEDGE_FIELDS)
+    ]
+
+
+def get_review_pack_token_budget(pack_token_budget: Optional[int] = None) -> int:
+    """パッキングの上限トークン数（未指定時は `LLM_REVIEW_PACK_TOKENS`、既定0=無効）"""
+    if pack_token_budget is None:
+        pack_token_budget = int(os.getenv("LLM_REVIEW_PACK_TOKENS", "0"))
+    return max(int(pack_token_budget or 0), 0)
+
+
+def pack_review_inputs(
+    reviews: List[Dict[str, Any]], token_budget: int
+) -> List[List[int]]:
+    """
+    審査入力を、対象条項が同一のもの同士でまとめ、1プロンプトあたりtoken_budget以内に詰める
+    Returns:
+        list: まとめたグループごとの reviews のインデックス（token_budget<=0 なら1件ずつ）
+    """
+    if token_budget <= 0:
+        return [[i] for i in range(len(reviews))]
+    by_clauses: dict[str, List[int]] = {}
+    for i, item in enumerate(reviews):
+        key = json.dumps(_review_clauses_min(item), ensure_ascii=False, sort_keys=True)
+        by_clauses.setdefault(key, []).append(i)
+    groups = []
+    for clauses_key, indices in by_clauses.items():
+        base = count_tokens(clauses_key)
+        current: List[int] = []
+        used = base
+        for i in indices:
+            tokens = count_tokens(
+                json.dumps(_review_knowledge_min(reviews[i]), ensure_ascii=False)
+            )
+            if current and used + tokens > token_budget:
+                groups.append(current)
+                current, used = [], base
+            current.append(i)
+            used += tokens
+        if current:
+            groups.append(current)
+    return groups
+
+
+def _split_packed_review_results(
+    parsed: List[Dict[str, Any]], items: List[Dict[str, Any]]
+) -> List[Optional[List[Dict[str, Any]]]]:
+    """
+    まとめて審査した結果（条項×ナレッジの配列）をナレッジごとの結果に振り分ける
+    Returns:
+        list: items の順に、ナレッジごとの結果。対象条項のいずれかの行が応答に無い場合はNone
+            （審査漏れを「懸念なし」と区別できないため、呼び出し側で個別に審査し直す）
+    """
+    per_knowledge: dict[str, dict] = {}
+    for item in items:
+        for k in item.get("knowledge", []):
+            per_knowledge[str(k.get("id"))] = {}
+    for row in parsed:
+        for kid in row.get("knowledge_ids") or []:
+            if str(kid) in per_knowledge:
+                per_knowledge[str(kid)].setdefault(
+                    row.get("clause_number"), {**row, "knowledge_ids": [kid]}
+                )
+    results: List[Optional[List[Dict[str, Any]]]] = []
+    for item in items:
+        item_results = []
+        for c in _review_clauses_min(item):
+            num = c["clause_number"]
+            row = None
+            for k in item.get("knowledge", []):
+                row = per_knowledge.get(str(k.get("id")), {}).get(num)
+                if row:
+                    break
+            if row is None:
+                item_results = None
+                break
+            item_results.append(row)
+        results.append(item_results)
+    return results
+
+
 async def run_batch_reviews(
     reviews: List[Dict[str, Any]],
+    use_cache: bool = True,
+    model: str = DEFAULT_MODEL,
+    pack_token_budget: Optional[int] = None,
+    trace: Optional[dict] = None,
+    ledger: Optional[RunLedger] = None,
 ) -> List[List[Dict[str, Any]]]:
     """
     複数の条項審査をLangChainで並列実行
     reviews: [{"clauses": [...], "knowledge": [...]}]の形式
+    use_cache: Trueの場合、モデル名・システムプロンプト・入力が同一の審査結果を再利用する
+    model: 使用するLLMデプロイメント名
+    pack_token_budget: 対象条項が同一の審査入力を、この上限トークン数まで1回の呼び出しにまとめる
+        （未指定時は `LLM_REVIEW_PACK_TOKENS`、0で無効）。結果はナレッジごとに振り分けて返す
+    trace: 渡すと呼び出し回数・削減数・まとめ呼び出しの失敗/個別再実行数・プロンプトトークン数を加算で書き込む
+    ledger: 渡すとナレッジ審査ごとに入力ハッシュ（キャッシュキー）で結果/エラーを記録し、
+        同じ実行で成功済みの審査はLLMを呼ばずに再利用する（失敗分のみの再実行用）
     """
     system_prompt = (
         "あなたは契約審査の専門家です。以下の審査対象データと審査知見をもとに、各条項ごとに懸念点(concern)と修正条文(amendment_clause)を出力してください。\n"
@@ -106,81 +417,203 @@ async def run_batch_reviews(
         "審査の根拠とする knowledge_ids を必ず提示し、提供する審査知見以外を利用した審査は絶対にしないでください。\n"
         '審査の結果懸念がない場合は、"concern" および "amendment_clause" を null で出力してください。\n'
         "【出力形式】\n"
-        "必ず以下の厳格なJSON配列形式で出力してください。\n"
-        "[\n"
+        "必ず以下の厳格なJSON形式で出力してください。\n"
+        '{{"results": [\n'
         "  {{\n"
         '    "clause_number": <条項番号（文字列）>,\n'
         '    "concern": <懸念点コメント> or null,\n'
         '    "amendment_clause": <修正条文> or null,\n'
         '    "knowledge_ids": [<ナレッジIDの配列>]\n'
         "  }}, ...\n"
-        "]\n"
+        "]}}\n"
     )
-    prompt_template = ChatPromptTemplate.from_messages(
-        [("system", system_prompt), ("human", "{input}")]
+    # 複数ナレッジをまとめて審査する場合は、ナレッジごとに独立した結果を求める
+    packed_system_prompt = system_prompt + (
+        "【複数の審査知見がある場合】\n"
+        "審査知見ごとに独立して審査し、各条項×各審査知見の組み合わせごとに1要素を出力してください。\n"
+        '"knowledge_ids" にはその要素の根拠となった審査知見のIDを1つだけ入れてください。\n'
+    )
+    chain: Runnable = (
+        ChatPromptTemplate.from_messages(
+            [("system", system_prompt), ("human", "{input}")]
+        )
+        | get_llm(model, schema="review_results")
+        | StrOutputParser()
+    )
+    packed_chain: Runnable = (
+        ChatPromptTemplate.from_messages(
+            [("system", packed_system_prompt), ("human", "{input}")]
+        )
+        | get_llm(model, schema="review_results")
+        | StrOutputParser()
     )
-    chain: Runnable = prompt_template | llm | StrOutputParser()
+    cache = get_review_cache() if use_cache else None
+    token_budget = get_review_pack_token_budget(pack_token_budget)
 
-    async def review_one(item: Dict[str, Any]) -> List[Dict[str, Any]]:
-        # 【審査対象データ】は["clause_number", "clause"]のみ抽出
-        clauses_min = [
-            {"clause_number": c.get("clause_number"), "clause": c.get("clause")}
-            for c in item.get("clauses", [])
-            if "clause_number" in c and "clause" in c
-        ]
-        # 【審査知見（knowledge）】は指定の6項目のみ抽出
-        knowledge_min = [
-            {
-                "id": k.get("id"),
-                "target_clause": k.get("target_clause"),
-                "knowledge_title": k.get("knowledge_title"),
-                "review_points": k.get("review_points"),
-                "action_plan": k.get("action_plan"),
-                "clause_sample": k.get("clause_sample"),
-            }
-            for k in item.get("knowledge", [])
-            if all(
-                x in k
-                for x in [
-                    "id",
-                    "target_clause",
-                    "knowledge_title",
-                    "review_points",
-                    "action_plan",
-                    "clause_sample",
-                ]
-            )
-        ]
-        prompt = (
+    def build_prompt(clauses_min, knowledge_min) -> str:
+        return (
             "【審査対象データ】\n"
             f"{json.dumps(clauses_min, ensure_ascii=False)}\n"
             "【審査知見（knowledge）】\n"
             f"{json.dumps(knowledge_min, ensure_ascii=False)}\n\n"
             "審査は提供する審査知見以外を絶対に利用しないでください。"
         )
+
+    def cache_key_of(item: Dict[str, Any]) -> str:
+        # まとめて審査した結果もナレッジ単位の審査結果として同じキーで保存する
+        return make_cache_key(
+            {
+                "model": model,
+                "system_prompt": system_prompt,
+                "clauses": _review_clauses_min(item),
+                "knowledge": _review_knowledge_min(item),
+            }
+        )
+
+    def error_result(item: Dict[str, Any], e: Exception) -> List[Dict[str, Any]]:
+        return [
+            {
+                "clause_number": clause["clause_number"],
+                "concern": f"{REVIEW_ERROR_PREFIX}{e}",
+                "amendment_clause": "",
+                "knowledge_ids": [],
+            }
+            for clause in item.get("clauses", [])
+        ]
+
+    stats = {
+        "items": len(reviews),
+        "cache_hits": 0,
+        "ledger_hits": 0,
+        "calls": 0,
+        "packed_calls": 0,
+        "calls_saved": 0,
+        # まとめ呼び出しの失敗数・応答から結果が漏れたナレッジ数・個別に審査し直したナレッジ数
+        "packed_failed_calls": 0,
+        "packed_incomplete_items": 0,
+        "packed_retried_items": 0,
+        "prompt_tokens": 0,
+        "prompt_tokens_unpacked": 0,
+        "tokens_saved": 0,
+    }
+    system_tokens = count_tokens(system_prompt)
+    packed_system_tokens = count_tokens(packed_system_prompt)
+
+    async def review_one(item: Dict[str, Any]) -> List[Dict[str, Any]]:
+        prompt = build_prompt(_review_clauses_min(item), _review_knowledge_min(item))
+        tokens = system_tokens + count_tokens(prompt)
+        stats["calls"] += 1
+        stats["prompt_tokens"] += tokens
+        stats["prompt_tokens_unpacked"] += tokens
         try:
             # print("Prompt:", prompt)
-            result = await ainvoke_with_limit(chain, prompt)
-            return json.loads(result)
+            result = await ainvoke_with_limit(chain, prompt, model=model)
+            parsed = (await aparse_structured_output(result, "review_results"))[
+                "results"
+            ]
+            # LLMエラー時の結果はキャッシュしない
+            if cache is not None:
+                cache.set(cache_key_of(item), parsed)
+            if ledger is not None:
+                ledger.record_ok(cache_key_of(item), KNOWLEDGE_REVIEW, parsed)
+            return parsed
         except Exception as e:
-            return [
-                {
-                    "clause_number": clause["clause_number"],
-                    "concern": f"LLMエラー: {e}",
-                    "amendment_clause": "",
-                    "knowledge_ids": [],
-                }
-                for clause in item.get("clauses", [])
+            if ledger is not None:
+                ledger.record_failed(cache_key_of(item), KNOWLEDGE_REVIEW, e)
+            return error_result(item, e)
+
+    async def review_packed(items: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        if len(items) == 1:
+            return [await review_one(items[0])]
+        knowledge_min = []
+        for item in items:
+            knowledge_min.extend(_review_knowledge_min(item))
+        prompt = build_prompt(_review_clauses_min(items[0]), knowledge_min)
+        try:
+            result = await ainvoke_with_limit(packed_chain, prompt, model=model)
+            parsed = (await aparse_structured_output(result, "review_results"))[
+                "results"
             ]
+        except Exception:
+            # まとめた呼び出しが失敗した場合は1件ずつ審査し直す（個別審査の失敗はその結果に残る）
+            stats["packed_failed_calls"] += 1
+            stats["packed_retried_items"] += len(items)
+            return list(await asyncio.gather(*[review_one(item) for item in items]))
+        split = _split_packed_review_results(parsed, items)
+        # 応答から行が漏れたナレッジは結果として扱わず（キャッシュ・台帳にも記録せず）個別に審査し直す
+        incomplete = [i for i, item_results in enumerate(split) if item_results is None]
+        stats["packed_incomplete_items"] += len(incomplete)
+        stats["packed_retried_items"] += len(incomplete)
+        stats["calls"] += 1
+        stats["packed_calls"] += 1
+        stats["calls_saved"] += len(items) - 1 - len(incomplete)
+        packed_tokens = packed_system_tokens + count_tokens(prompt)
+        unpacked_tokens = sum(
+            system_tokens
+            + count_tokens(
+                build_prompt(_review_clauses_min(item), _review_knowledge_min(item))
+            )
+            for item in items
+        )
+        stats["prompt_tokens"] += packed_tokens
+        stats["prompt_tokens_unpacked"] += unpacked_tokens
+        for item, item_results in zip(items, split):
+            if item_results is None:
+                continue
+            if cache is not None:
+                cache.set(cache_key_of(item), item_results)
+            if ledger is not None:
+                ledger.record_ok(cache_key_of(item), KNOWLEDGE_REVIEW, item_results)
+        retried = await asyncio.gather(*[review_one(items[i]) for i in incomplete])
+        for i, item_results in zip(incomplete, retried):
+            split[i] = item_results
+        return split
 
-    tasks = [review_one(item) for item in reviews]
-    return await asyncio.gather(*tasks)
+    results: List[Optional[List[Dict[str, Any]]]] = [None] * len(reviews)
+    misses = []
+    for i, item in enumerate(reviews):
+        if cache is not None:
+            cached = cache.get(cache_key_of(item))
+            if cached is not None:
+                results[i] = cached
+                stats["cache_hits"] += 1
+                continue
+        if ledger is not None:
+            recorded = ledger.lookup(cache_key_of(item))
+            if recorded is not None:
+                results[i] = recorded
+                stats["ledger_hits"] += 1
+                continue
+        misses.append(i)
+
+    groups = [
+        [misses[j] for j in group]
+        for group in pack_review_inputs([reviews[i] for i in misses], token_budget)
+    ]
+    group_results = await asyncio.gather(
+        *[review_packed([reviews[i] for i in group]) for group in groups]
+    )
+    for group, item_results in zip(groups, group_results):
+        for i, r in zip(group, item_results):
+            results[i] = r
+
+    stats["tokens_saved"] = stats["prompt_tokens_unpacked"] - stats["prompt_tokens"]
+    if trace is not None:
+        for k, v in stats.items():
+            trace[k] = trace.get(k, 0) + v
+    return results
 
 
-async def run_batch_summaries(summaries: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+async def run_batch_summaries(
+    summaries: List[Dict[str, Any]],
+    model: str = DEFAULT_MODEL,
+    ledger: Optional[RunLedger] = None,
+) -> List[Dict[str, str]]:
     """
     複数の要約処理をLangChainで並列実行
     summaries: [{"clause_number": "...", "concerns": [...], "amendments": [...]}]の形式
+    model: 使用するLLMデプロイメント名
+    ledger: 渡すと条項要約ごとに入力ハッシュで結果/エラーを記録し、成功済みの要約を再利用する
     """
     system_prompt = (
         "あなたは契約審査の専門家です。以下の複数の指摘事項・修正条項案を統合し、重複や類似内容をまとめて簡潔にしてください。\n"
@@ -190,7 +623,9 @@ async def run_batch_summaries(summaries: List[Dict[str, Any]]) -> List[Dict[str,
     prompt_template = ChatPromptTemplate.from_messages(
         [("system", system_prompt), ("human", "{input}")]
     )
-    chain: Runnable = prompt_template | llm | StrOutputParser()
+    chain: Runnable = (
+        prompt_template | get_llm(model, schema="review_summary") | StrOutputParser()
+    )
 
     async def summarize_one(item: Dict[str, Any]) -> Dict[str, str]:
         prompt = (
@@ -198,59 +633,276 @@ async def run_batch_summaries(summaries: List[Dict[str, Any]]) -> List[Dict[str,
             f"【指摘事項一覧】{json.dumps(item['concerns'], ensure_ascii=False)}\n"
             f"【修正文案一覧】{json.dumps(item['amendments'], ensure_ascii=False)}\n"
         )
+        unit_key = make_cache_key(
+            {"model": model, "system_prompt": system_prompt, "prompt": prompt}
+        )
+        if ledger is not None:
+            recorded = ledger.lookup(unit_key)
+            if recorded is not None:
+                return recorded
         try:
             # print("Prompt:", prompt)
-            result = await ainvoke_with_limit(chain, prompt)
-            parsed = json.loads(result)
-            return {
+            result = await ainvoke_with_limit(chain, prompt, model=model)
+            parsed = await aparse_structured_output(result, "review_summary")
+            summary = {
                 "concern": parsed.get("concern", ""),
                 "amendment_clause": parsed.get("amendment_clause", ""),
             }
+            if ledger is not None:
+                ledger.record_ok(unit_key, CLAUSE_SUMMARY, summary)
+            return summary
         except Exception as e:
-            return {"concern": "要約エラー: " + str(e), "amendment_clause": ""}
+            if ledger is not None:
+                ledger.record_failed(unit_key, CLAUSE_SUMMARY, e)
+            return {"concern": SUMMARY_ERROR_PREFIX + str(e), "amendment_clause": ""}
 
     tasks = [summarize_one(item) for item in summaries]
     return await asyncio.gather(*tasks)
 
 
+PREFILTER_RECALL_KS = (1, 3, 5, 10, 20, 50)
+
+
+async def aembed_texts(texts: List[str]) -> np.ndarray:
+    """テキストを text-embedding-3-small で埋め込み、L2正規化済み行列 (n, d) を返す"""
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    service = AzureOpenAIService()
+    inputs = [(t or "").strip() or "-" for t in texts]
+    vectors = await service.aget_embeddings_batch(inputs)
+    return normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+
+def _stored_knowledge_vector(
+    knowledge: Dict[str, Any], vector_index: Optional[VectorIndex]
+) -> Optional[Any]:
+    """
+    ナレッジの有効な保存済みベクトル（ナレッジのベクトル索引を優先し、無ければレコードの値）
+    索引のベクトルは索引に載せた時点の target_clause が現在の値と同じ場合のみ使う
+    """
+    if vector_index is not None:
+        hit = vector_index.get(knowledge.get("id"))
+        if hit is not None:
+            vector, payload = hit
+            if knowledge_vector_text(payload) == knowledge_vector_text(knowledge):
+                return vector
+    return get_valid_knowledge_vector(knowledge)
+
+
+async def _prefilter_knowledge_candidates(
+    knowledge_all: List[Dict[str, Any]],
+    clauses: List[Dict[str, Any]],
+    top_k: int,
+    vector_index: Optional[VectorIndex] = None,
+) -> tuple[np.ndarray, np.ndarray, dict[str, Any]]:
+    """
+    target_clause と各条項の埋め込みのコサイン類似度で、条項ごとに上位top_k件のナレッジを選ぶ
+    vector_index: ナレッジのベクトル索引（KnowledgeAPI.get_knowledge_vector_index）。
+        渡すと索引のベクトルを再利用し、索引に無いナレッジのみ埋め込む
+    Returns:
+      candidates: (条項数, top_k) 候補ナレッジのインデックス（類似度降順）
+      rank_pos  : (条項数, ナレッジ数) 各ナレッジの条項ごとの順位（0始まり）
+      stats     : 埋め込み/選択の所要時間
+    """
+    t0 = time.perf_counter()
+    # backfill済みの有効なベクトルは再利用し、無いものだけ埋め込む
+    stored = [_stored_knowledge_vector(k, vector_index) for k in knowledge_all]
+    missing = [i for i, v in enumerate(stored) if v is None]
+    missing_matrix, clause_matrix = await asyncio.gather(
+        aembed_texts([str(knowledge_all[i].get("target_clause") or "") for i in missing]),
+        aembed_texts([str(c.get("clause") or "") for c in clauses]),
+    )
+    knowledge_matrix = np.zeros((len(knowledge_all), clause_matrix.shape[1]), np.float32)
+    for row, i in enumerate(missing):
+        knowledge_matrix[i] = missing_matrix[row]
+    for i, v in enumerate(stored):
+        if v is not None:
+            knowledge_matrix[i] = normalize_rows(np.asarray(v, dtype=np.float32))[0]
+    t1 = time.perf_counter()
+    scores = clause_matrix @ knowledge_matrix.T
+    k = min(top_k, scores.shape[1])
+    order = np.argsort(-scores, axis=1)
+    candidates = order[:, :k]
+    rank_pos = np.empty_like(order)
+    rows = np.arange(order.shape[0])[:, None]
+    rank_pos[rows, order] = np.arange(order.shape[1])[None, :]
+    t2 = time.perf_counter()
+    return (
+        candidates,
+        rank_pos,
+        {
+            "embedded_knowledge": len(missing),
+            "embedding_sec": round(t1 - t0, 3),
+            "selection_sec": round(t2 - t1, 3),
+        },
+    )
+
+
+def _mapped_pair_ranks(
+    response: List[Dict[str, Any]],
+    knowledge_all: List[Dict[str, Any]],
+    clauses: List[Dict[str, Any]],
+    rank_pos: np.ndarray,
+) -> List[int]:
+    """マッピング結果の (knowledge, clause) 組ごとの、その条項における類似度順位（0始まり）"""
+    clause_pos = {str(c["clause_number"]): i for i, c in enumerate(clauses)}
+    knowledge_pos = {k["id"]: i for i, k in enumerate(knowledge_all)}
+    return [
+        int(rank_pos[clause_pos[num], knowledge_pos[item["knowledge_id"]]])
+        for item in response
+        for num in item.get("clause_number", [])
+        if num in clause_pos and item["knowledge_id"] in knowledge_pos
+    ]
+
+
+async def aevaluate_prefilter_recall(
+    knowledge_all: List[Dict[str, Any]],
+    clauses: List[Dict[str, Any]],
+    top_k: int,
+    model: str = DEFAULT_MODEL,
+    vector_index: Optional[VectorIndex] = None,
+) -> Dict[str, Any]:
+    """
+    事前絞り込みの再現率を評価する（検証用。絞り込みなしのマッピングを1回実行する）
+    絞り込みなし（全ナレッジ送信）のマッピング結果を正解とし、その (knowledge, clause) 組のうち
+    埋め込み類似度で条項ごとの上位k件に含まれる割合を recall_at_k とする
+    Returns:
+      dict: top_k, reference_pairs（正解の組数）, hits_at_k（kごとの的中数）, recall_at_k
+    """
+    reference, _, _ = await amatching_clause_and_knowledge(
+        knowledge_all, clauses, prefilter_top_k=None, model=model
+    )
+    _, rank_pos, _ = await _prefilter_knowledge_candidates(
+        knowledge_all, clauses, top_k, vector_index=vector_index
+    )
+    ranks = _mapped_pair_ranks(reference, knowledge_all, clauses, rank_pos)
+    ks = sorted(k for k in {*PREFILTER_RECALL_KS, top_k} if k <= len(knowledge_all))
+    hits = {str(k): sum(1 for r in ranks if r < k) for k in ks}
+    return {
+        "top_k": top_k,
+        "reference_pairs": len(ranks),
+        "hits_at_k": hits,
+        "recall_at_k": {
+            k: (n / len(ranks) if ranks else None) for k, n in hits.items()
+        },
+    }
+
+
+# デプロイメントごとのコンテキスト長（入力+出力）と出力上限（トークン）
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4.1": 1_047_576,
+    "gpt-4.1-mini": 1_047_576,
+    "gpt-5-mini": 400_000,
+    "gpt-5-nano": 400_000,
+    "gpt-5.1": 400_000,
+}
+MODEL_MAX_OUTPUT_TOKENS = {
+    "gpt-4.1": 32_768,
+    "gpt-4.1-mini": 32_768,
+    "gpt-5-mini": 128_000,
+    "gpt-5-nano": 128_000,
+    "gpt-5.1": 128_000,
+}
+DEFAULT_CONTEXT_TOKENS = 128_000
+DEFAULT_MAX_OUTPUT_TOKENS = 16_384
+
+
+def plan_clause_chunks(
+    clause_tokens: List[int],
+    overhead_tokens: int,
+    output_tokens: int,
+    model: str = DEFAULT_MODEL,
+    max_chunk_tokens: Optional[int] = None,
+) -> tuple[List[List[int]], dict[str, Any]]:
+    """
+    条項をトークン予算内のチャンクに均等に詰める（LPT: 大きい順に最も空いているチャンクへ）
+    Args:
+      clause_tokens   : 条項ごとのトークン数（候補ナレッジ分を含めてもよい）
+      overhead_tokens : チャンクごとに共通で送るトークン数（システムプロンプト・テンプレート・ナレッジ）
+      output_tokens   : 想定出力トークン数
+      max_chunk_tokens: 1チャンクあたりの条項トークン上限（未指定時は `MATCHING_CHUNK_TOKENS`、既定12000）
+    Returns:
+      chunks: チャンクごとの条項インデックス（元の順序）
+      stats : 予算・チャンクごとのトークン数
+    Raises:
+      ValueError: 想定出力がモデルの出力上限を超える場合、
+        または共通部分と出力予約だけでコンテキスト長を超え、条項を1件も載せられない場合
+    """
+    if max_chunk_tokens is None:
+        max_chunk_tokens = int(os.getenv("MATCHING_CHUNK_TOKENS", "12000"))
+    context = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    max_output = MODEL_MAX_OUTPUT_TOKENS.get(model, DEFAULT_MAX_OUTPUT_TOKENS)
+    if output_tokens > max_output:
+        # 出力上限で切り詰めると応答のJSONが途中で切れるため、呼び出し側で1回あたりのナレッジを減らす
+        raise ValueError(
+            f"想定出力がモデル {model} の出力上限を超えています: "
+            f"{output_tokens} > {max_output} トークン（1回の呼び出しに含めるナレッジを減らしてください）"
+        )
+    output_reserve = output_tokens
+    window = context - overhead_tokens - output_reserve
+    if window <= 0:
+        raise ValueError(
+            f"ナレッジ等の共通部分と出力予約がモデル {model} のコンテキスト長を超えています: "
+            f"共通部分 {overhead_tokens} + 出力 {output_reserve} > コンテキスト長 {context} トークン"
+            "（事前絞り込み件数の指定、またはナレッジの絞り込みが必要です）"
+        )
+    capacity = max(min(max_chunk_tokens, window), 1)
+    # 1条項で上限を超えるものは単独のチャンクにする
+    oversized = [i for i, t in enumerate(clause_tokens) if t > capacity]
+    regular = [i for i, t in enumerate(clause_tokens) if t <= capacity]
+    total = sum(clause_tokens[i] for i in regular)
+    n_chunks = -(-total // capacity) if regular else 0
+    loads = [0] * n_chunks
+    chunks: List[List[int]] = [[] for _ in range(n_chunks)]
+    for i in sorted(regular, key=lambda i: -clause_tokens[i]):
+        tokens = clause_tokens[i]
+        fits = [b for b in range(len(loads)) if loads[b] + tokens <= capacity]
+        if fits:
+            b = min(fits, key=lambda b: loads[b])
+        else:
+            loads.append(0)
+            chunks.append([])
+            b = len(loads) - 1
+        loads[b] += tokens
+        chunks[b].append(i)
+    chunks = [sorted(chunk) for chunk in chunks if chunk] + [[i] for i in oversized]
+    stats = {
+        "model": model,
+        "context_tokens": context,
+        "overhead_tokens": overhead_tokens,
+        "output_tokens": output_reserve,
+        "capacity": capacity,
+        "chunk_tokens": [sum(clause_tokens[i] for i in chunk) for chunk in chunks],
+    }
+    return chunks, stats
+
+
 async def amatching_clause_and_knowledge(
-    knowledge_all: List[Dict[str, Any]], clauses: List[Dict[str, Any]]
+    knowledge_all: List[Dict[str, Any]],
+    clauses: List[Dict[str, Any]],
+    prefilter_top_k: Optional[int] = None,
+    model: str = DEFAULT_MODEL,
+    ledger: Optional[RunLedger] = None,
+    vector_index: Optional[VectorIndex] = None,
 ) -> tuple[list[dict[str, Any]], list[dict[str, Any]], dict[str, Any]]:
     """
     match_cl_and_kn.pyのmatching_clause_and_knowledgeの非同期・LangChain版
+    Args:
+      model          : 使用するLLMデプロイメント名
+      prefilter_top_k: 指定時は埋め込み類似度で条項ごとに上位k件のナレッジに絞り込み、
+                       チャンク内の候補の和集合のみをLLMに送る（未指定時は全件送信）
+      ledger         : 渡すとチャンクごとに入力ハッシュで結果/エラーを記録し、成功済みのチャンクを再利用する
+      vector_index   : 事前絞り込みで保存済みベクトルを引くナレッジのベクトル索引（未指定時はレコードの値）
     Returns:
       response        : Step1のマッピング [{"knowledge_id":..., "clause_number":[...]}...]
       clauses_augmented: Step2適用後の clauses
-      trace           : デバッグ用（送信プロンプト、LLM生応答 など）
+      trace           : デバッグ用（送信プロンプト、LLM生応答、事前絞り込みの候補数/所要時間 など）
     """
-    import re
-
     # --- 1) 入力の正規化（clause_numberは文字列化）
     for c in clauses:
         if not isinstance(c.get("clause_number"), str):
             c["clause_number"] = str(c["clause_number"])
 
-    # --- 2) チャンク戦略（超長文対策）
-    def _chunk_if_needed(
-        clauses: List[Dict[str, Any]], max_chars: int = 18000
-    ) -> List[List[Dict[str, Any]]]:
-        chunks = []
-        current = []
-        size = 0
-        for c in clauses:
-            block = json.dumps(c, ensure_ascii=False)
-            if size + len(block) > max_chars and current:
-                chunks.append(current)
-                current = []
-                size = 0
-            current.append(c)
-            size += len(block)
-        if current:
-            chunks.append(current)
-        return chunks
-
-    clause_chunks = _chunk_if_needed(clauses)
-
     aggregate_map: dict[str, list[str]] = {k["id"]: [] for k in knowledge_all}
     trace = {"prompts": [], "raw_responses": []}
     chunk_errors: list[str] = []
@@ -261,7 +913,7 @@ async def amatching_clause_and_knowledge(
 出力は **厳格なJSONのみ** で返します。余計な説明、コードブロック、注釈は一切含めません。
 
 要件:
-- 出力は配列。各要素は {{"knowledge_id": str, "clause_number": [str, ...]}} の形。
+- 出力は {{"mappings": [...]}} の形のオブジェクト。"mappings" の各要素は {{"knowledge_id": str, "clause_number": [str, ...]}} の形。
 - 条項が特定できない／確度が低い場合は "clause_number": [] とする。
 - "clause_number" は入力の clauses 内の "clause_number"（文字列）で返す。整数にはしない。
 - 解釈は「条項の機能」ベース（例：定義条項、目的条項、開示義務条項 等）。単語一致のみで判断しない。
@@ -276,24 +928,17 @@ clauses（契約条項の本文）:
 {clauses_json}
 
 出力フォーマット（厳格に遵守）:
-[
+{{"mappings": [
     {{"knowledge_id": "xxx-xxx", "clause_number": ["1", "2"]}},
     {{"knowledge_id": "yyy-yyy", "clause_number": []}}
-]
+]}}
 """
     prompt_template = ChatPromptTemplate.from_messages(
         [("system", SYSTEM_PROMPT), ("human", "{input}")]
     )
-    chain: Runnable = prompt_template | llm | StrOutputParser()
-
-    def _force_json(s: str) -> Any:
-        try:
-            return json.loads(s)
-        except Exception:
-            m = re.search(r"(\[.*\])", s, flags=re.DOTALL)
-            if not m:
-                raise
-            return json.loads(m.group(1))
+    chain: Runnable = (
+        prompt_template | get_llm(model, schema="clause_mapping") | StrOutputParser()
+    )
 
     def _dedup(seq):
         seen = set()
@@ -325,35 +970,148 @@ clauses（契約条項の本文）:
             c["knowledge_id"] = _dedup(c["knowledge_id"])
         return clauses
 
-    # --- 3) 各チャンクで判定→ユニオン（非同期並列）
-    async def process_chunk(chunk, chunk_idx):
-        knowledge_min = [
+    # --- 2) 埋め込みによる候補ナレッジの事前絞り込み（任意）
+    prefilter = None
+    candidates = None
+    if prefilter_top_k and knowledge_all and clauses:
+        candidates, rank_pos, prefilter_stats = await _prefilter_knowledge_candidates(
+            knowledge_all, clauses, prefilter_top_k, vector_index=vector_index
+        )
+        clause_pos = {c["clause_number"]: i for i, c in enumerate(clauses)}
+        prefilter = {
+            "top_k": prefilter_top_k,
+            "knowledge_count": len(knowledge_all),
+            **prefilter_stats,
+        }
+        trace["prefilter"] = prefilter
+
+    # --- 2.5) チャンク戦略（トークン数ベース）
+    # システムプロンプト・テンプレート・ナレッジJSON・条項・想定出力をモデルごとの予算内に収め、
+    # チャンク間のトークン数が均等になるように詰める
+    def _knowledge_min(items):
+        return [
             {"id": k["id"], "target_clause": k["target_clause"]}
-            for k in knowledge_all
+            for k in items
             if "id" in k and "target_clause" in k
         ]
-        chunk_min = [
+
+    def _clauses_min(items):
+        return [
             {"clause_number": c["clause_number"], "clause": c["clause"]}
-            for c in chunk
+            for c in items
             if "clause_number" in c and "clause" in c
         ]
+
+    template_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(
+        USER_PROMPT_TEMPLATE.format(knowledge_json="", clauses_json="")
+    )
+    # 出力はナレッジごとに1要素（id + 条項番号）
+    output_per_knowledge = 30
+    clause_tokens = [
+        count_tokens(json.dumps(m, ensure_ascii=False)) + 1
+        for m in [
+            {"clause_number": c.get("clause_number"), "clause": c.get("clause")}
+            for c in clauses
+        ]
+    ]
+    # 応答はナレッジ数に比例して伸びるので、出力上限に収まる件数ずつ呼び出しを分ける
+    max_knowledge_per_call = max(
+        1,
+        MODEL_MAX_OUTPUT_TOKENS.get(model, DEFAULT_MAX_OUTPUT_TOKENS)
+        // output_per_knowledge,
+    )
+
+    def _split_knowledge(items):
+        return [
+            items[i : i + max_knowledge_per_call]
+            for i in range(0, len(items), max_knowledge_per_call)
+        ] or [[]]
+
+    if candidates is None:
+        overhead_tokens = template_tokens + max(
+            count_tokens(json.dumps(_knowledge_min(group), ensure_ascii=False))
+            for group in _split_knowledge(knowledge_all)
+        )
+        output_tokens = output_per_knowledge * min(
+            len(knowledge_all), max_knowledge_per_call
+        )
+    else:
+        # 絞り込み時のナレッジは条項の候補の和集合なので、条項ごとに候補分を上乗せして見積もる
+        knowledge_tokens = [
+            count_tokens(json.dumps(_knowledge_min([k]), ensure_ascii=False))
+            for k in knowledge_all
+        ]
+        clause_tokens = [
+            tokens + sum(knowledge_tokens[j] for j in candidates[i].tolist())
+            for i, tokens in enumerate(clause_tokens)
+        ]
+        overhead_tokens = template_tokens
+        output_tokens = output_per_knowledge * min(
+            len(knowledge_all), len(clauses) * prefilter_top_k, max_knowledge_per_call
+        )
+    chunk_indices, chunk_stats = plan_clause_chunks(
+        clause_tokens, overhead_tokens, output_tokens, model=model
+    )
+    planned_chunks = [[clauses[i] for i in chunk] for chunk in chunk_indices]
+
+    # 条項チャンクごとのナレッジを出力上限に収まる件数に分け、(条項, ナレッジ) の組を1呼び出しとする
+    clause_chunks = []
+    chunk_knowledge = []
+    for chunk in planned_chunks:
+        if candidates is None:
+            knowledge_for_chunk = knowledge_all
+        else:
+            selected = set()
+            for c in chunk:
+                selected.update(candidates[clause_pos[c["clause_number"]]].tolist())
+            knowledge_for_chunk = [knowledge_all[i] for i in sorted(selected)]
+        for group in _split_knowledge(knowledge_for_chunk):
+            clause_chunks.append(chunk)
+            chunk_knowledge.append(group)
+    chunk_stats["knowledge_per_call_max"] = max_knowledge_per_call
+    chunk_stats["calls"] = len(clause_chunks)
+    trace["chunking"] = chunk_stats
+    if candidates is not None:
+        prefilter["candidates_per_chunk"] = [len(kn) for kn in chunk_knowledge]
+
+    # --- 3) 各チャンクで判定→ユニオン（非同期並列）
+    async def process_chunk(chunk, chunk_idx):
+        knowledge_min = _knowledge_min(chunk_knowledge[chunk_idx])
+        chunk_min = _clauses_min(chunk)
         user_prompt = USER_PROMPT_TEMPLATE.format(
             knowledge_json=json.dumps(knowledge_min, ensure_ascii=False),
             clauses_json=json.dumps(chunk_min, ensure_ascii=False),
         )
+        unit_key = make_cache_key(
+            {"model": model, "system_prompt": SYSTEM_PROMPT, "prompt": user_prompt}
+        )
+        recorded = ledger.lookup(unit_key) if ledger is not None else None
         try:
-            raw = await ainvoke_with_limit(chain, user_prompt)
-            parsed = _force_json(raw)
+            if recorded is not None:
+                raw = "(前回の実行結果を再利用)"
+                parsed = recorded
+            else:
+                raw = await ainvoke_with_limit(chain, user_prompt, model=model)
+                parsed = (await aparse_structured_output(raw, "clause_mapping"))[
+                    "mappings"
+                ]
+                if ledger is not None:
+                    ledger.record_ok(unit_key, MAPPING_CHUNK, parsed)
         except Exception as e:
             raw = str(e)
             parsed = []
             chunk_errors.append(raw)
+            if ledger is not None:
+                ledger.record_failed(unit_key, MAPPING_CHUNK, e)
         trace["prompts"].append({"chunk": chunk_idx, "messages": user_prompt})
         trace["raw_responses"].append({"chunk": chunk_idx, "raw": raw})
         return parsed
 
     chunk_tasks = [process_chunk(chunk, idx) for idx, chunk in enumerate(clause_chunks)]
+    llm_started = time.perf_counter()
     chunk_results = await asyncio.gather(*chunk_tasks)
+    if prefilter is not None:
+        prefilter["llm_sec"] = round(time.perf_counter() - llm_started, 3)
 
     if chunk_errors and all(not parsed for parsed in chunk_results):
         raise Exception(
@@ -378,6 +1136,18 @@ clauses（契約条項の本文）:
         # 関連条項が無い場合は空配列で返す
         response.append({"knowledge_id": k_id, "clause_number": mapped})
 
+    # 最終マッピングの (knowledge, clause) 組のうち類似度の上位k件に含まれる割合。
+    # LLMは絞り込み後の候補からしか選べないため再現率ではなく、1.0に偏る。
+    # 再現率は aevaluate_prefilter_recall で絞り込みなしのマッピングと比較して測る
+    if prefilter is not None:
+        ranks = _mapped_pair_ranks(response, knowledge_all, clauses, rank_pos)
+        prefilter["mapped_pairs"] = len(ranks)
+        prefilter["mapped_rank_share_at_k"] = {
+            str(k): (sum(1 for r in ranks if r < k) / len(ranks) if ranks else None)
+            for k in sorted({*PREFILTER_RECALL_KS, prefilter_top_k})
+            if k <= prefilter_top_k
+        }
+
     # --- 5) Step2: 付与
     clauses_augmented = _apply_step2([dict(c) for c in clauses], response)
 
@@ -1,16 +1,48 @@
 from azure_.cosmosdb import AzureCosmosDB
 from azure_.openai_service import AzureOpenAIService
+from services.vector_index import (
+    VectorIndex,
+    get_vector_index,
+    peek_vector_index,
+    save_vector_index,
+)
 import csv
 import io
 import re
 from datetime import datetime
 
 
+CLAUSE_VECTOR_INDEX = "clause_entry"
+CLAUSE_VECTOR_FIELD = "clause_vector"
+CLAUSE_PAYLOAD_FIELDS = ["clause", "review_points", "action_plan"]
+
+
 class ContractAPI:
     def __init__(self):
-        self.cosmosdb_client = AzureCosmosDB().client
+        self.cosmosdb = AzureCosmosDB()
+        self.cosmosdb_client = self.cosmosdb.client
         self.openai_service = AzureOpenAIService()
 
+    def get_clause_vector_index(self, refresh: bool = False) -> VectorIndex:
+        """
+        clause_entry の clause_vector をロードしたローカル索引を返す（プロセス内で共有）
+        """
+
+        def load() -> VectorIndex:
+            db = self.cosmosdb_client.get_database_client("CONTRACT")
+            container = db.get_container_client("clause_entry")
+            fields = ", ".join(f"c.{f}" for f in CLAUSE_PAYLOAD_FIELDS)
+            query = (
+                f"SELECT c.id, {fields}, c.{CLAUSE_VECTOR_FIELD} FROM c "
+                f"WHERE IS_DEFINED(c.{CLAUSE_VECTOR_FIELD}) AND c.{CLAUSE_VECTOR_FIELD} != null"
+            )
+            items = container.query_items(query=query, enable_cross_partition_query=True)
+            return VectorIndex.from_items(
+                items, CLAUSE_VECTOR_FIELD, CLAUSE_PAYLOAD_FIELDS
+            )
+
+        return get_vector_index(CLAUSE_VECTOR_INDEX, load, refresh=refresh)
+
     def search_similar_clauses(self, search_clause: str, top_k: int = 5):
         """
         条項のテキストから類似する条項をベクトル検索する
@@ -20,40 +52,28 @@ class ContractAPI:
             top_k (int): 取得する類似条項の数
 
         Returns:
-            list: 類似度の高い上位条項（id, clause, clause_vector, review_points, action_plan, SimilarityScore）
+            list: 類似度の高い上位条項（id, clause, review_points, action_plan, SimilarityScore）
         """
-        db = self.cosmosdb_client.get_database_client("CONTRACT")
-        container = db.get_container_client("clause_entry")
-
-        # 検索テキストをベクトル化
-        query_embedding = self.openai_service.get_emb_3_small(search_clause)
+        return self.search_similar_clauses_batch([search_clause], top_k=top_k)[0]
 
-        # コサイン類似度による検索クエリ
-        query = f"""
-            SELECT TOP @top_k 
-                c.id,
-                c.clause,
-                c.review_points,
-                c.action_plan,
-                VectorDistance(c.clause_vector, @embedding) AS SimilarityScore
-            FROM c
-            WHERE c.clause_vector != null
-            ORDER BY VectorDistance(c.clause_vector, @embedding)
+    def search_similar_clauses_batch(self, search_clauses: list, top_k: int = 5):
         """
-        parameters = [
-            {"name": "@top_k", "value": top_k},
-            {"name": "@embedding", "value": query_embedding},
-        ]
-        try:
-            items = container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True,
-            )
-        except Exception as e:
-            print(f"Error occurred: {e}")
+        複数の条項テキストについて、ローカル索引で類似条項をまとめて検索する
 
-        return list(items)
+        Args:
+            search_clauses (list): 検索対象の条項テキストのリスト
+            top_k (int): 各条項について取得する類似条項の数
+
+        Returns:
+            list: 入力順に、類似度の高い上位条項のリスト
+        """
+        if not search_clauses:
+            return []
+        index = self.get_clause_vector_index()
+        query_embeddings = self.openai_service.get_embeddings_batch(
+            [(text or "").strip() or "-" for text in search_clauses]
+        )
+        return index.search(query_embeddings, top_k=top_k)
 
     def get_knowledge_entries(self, contract_type: str):
         """
@@ -100,14 +120,13 @@ class ContractAPI:
         """
         contract_typeのidを指定して、contract_typeの値（例：秘密保持）を取得する
         """
-        db = self.cosmosdb_client.get_database_client("CONTRACT")
-        container = db.get_container_client("contract_type")
-        query = f"SELECT c.contract_type FROM c WHERE c.id = '{contract_type_id}'"
-        results = list(
-            container.query_items(query=query, enable_cross_partition_query=True)
+        result = self.cosmosdb.read_item_by_id(
+            container_name="contract_type",
+            item_id=contract_type_id,
+            database_name="CONTRACT",
         )
-        if results:
-            return results[0].get("contract_type")
+        if result:
+            return result.get("contract_type")
         return None
 
     def get_approved_contracts(self):
@@ -135,13 +154,11 @@ class ContractAPI:
         )
 
     def get_contract_by_id(self, contract_id):
-        db = self.cosmosdb_client.get_database_client("CONTRACT")
-        container = db.get_container_client("contract_master")
-        query = f"SELECT * FROM c WHERE c.id = '{contract_id}'"
-        results = list(
-            container.query_items(query=query, enable_cross_partition_query=True)
+        return self.cosmosdb.read_item_by_id(
+            container_name="contract_master",
+            item_id=contract_id,
+            database_name="CONTRACT",
         )
-        return results[0] if results else None
 
     def upsert_contract(self, data):
         db = self.cosmosdb_client.get_database_client("CONTRACT")
@@ -151,7 +168,26 @@ class ContractAPI:
     def upsert_clause_entry(self, data):
         db = self.cosmosdb_client.get_database_client("CONTRACT")
         container = db.get_container_client("clause_entry")
-        return container.upsert_item(body=data)
+        saved = container.upsert_item(body=data)
+        self._on_clause_saved([saved])
+        return saved
+
+    def _on_clause_saved(self, saved_items: list) -> None:
+        """保存後フック: ロード済みの条項ベクトル索引に差分を反映する"""
+        index = peek_vector_index(CLAUSE_VECTOR_INDEX)
+        if index is None or not saved_items:
+            return
+        for clause in saved_items:
+            vector = clause.get(CLAUSE_VECTOR_FIELD)
+            if vector:
+                index.upsert(
+                    clause["id"],
+                    vector,
+                    {f: clause.get(f) for f in CLAUSE_PAYLOAD_FIELDS if f in clause},
+                )
+            else:
+                index.delete(clause["id"])
+        save_vector_index(CLAUSE_VECTOR_INDEX)
 
     def export_examination_result_to_csv(
         self,
@@ -160,7 +196,8 @@ class ContractAPI:
         contract_info: dict,
         clause_review_status: dict,
         examination_datetime: str = None,
-        llm_model: str = None
+        llm_model: str = None,
+        session=None,
     ) -> str:
         """
         審査結果を2テーブル構造のCSV形式で出力
@@ -172,6 +209,7 @@ class ContractAPI:
             clause_review_status: 条項審査状態
             examination_datetime: 審査日時（未指定時は現在時刻）
             llm_model: 使用LLMモデル
+            session: ExaminationSession（渡すと審査結果の索引を再利用する）
 
         Returns:
             str: CSV形式の文字列データ
@@ -239,9 +277,11 @@ class ContractAPI:
         ]
         writer.writerow(clause_headers)
 
-        # analyzed_clausesを辞書に変換（高速検索用）
+        # analyzed_clausesを辞書に変換（高速検索用。セッションがあればその索引を使う）
         analyzed_dict = {}
-        if analyzed_clauses:
+        if session is not None:
+            analyzed_dict = session.result_by_number
+        elif analyzed_clauses:
             for analyzed in analyzed_clauses:
                 clause_number = analyzed.get("clause_number", "")
                 analyzed_dict[clause_number] = analyzed
@@ -1,7 +1,85 @@
 ### examination_api.py
 
+import hashlib
+import json
 
-def examination_api(
+from api.examination_session import ExaminationSession
+
+
+def compute_clause_fingerprints(clauses: list, knowledge_all: list) -> dict:
+    """
+    条項ごとの審査入力フィンガープリントを算出する（差分審査用）
+    条文テキスト・紐付くknowledge_id一覧・そのナレッジ内容が同じなら同じ値になる。
+    Returns:
+        dict: {clause_number: sha256}
+    """
+    knowledge_by_id = {str(k.get("id")): k for k in knowledge_all}
+    review_fields = [
+        "target_clause",
+        "knowledge_title",
+        "review_points",
+        "action_plan",
+        "clause_sample",
+    ]
+    fingerprints = {}
+    for c in clauses:
+        knowledge_ids = sorted(str(kid) for kid in c.get("knowledge_id", []) or [])
+        payload = {
+            "clause": c.get("clause", ""),
+            "knowledge_ids": knowledge_ids,
+            "knowledge": [
+                {f: knowledge_by_id.get(kid, {}).get(f) for f in review_fields}
+                for kid in knowledge_ids
+            ],
+        }
+        blob = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        fingerprints[c.get("clause_number", "")] = hashlib.sha256(
+            blob.encode("utf-8")
+        ).hexdigest()
+    return fingerprints
+
+
+def _empty_clause_result(clause_number) -> dict:
+    return {
+        "clause_number": clause_number,
+        "concern": "",
+        "amendment_clause": "",
+        "knowledge_ids": [],
+    }
+
+
+def _merge_clause_results(clause_number, results: list):
+    """
+    条項の審査結果（ナレッジごと）をまとめる
+    Returns:
+        tuple: (確定した結果 or None, 要約が必要な場合の要約入力 or None)
+    """
+    if not results:
+        return _empty_clause_result(clause_number), None
+    # 審査の完了順に依らず同じ要約入力になるようナレッジID順に並べる（実行台帳での再利用のため）
+    results = sorted(results, key=lambda r: [str(k) for k in r.get("knowledge_ids", [])])
+    concerns = [r["concern"] for r in results if r["concern"]]
+    amendments = [r["amendment_clause"] for r in results if r["amendment_clause"]]
+    knowledge_ids = []
+    for r in results:
+        knowledge_ids.extend(r.get("knowledge_ids", []))
+    knowledge_ids = sorted(set(knowledge_ids), key=str)
+    if len(concerns) > 1 or len(amendments) > 1:
+        return None, {
+            "clause_number": clause_number,
+            "concerns": concerns,
+            "amendments": amendments,
+            "knowledge_ids": knowledge_ids,
+        }
+    return {
+        "clause_number": clause_number,
+        "concern": concerns[0] if concerns else "",
+        "amendment_clause": amendments[0] if amendments else "",
+        "knowledge_ids": knowledge_ids,
+    }, None
+
+
+async def examination_api_stream(
     contract_type: str,
     background_info: str,
     partys: list,
@@ -9,201 +87,433 @@ def examination_api(
     clauses: list,
     knowledge_all: list,
     llm_model: str = "gpt-4.1",
+    previous_analyzed_clauses: list = None,
+    previous_fingerprints: dict = None,
+    pack_token_budget: int = None,
+    trace: dict = None,
+    session: ExaminationSession = None,
+    ledger=None,
 ):
     """
-    Streamlit用: UI部品を使わず、値を直接受け取って審査処理を行う
+    examination_apiの逐次版（非同期ジェネレータ）
+    条項ごとに未完了の審査数を管理する依存関係スケジューラで、
+    最後の審査が完了した瞬間にその条項の要約を起動し、結果が確定した時点でyieldする。
+    差分審査で再利用する条項・ナレッジの無い条項は最初にまとめてyieldする。
     Args:
-        contract_type (str): 契約種別
-        background_info (str): 背景情報
-        partys (list): 当事者リスト
-        title (str): タイトル
-        clauses (list): 条文リスト（dictのリスト、各要素はclause_number, clause, review_points, action_planを含む）
-    Returns:
-        analyzed_clauses (list): 審査結果リスト
+        examination_api と同じ
+        trace (dict, optional): 渡すとステージごとの所要時間を書き込む
+            （reviews/summaries: 件数・合計/最大秒、first_result_sec、total_sec、
+            clause_done_sec: 条項ごとの確定時刻（開始からの秒）、barrier_estimate_sec: 審査→要約を直列にした場合の目安、
+            failed_clause_numbers: 審査・要約のいずれかが失敗した条項、
+            packing: 審査のまとめ呼び出しによる呼び出し削減数・トークン削減数）
+        session (ExaminationSession, optional): clauses/knowledge_all から構築済みの索引。
+            渡すと審査入力の作成に使い、確定した結果を add_result で書き込む（画面描画・CSV出力と共有する用）
+        ledger (RunLedger, optional): 渡すとナレッジ審査・条項要約ごとに結果/エラーを記録し、
+            成功済みの単位は再利用する（同じ台帳で再実行すると失敗した単位のみ再実行）
+    Yields:
+        dict: {"clause_number", "concern", "amendment_clause", "knowledge_ids"}
     """
 
     import os
-    import json
+    import time
     import asyncio
     from collections import defaultdict
     from api import async_llm_service
     from dotenv import load_dotenv
 
+    started = time.perf_counter()
+    stage_sec = {"reviews": [], "summaries": []}
+    clause_done_sec = {}
+
+    def mark_done(clause_number):
+        clause_done_sec[clause_number] = round(time.perf_counter() - started, 3)
+
+    if session is None:
+        session = ExaminationSession(clauses, knowledge_all)
     data = {
         "contract_master_id": "",
         "contract_type": contract_type,
         "background_info": background_info,
         "partys": partys,
         "title": title,
-        "clauses": [
-            {
-                "clause_id": c.get("clause_id", ""),
-                "clause_number": c.get("clause_number", ""),
-                "clause": c.get("clause", ""),
-                "knowledge_id": c.get("knowledge_id", []),
-            }
-            for c in clauses
-        ],
+        "clauses": session.clauses,
     }
 
-    analyzed_clauses = []
-    similar_clauses_knowledge = []
-
-    # knowledge_idのユニーク一覧を抽出
-    all_knowledge_ids = set()
-    for c in data["clauses"]:
-        all_knowledge_ids.update(c.get("knowledge_id", []))
-    all_knowledge_ids = list(all_knowledge_ids)
-
-    # knowledge_idごとに該当条項を抽出し、knowledge_allから該当ナレッジを取得して審査
-    # ここを非同期バッチ化
-    async def process_reviews():
-        # LLMモデルの設定
-        async_llm_service.llm = async_llm_service.get_llm(llm_model)
-
-        review_inputs = []
-        for kid in all_knowledge_ids:
-            target_clauses = [
-                c for c in data["clauses"] if kid in c.get("knowledge_id", [])
-            ]
-            target_knowledge = [k for k in knowledge_all if k.get("id") == kid]
-            if not target_clauses or not target_knowledge:
-                continue
-            review_inputs.append(
-                {"clauses": target_clauses, "knowledge": target_knowledge}
-            )
-        if not review_inputs:
-            return defaultdict(list)
-        review_results_list = await async_llm_service.run_batch_reviews(review_inputs)
-        clause_results = defaultdict(list)
-        for review_results in review_results_list:
-            for item in review_results:
-                clause_results[item["clause_number"]].append(item)
-        return clause_results
-
-    # 条項ごとに複数ナレッジの指摘事項があれば要約
-    async def process_summaries(clause_results):
-        summarized_clauses = []
-        summary_inputs = []
-        clause_map = {}
-        for clause in data["clauses"]:
-            num = clause["clause_number"]
-            results = clause_results.get(num, [])
-            if not results:
-                summarized_clauses.append(
-                    {
-                        "clause_number": num,
-                        "concern": "",
-                        "amendment_clause": "",
-                        "knowledge_ids": [],
-                    }
-                )
-                continue
-            concerns = [r["concern"] for r in results if r["concern"]]
-            amendments = [
-                r["amendment_clause"] for r in results if r["amendment_clause"]
-            ]
-            knowledge_ids = []
-            for r in results:
-                knowledge_ids.extend(r.get("knowledge_ids", []))
-            if len(concerns) > 1 or len(amendments) > 1:
-                summary_inputs.append(
-                    {
-                        "clause_number": num,
-                        "concerns": concerns,
-                        "amendments": amendments,
-                    }
-                )
-                clause_map[num] = {"knowledge_ids": list(set(knowledge_ids))}
-            else:
-                concern_summary = concerns[0] if concerns else ""
-                amendment_summary = amendments[0] if amendments else ""
-                summarized_clauses.append(
-                    {
-                        "clause_number": num,
-                        "concern": concern_summary,
-                        "amendment_clause": amendment_summary,
-                        "knowledge_ids": list(set(knowledge_ids)),
-                    }
-                )
-        # 非同期要約
-        if summary_inputs:
-            summary_results = await async_llm_service.run_batch_summaries(
-                summary_inputs
-            )
-            for inp, res in zip(summary_inputs, summary_results):
-                summarized_clauses.append(
-                    {
+    # 差分審査: 入力が変化した条項（dirty）を特定し、前回結果を再利用する
+    incremental = (
+        previous_analyzed_clauses is not None and previous_fingerprints is not None
+    )
+    reused_clauses = {}
+    if incremental:
+        fingerprints = compute_clause_fingerprints(data["clauses"], knowledge_all)
+        previous_by_number = {
+            a.get("clause_number"): a for a in previous_analyzed_clauses
+        }
+        for num, fp in fingerprints.items():
+            previous = previous_by_number.get(num)
+            # 前回の審査・要約が失敗した条項は入力が同じでも再審査する
+            if (
+                previous_fingerprints.get(num) == fp
+                and previous is not None
+                and not async_llm_service.is_error_concern(previous.get("concern"))
+            ):
+                reused_clauses[num] = previous
+
+    # knowledge_idごとの審査入力を索引から作成
+    # （差分審査時は前回結果を再利用する条項を審査対象から外す）
+    review_inputs = session.review_inputs(exclude_clause_numbers=reused_clauses)
+
+    # 条項ごとの未完了の審査数
+    pending = defaultdict(int)
+    for inp in review_inputs:
+        for c in inp["clauses"]:
+            pending[c["clause_number"]] += 1
+
+    clause_results = defaultdict(list)
+    summarized_clauses = []
+    # 審査・要約のいずれかが失敗した条項（要約で失敗の文言が消えても再審査対象にするため）
+    failed_clause_numbers = set()
+
+    # 審査不要の条項（再利用・ナレッジなし）は即時に返す
+    for clause in data["clauses"]:
+        num = clause["clause_number"]
+        if num in reused_clauses:
+            result = reused_clauses[num]
+        elif pending.get(num):
+            continue
+        else:
+            result = _empty_clause_result(num)
+        summarized_clauses.append(result)
+        session.add_result(result)
+        mark_done(num)
+        yield result
+
+    # 対象条項が同一のナレッジはトークン上限までまとめて1回で審査する
+    pack_token_budget = async_llm_service.get_review_pack_token_budget(
+        pack_token_budget
+    )
+    review_groups = [
+        [review_inputs[i] for i in group]
+        for group in async_llm_service.pack_review_inputs(
+            review_inputs, pack_token_budget
+        )
+    ]
+    packing_stats = {}
+
+    async def review_task(inputs):
+        t0 = time.perf_counter()
+        results = await async_llm_service.run_batch_reviews(
+            inputs,
+            model=llm_model,
+            pack_token_budget=pack_token_budget,
+            trace=packing_stats,
+            ledger=ledger,
+        )
+        stage_sec["reviews"].append(time.perf_counter() - t0)
+        return "review", inputs, results
+
+    async def summary_task(inp):
+        t0 = time.perf_counter()
+        results = await async_llm_service.run_batch_summaries(
+            [inp], model=llm_model, ledger=ledger
+        )
+        stage_sec["summaries"].append(time.perf_counter() - t0)
+        return "summary", inp, results[0]
+
+    tasks = {asyncio.ensure_future(review_task(group)) for group in review_groups}
+    try:
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                kind, inp, res = task.result()
+                if kind == "summary":
+                    result = {
                         "clause_number": inp["clause_number"],
                         "concern": res.get("concern", ""),
                         "amendment_clause": res.get("amendment_clause", ""),
-                        "knowledge_ids": clause_map[inp["clause_number"]][
-                            "knowledge_ids"
-                        ],
+                        "knowledge_ids": inp["knowledge_ids"],
                     }
-                )
-        return summarized_clauses
+                    if async_llm_service.is_error_concern(result["concern"]):
+                        failed_clause_numbers.add(result["clause_number"])
+                    summarized_clauses.append(result)
+                    session.add_result(result)
+                    mark_done(result["clause_number"])
+                    yield result
+                    continue
+                for review_input, review_results in zip(inp, res):
+                    for item in review_results:
+                        clause_results[item["clause_number"]].append(item)
+                        if async_llm_service.is_error_concern(item.get("concern")):
+                            failed_clause_numbers.add(item["clause_number"])
+                    # このナレッジの審査で全ナレッジの審査が揃った条項を確定する
+                    for c in review_input["clauses"]:
+                        num = c["clause_number"]
+                        pending[num] -= 1
+                        if pending[num] > 0:
+                            continue
+                        result, summary_input = _merge_clause_results(
+                            num, clause_results.get(num, [])
+                        )
+                        if summary_input is not None:
+                            tasks.add(
+                                asyncio.ensure_future(summary_task(summary_input))
+                            )
+                            continue
+                        summarized_clauses.append(result)
+                        session.add_result(result)
+                        mark_done(num)
+                        yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if trace is not None:
+        trace.update(
+            {
+                stage: {
+                    "count": len(secs),
+                    "sum_sec": round(sum(secs), 3),
+                    "max_sec": round(max(secs, default=0.0), 3),
+                }
+                for stage, secs in stage_sec.items()
+            }
+        )
+        # 審査を要した条項のうち最初に確定したもの
+        trace["first_result_sec"] = min(
+            (sec for num, sec in clause_done_sec.items() if num in pending),
+            default=None,
+        )
+        trace["total_sec"] = round(time.perf_counter() - started, 3)
+        trace["barrier_estimate_sec"] = round(
+            max(stage_sec["reviews"], default=0.0)
+            + max(stage_sec["summaries"], default=0.0),
+            3,
+        )
+        trace["clause_done_sec"] = clause_done_sec
+        trace["failed_clause_numbers"] = sorted(failed_clause_numbers, key=str)
+        trace["packing"] = {"token_budget": pack_token_budget, **packing_stats}
+
+    # デバッグ用:
+    load_dotenv()
+    debug = os.getenv("DEBUG")
+    if debug:
+        sample_path = os.path.join(
+            os.path.dirname(__file__), "..", "Examination_data_sample.py"
+        )
+        sample_path = os.path.abspath(sample_path)
+        with open(sample_path, "a", encoding="utf-8") as f:
+            f.write("Examination_data = ")
+            json.dump(data, f, ensure_ascii=False, indent=4)
+            f.write("\n")
+            f.write("knowledge_all = ")
+            json.dump(knowledge_all, f, ensure_ascii=False, indent=4)
+            f.write("\n")
+            # f.write("similar_clauses_knowledge = ")
+            # json.dump(similar_clauses_knowledge, f, ensure_ascii=False, indent=4)
+            # f.write("\n")
+            f.write("Clause_results = ")
+            json.dump(clause_results, f, ensure_ascii=False, indent=4)
+            f.write("\n")
+            f.write("Analyzed_clauses = ")
+            json.dump(summarized_clauses, f, ensure_ascii=False, indent=4)
+            f.write("\n")
+
+
+def examination_api(
+    contract_type: str,
+    background_info: str,
+    partys: list,
+    title: str,
+    clauses: list,
+    knowledge_all: list,
+    llm_model: str = "gpt-4.1",
+    previous_analyzed_clauses: list = None,
+    previous_fingerprints: dict = None,
+    pack_token_budget: int = None,
+    trace: dict = None,
+    session: ExaminationSession = None,
+    ledger=None,
+):
+    """
+    Streamlit用: UI部品を使わず、値を直接受け取って審査処理を行う
+    Args:
+        contract_type (str): 契約種別
+        background_info (str): 背景情報
+        partys (list): 当事者リスト
+        title (str): タイトル
+        clauses (list): 条文リスト（dictのリスト、各要素はclause_number, clause, review_points, action_planを含む）
+        previous_analyzed_clauses (list, optional): 前回の審査結果（差分審査モード）
+        previous_fingerprints (dict, optional): 前回の `compute_clause_fingerprints` の結果（差分審査モード）
+        pack_token_budget (int, optional): 対象条項が同一のナレッジをまとめて審査する際の上限トークン数
+            （未指定時は `LLM_REVIEW_PACK_TOKENS`、0で無効）
+        trace (dict, optional): ステージごとの所要時間の出力先（examination_api_stream 参照）
+        session (ExaminationSession, optional): 共有する審査の索引（examination_api_stream 参照）
+        ledger (RunLedger, optional): 作業単位の実行台帳（examination_api_stream 参照）
+    Returns:
+        analyzed_clauses (list): 審査結果リスト（条文リストの順）
+    Note:
+        previous_analyzed_clauses と previous_fingerprints の両方を渡すと差分審査となり、
+        フィンガープリントが変化した条項を含む (knowledge, clause) グループのみ再審査し、
+        要約は変化した条項のみ再実行する。変化のない条項は前回結果をそのまま返す。
+        条項ごとに結果を受け取りたい場合は examination_api_stream を使う。
+    """
+
+    import asyncio
 
     async def main_async():
-        clause_results = await process_reviews()
-        summarized_clauses = await process_summaries(clause_results)
-
-        # デバッグ用:
-        load_dotenv()
-        debug = os.getenv("DEBUG")
-        if debug:
-            sample_path = os.path.join(
-                os.path.dirname(__file__), "..", "Examination_data_sample.py"
+        return [
+            result
+            async for result in examination_api_stream(
+                contract_type,
+                background_info,
+                partys,
+                title,
+                clauses,
+                knowledge_all,
+                llm_model=llm_model,
+                previous_analyzed_clauses=previous_analyzed_clauses,
+                previous_fingerprints=previous_fingerprints,
+                pack_token_budget=pack_token_budget,
+                trace=trace,
+                session=session,
+                ledger=ledger,
             )
-            sample_path = os.path.abspath(sample_path)
-            with open(sample_path, "a", encoding="utf-8") as f:
-                f.write("Examination_data = ")
-                json.dump(data, f, ensure_ascii=False, indent=4)
-                f.write("\n")
-                f.write("knowledge_all = ")
-                json.dump(knowledge_all, f, ensure_ascii=False, indent=4)
-                f.write("\n")
-                # f.write("similar_clauses_knowledge = ")
-                # json.dump(similar_clauses_knowledge, f, ensure_ascii=False, indent=4)
-                # f.write("\n")
-                f.write("Clause_results = ")
-                json.dump(clause_results, f, ensure_ascii=False, indent=4)
-                f.write("\n")
-                f.write("Analyzed_clauses = ")
-                json.dump(summarized_clauses, f, ensure_ascii=False, indent=4)
-                f.write("\n")
-
-        return summarized_clauses
+        ]
 
     # 非同期関数を同期関数から呼び出すためのラッパー
-    return asyncio.run(main_async())
+    summarized_clauses = asyncio.run(main_async())
+    order = {c.get("clause_number", ""): i for i, c in enumerate(clauses)}
+    summarized_clauses.sort(
+        key=lambda r: order.get(r.get("clause_number"), len(order))
+    )
+    return summarized_clauses
 
 
-def search_similar_clauses(clauses, contract_api):
-    similar_clauses_knowledge = []
-    for clause in clauses:
-        clause_text = clause["clause"]
-        clause_number = clause["clause_number"]
+async def run_examination_job(
+    progress,
+    contract_type: str,
+    background_info: str,
+    partys: list,
+    title: str,
+    clauses: list,
+    knowledge_all: list,
+    llm_model: str = "gpt-4.1",
+    prefilter_top_k: int = None,
+    previous_analyzed_clauses: list = None,
+    previous_fingerprints: dict = None,
+    pack_token_budget: int = None,
+    run_id: str = None,
+    get_knowledge_vector_index=None,
+):
+    """
+    マッピング→審査をまとめて行うジョブ（`services.job_runner` のワーカーで実行する）
+    Args:
+        progress (JobProgress): 進捗の書き込み口。stage（"mapping"/"review"）・done/total を更新し、
+            確定した条項の結果を add_partial で逐次追加する
+        clauses (list): 条文リスト（マッピング前）
+        prefilter_top_k (int, optional): amatching_clause_and_knowledge に渡す事前絞り込み件数
+        run_id (str, optional): 実行台帳（services.run_ledger）のID。
+            同じ run_id・同じ入力で再実行すると、成功済みのマッピングチャンク・ナレッジ審査・条項要約は
+            台帳の結果を再利用し、失敗した単位のみLLMを呼び直す
+        get_knowledge_vector_index (callable, optional): ナレッジのベクトル索引を返す関数
+            （KnowledgeAPI.get_knowledge_vector_index）。事前絞り込み時にワーカー上で呼び、
+            保存済みベクトルの参照に使う
+        その他は examination_api と同じ
+    Returns:
+        dict: JSON化可能な結果
+            status: "ok" / "no_mapping"（対応付けが1件も無い）
+            mapping_response, mapping_trace, clauses_augmented,
+            analyzed_clauses（条文順）, trace, fingerprints, no_target_knowledge_ids,
+            run_id, ledger（種別ごとの成功/失敗件数）, failed_units（失敗したままの単位）
+        例外で終了した場合は、この実行で失敗した単位を progress の failed_units に書き込んでから送出する
+    """
+    import asyncio
+    from api import async_llm_service
+    from services.run_ledger import get_run_ledger
 
-        # 類似条項の検索とナレッジ抽出
-        try:
-            similar_clauses = contract_api.search_similar_clauses(clause_text, top_k=3)
-        except Exception as e:
-            print(f"Error occurred: {e}")
-            continue
+    ledger = get_run_ledger(run_id) if run_id else None
 
-        # clause_numberと対応付けて、抽出した similar_clauses のclause_id, c.clause, c.review_points, c.action_plan,を格納する
-        similar_clauses_knowledge.append(
-            {
-                "clause_number": clause_number,
-                "similar_clauses": [
-                    {
-                        "clause_id": c["clause_id"],
-                        "clause": c["clause"],
-                        "review_points": c["review_points"],
-                        "action_plan": c["action_plan"],
-                    }
-                    for c in similar_clauses
-                ],
-            }
+    try:
+        progress.update(stage="mapping", done=0, total=len(clauses))
+        vector_index = None
+        if prefilter_top_k and get_knowledge_vector_index is not None:
+            try:
+                vector_index = await asyncio.to_thread(get_knowledge_vector_index)
+            except Exception as e:
+                print(f"ナレッジのベクトル索引を取得できないためレコードのベクトルを使います: {e}")
+        (
+            mapping_response,
+            clauses_augmented,
+            mapping_trace,
+        ) = await async_llm_service.amatching_clause_and_knowledge(
+            knowledge_all,
+            clauses,
+            prefilter_top_k=prefilter_top_k,
+            ledger=ledger,
+            vector_index=vector_index,
         )
+        result = {
+            "status": "ok",
+            "mapping_response": mapping_response,
+            "mapping_trace": mapping_trace,
+            "clauses_augmented": clauses_augmented,
+            "analyzed_clauses": [],
+            "trace": {},
+            "fingerprints": {},
+            "no_target_knowledge_ids": [],
+            "run_id": run_id,
+            "ledger": {},
+            "failed_units": [],
+        }
+        mapped_total = sum(len(m.get("clause_number", [])) for m in mapping_response or [])
+        if mapped_total == 0:
+            result["status"] = "no_mapping"
+            if ledger is not None:
+                result["ledger"] = ledger.summary()
+                result["failed_units"] = ledger.failed_units()
+            return result
+
+        session = ExaminationSession(clauses_augmented, knowledge_all)
+        result["no_target_knowledge_ids"] = [
+            m["knowledge_id"]
+            for m in mapping_response
+            if not m.get("clause_number") and session.get_knowledge(m["knowledge_id"])
+        ]
+        total = len(session.clauses)
+        progress.update(stage="review", done=0, total=total)
+        done = 0
+        async for clause_result in examination_api_stream(
+            contract_type,
+            background_info,
+            partys,
+            title,
+            clauses_augmented,
+            knowledge_all,
+            llm_model=llm_model,
+            previous_analyzed_clauses=previous_analyzed_clauses,
+            previous_fingerprints=previous_fingerprints,
+            pack_token_budget=pack_token_budget,
+            trace=result["trace"],
+            session=session,
+            ledger=ledger,
+        ):
+            done += 1
+            progress.add_partial(clause_result)
+            progress.update(done=done, last_clause_number=clause_result.get("clause_number"))
+        result["analyzed_clauses"] = session.results()
+        # 失敗を含む条項はフィンガープリントを残さず、次回の差分審査で再審査させる
+        failed_clause_numbers = set(result["trace"].get("failed_clause_numbers", []))
+        result["fingerprints"] = {
+            num: fp
+            for num, fp in compute_clause_fingerprints(clauses_augmented, knowledge_all).items()
+            if num not in failed_clause_numbers
+        }
+        if ledger is not None:
+            result["ledger"] = ledger.summary()
+            result["failed_units"] = ledger.failed_units()
+        return result
+    except BaseException:
+        # 失敗時は結果が返らないため、この実行で失敗した単位を進捗に残す（再実行の案内用）
+        if ledger is not None:
+            progress.update(failed_units=ledger.failed_units())
+        raise
@@ -0,0 +1,129 @@
+### examination_session.py
+
+from typing import Iterable, List, Optional
+
+
+def _normalize_clause(c: dict) -> dict:
+    return {
+        "clause_id": c.get("clause_id", ""),
+        "clause_number": c.get("clause_number", ""),
+        "clause": c.get("clause", ""),
+        "knowledge_id": c.get("knowledge_id", []) or [],
+    }
+
+
+class ExaminationSession:
+    """
+    1回の審査の入力と結果の索引（審査API・画面描画・CSV出力で共有する）
+    - clause_number → 条項、knowledge_id → ナレッジ、clause_number → 審査結果
+    - 条項 ⇔ ナレッジの対応（マッピング結果）を双方向に保持
+    構築はO(条項数 + ナレッジ数 + 対応数)で、以降の参照はすべて辞書引き。
+    """
+
+    def __init__(
+        self,
+        clauses: Iterable[dict],
+        knowledge_all: Iterable[dict],
+        analyzed_clauses: Optional[Iterable[dict]] = None,
+    ):
+        self.clauses: List[dict] = [_normalize_clause(c) for c in clauses]
+        self.knowledge_all = knowledge_all
+        self.clause_by_number: dict = {}
+        for c in self.clauses:
+            self.clause_by_number.setdefault(c["clause_number"], c)
+        self.knowledge_by_id = {str(k.get("id")): k for k in knowledge_all}
+
+        # 条項 ⇔ ナレッジ（初出順を維持）
+        self.knowledge_ids_by_clause: dict = {}
+        self.clause_numbers_by_knowledge: dict = {}
+        for c in self.clauses:
+            num = c["clause_number"]
+            ids = self.knowledge_ids_by_clause.setdefault(num, [])
+            for kid in c["knowledge_id"]:
+                key = str(kid)
+                if key in ids:
+                    continue
+                ids.append(key)
+                numbers = self.clause_numbers_by_knowledge.setdefault(key, [])
+                if num not in numbers:
+                    numbers.append(num)
+
+        self.order = {}
+        for i, c in enumerate(self.clauses):
+            self.order.setdefault(c["clause_number"], i)
+        self.analyzed_clauses = analyzed_clauses
+        self.result_by_number: dict = {}
+        for result in analyzed_clauses or []:
+            self.add_result(result)
+
+    def is_built_from(self, analyzed_clauses, knowledge_all) -> bool:
+        """同じ結果リスト・ナレッジリスト（同一オブジェクト）から構築されたか"""
+        return (
+            self.analyzed_clauses is analyzed_clauses
+            and self.knowledge_all is knowledge_all
+        )
+
+    # 参照 -------------------
+
+    def get_clause(self, clause_number) -> Optional[dict]:
+        return self.clause_by_number.get(clause_number)
+
+    def get_knowledge(self, knowledge_id) -> Optional[dict]:
+        return self.knowledge_by_id.get(str(knowledge_id))
+
+    def get_result(self, clause_number) -> Optional[dict]:
+        return self.result_by_number.get(clause_number)
+
+    def knowledge_ids(self) -> List[str]:
+        """マッピングされたknowledge_id（初出順）"""
+        return list(self.clause_numbers_by_knowledge)
+
+    def knowledge_for_clause(self, clause_number) -> List[dict]:
+        """条項に紐付くナレッジ（見つからないIDは除く）"""
+        return [
+            self.knowledge_by_id[kid]
+            for kid in self.knowledge_ids_by_clause.get(clause_number, [])
+            if kid in self.knowledge_by_id
+        ]
+
+    def clauses_for_knowledge(self, knowledge_id) -> List[dict]:
+        return [
+            self.clause_by_number[num]
+            for num in self.clause_numbers_by_knowledge.get(str(knowledge_id), [])
+        ]
+
+    def review_inputs(self, exclude_clause_numbers: Iterable = ()) -> List[dict]:
+        """
+        ナレッジごとの審査入力 {"clauses": 対象条項, "knowledge": [ナレッジ]} を返す
+        （除外条項のみが対象のナレッジ・knowledge_allに無いナレッジは含めない）
+        """
+        exclude = set(exclude_clause_numbers)
+        inputs = []
+        for kid, numbers in self.clause_numbers_by_knowledge.items():
+            knowledge = self.knowledge_by_id.get(kid)
+            if knowledge is None:
+                continue
+            target_clauses = [
+                self.clause_by_number[num] for num in numbers if num not in exclude
+            ]
+            if target_clauses:
+                inputs.append({"clauses": target_clauses, "knowledge": [knowledge]})
+        return inputs
+
+    # 結果 -------------------
+
+    def bind_results(self, analyzed_clauses: List[dict]) -> None:
+        """画面が保持する結果リストを登録する（is_built_from の判定対象にする）"""
+        self.analyzed_clauses = analyzed_clauses
+        for result in analyzed_clauses:
+            self.add_result(result)
+
+    def add_result(self, result: dict) -> None:
+        self.result_by_number[result.get("clause_number")] = result
+
+    def results(self) -> List[dict]:
+        """審査結果（条文リストの順）"""
+        return sorted(
+            self.result_by_number.values(),
+            key=lambda r: self.order.get(r.get("clause_number"), len(self.order)),
+        )
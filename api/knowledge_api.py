@@ -1,16 +1,119 @@
 from azure_.cosmosdb import AzureCosmosDB
 from azure_.openai_service import AzureOpenAIService
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
+import json
+import math
+import os
+import time
 import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 
 from datetime import datetime, timedelta, timezone
 from api.contract_api import ContractAPI
+from services.disk_cache import get_cache_dir
+from services.knowledge_snapshot import (
+    KnowledgeSnapshot,
+    get_snapshot_store,
+    peek_snapshot_store,
+)
+from services.knowledge_vectors import (
+    KNOWLEDGE_VECTOR_FIELD,
+    KNOWLEDGE_VECTOR_HASH_FIELD,
+    get_valid_knowledge_vector,
+    knowledge_vector_hash,
+    knowledge_vector_text,
+)
+from services.text_index import (
+    NgramTextIndex,
+    get_text_index,
+    normalize_text,
+    peek_text_index,
+)
+from services.token_counter import EMBEDDING_ENCODING, count_tokens
+from services.vector_index import (
+    VectorIndex,
+    get_vector_index,
+    peek_vector_index,
+    save_vector_index,
+)
 
 
 JST = timezone(timedelta(hours=9))
 
+KNOWLEDGE_SNAPSHOT = "knowledge_entry"
+KNOWLEDGE_VECTOR_INDEX = "knowledge_entry"
+KNOWLEDGE_PAYLOAD_FIELDS = [
+    "knowledge_number",
+    "contract_type",
+    "knowledge_title",
+    "target_clause",
+]
+
+# 一覧表示用の項目（ベクトル等の大きな項目を含めない）
+KNOWLEDGE_LIST_FIELDS = [
+    "id",
+    "knowledge_number",
+    "version",
+    "contract_type",
+    "knowledge_title",
+    "target_clause",
+    "review_points",
+    "action_plan",
+    "clause_sample",
+    "record_status",
+    "approval_status",
+    "created_at",
+    "updated_at",
+]
+# 共有スナップショットに保持する項目（ベクトルは含めない。差分判定用に _ts / _etag を含める）
+KNOWLEDGE_SNAPSHOT_FIELDS = KNOWLEDGE_LIST_FIELDS + ["_ts", "_etag"]
+# ナビゲーション用の軽量インデックスの項目
+KNOWLEDGE_INDEX_FIELDS = ["id", "knowledge_number", "contract_type", "knowledge_title"]
+# 全文検索の対象項目と重み（番号は文字列として索引する）
+KNOWLEDGE_TEXT_INDEX = "knowledge_entry"
+KNOWLEDGE_TEXT_FIELDS = {
+    "knowledge_number": 3.0,
+    "knowledge_title": 3.0,
+    "target_clause": 2.0,
+    "review_points": 1.0,
+    "action_plan": 1.0,
+    "clause_sample": 1.0,
+}
+
+
+def _knowledge_filter(contract_type: Optional[str] = None) -> tuple:
+    """一覧用のWHERE句とパラメータ"""
+    where = "WHERE 1=1"
+    parameters = []
+    if contract_type:
+        where += " AND c.contract_type = @contract_type"
+        parameters.append({"name": "@contract_type", "value": contract_type})
+    return where, parameters
+
+
+def _projection(fields: List[str]) -> str:
+    return ", ".join(f"c.{f}" for f in fields)
+
+
+# Cosmos DBが付与するシステムプロパティ（保存時には送らない）
+COSMOS_SYSTEM_FIELDS = ["_rid", "_self", "_etag", "_attachments", "_ts"]
+
+
+def _same_value(a, b) -> bool:
+    """一括保存の差分判定用: None/空文字/NaNを同一視し、数値は値で比較する"""
+
+    def normalize(v):
+        if v is None or (isinstance(v, float) and math.isnan(v)) or v == "":
+            return None
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            return float(v)
+        return v
+
+    return normalize(a) == normalize(b)
+
 
 class KnowledgeAPI:
     def __init__(self):
@@ -39,6 +142,315 @@ class KnowledgeAPI:
         """
         return self.contract_api.get_contract_types()
 
+    def get_knowledge_vector_index(self, refresh: bool = False) -> VectorIndex:
+        """
+        knowledge_entry の target_clause_vector をロードしたローカル索引を返す（プロセス内で共有）
+        """
+
+        def load() -> VectorIndex:
+            fields = ", ".join(f"c.{f}" for f in KNOWLEDGE_PAYLOAD_FIELDS)
+            query = (
+                f"SELECT c.id, {fields}, c.{KNOWLEDGE_VECTOR_FIELD}, c.{KNOWLEDGE_VECTOR_HASH_FIELD} FROM c "
+                f"WHERE IS_DEFINED(c.{KNOWLEDGE_VECTOR_FIELD}) AND c.{KNOWLEDGE_VECTOR_FIELD} != null"
+            )
+            items = self.cosmosdb.search_container_by_query(
+                container_name="knowledge_entry",
+                query=query,
+                parameters=[],
+                database_name="CONTRACT",
+            )
+            # target_clause の変更後に埋め込み直していないベクトルは載せない
+            return VectorIndex.from_items(
+                (item for item in items if get_valid_knowledge_vector(item)),
+                KNOWLEDGE_VECTOR_FIELD,
+                KNOWLEDGE_PAYLOAD_FIELDS,
+            )
+
+        return get_vector_index(KNOWLEDGE_VECTOR_INDEX, load, refresh=refresh)
+
+    def backfill_vectors(
+        self,
+        force: bool = False,
+        limit: Optional[int] = None,
+        page_size: int = 200,
+        batch_size: int = 64,
+        max_in_flight: int = 8,
+        checkpoint_path: Optional[str] = None,
+        resume: bool = True,
+        max_batches_in_flight: int = 2,
+    ) -> Dict:
+        """
+        knowledge_entry に target_clause_vector を一括付与する（中断後は再開可能）
+        ページ単位でストリーム取得し、ベクトルが有効な行はスキップ、残りをバッチ埋め込みして並列upsertする。
+        埋め込みとupsertはパイプライン化し、バッチNのupsert中にバッチN+1を埋め込む
+        （upsert待ちのバッチは max_batches_in_flight まで。超えると古いバッチの完了を待つ）。
+        各ページのupsertが全て完了した時点で継続トークンをチェックポイントへ書き出す。
+        Args:
+            force (bool): 既存ベクトルが有効でも再計算する
+            limit (int, optional): 今回の実行で走査する最大件数
+            page_size (int): Cosmosから1ページで取得する件数
+            batch_size (int): 1回の埋め込みリクエストに含める件数
+            max_in_flight (int): upsert_many で同時に書き込むパーティション数の上限
+            checkpoint_path (str, optional): チェックポイントファイル（既定: <APP_CACHE_DIR>/backfill_knowledge_vectors.json）
+            resume (bool): Falseの場合チェックポイントを無視して先頭から処理する
+            max_batches_in_flight (int): 埋め込み済みでupsert完了待ちのバッチ数の上限
+        Returns:
+            Dict: 件数集計とスループット（rows/s, tokens/s）
+        """
+        checkpoint_path = checkpoint_path or os.path.join(
+            get_cache_dir(), "backfill_knowledge_vectors.json"
+        )
+        state = {
+            "continuation": None,
+            "processed": 0,
+            "embedded": 0,
+            "skipped": 0,
+            "empty": 0,
+            "failed": 0,
+            "tokens": 0,
+        }
+        resumed = False
+        if resume and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                state.update(json.load(f))
+            resumed = True
+
+        def write_checkpoint(snapshot: Dict):
+            os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+            tmp_path = checkpoint_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, checkpoint_path)
+
+        def upsert_batch(batch: List[Dict]):
+            return self.cosmosdb.upsert_many(
+                container_name="knowledge_entry",
+                items=batch,
+                database_name="CONTRACT",
+                partition_key_column_name="knowledge_number",
+                max_workers=max_in_flight,
+            )
+
+        # upsert待ちのバッチとページ完了の目印を投入順に並べる
+        # ("batch", future) / ("page", ページ完了時点の走査件数等, 継続トークン)
+        pending: deque = deque()
+        in_flight = 0
+
+        def drain_one():
+            nonlocal in_flight
+            entry = pending.popleft()
+            if entry[0] == "page":
+                # このページまでのupsertは全て完了している（先入れ先出しで処理するため）
+                _, counters, continuation = entry
+                write_checkpoint(
+                    {
+                        **counters,
+                        "embedded": state["embedded"],
+                        "failed": state["failed"],
+                        "continuation": continuation,
+                    }
+                )
+                return
+            in_flight -= 1
+            result = entry[1].result()
+            for r in result.failed:
+                print(f"ナレッジ {r.id} のベクトル保存に失敗しました: {r.error}")
+            state["embedded"] += len(result.succeeded)
+            state["failed"] += len(result.failed)
+
+        def drain_all():
+            while pending:
+                drain_one()
+
+        started = time.perf_counter()
+        run_processed = 0
+        run_tokens = 0
+        completed = True
+        pages = self.cosmosdb.iter_query_pages(
+            container_name="knowledge_entry",
+            query="SELECT * FROM c",
+            parameters=[],
+            page_size=page_size,
+            continuation_token=state["continuation"],
+            database_name="CONTRACT",
+        )
+        with ThreadPoolExecutor(max_workers=max(1, max_batches_in_flight)) as executor:
+            for items, continuation in pages:
+                if limit is not None and run_processed + len(items) > limit:
+                    items = items[: max(0, limit - run_processed)]
+                    completed = False
+                    # ページ途中で打ち切る場合はページ先頭の状態を保存するため、先に全て完了させる
+                    drain_all()
+                page_start_state = dict(state)
+                targets = []
+                for item in items:
+                    text = knowledge_vector_text(item)
+                    if not text:
+                        state["empty"] += 1
+                    elif not force and get_valid_knowledge_vector(item):
+                        state["skipped"] += 1
+                    else:
+                        targets.append(item)
+                for i in range(0, len(targets), batch_size):
+                    batch = targets[i : i + batch_size]
+                    texts = [knowledge_vector_text(item) for item in batch]
+                    vectors = self.openai_service.get_embeddings_batch(texts)
+                    for item, vector in zip(batch, vectors):
+                        item[KNOWLEDGE_VECTOR_FIELD] = vector
+                        item[KNOWLEDGE_VECTOR_HASH_FIELD] = knowledge_vector_hash(item)
+                    tokens = sum(count_tokens(t, EMBEDDING_ENCODING) for t in texts)
+                    state["tokens"] += tokens
+                    run_tokens += tokens
+                    while in_flight >= max(1, max_batches_in_flight):
+                        drain_one()
+                    pending.append(("batch", executor.submit(upsert_batch, batch)))
+                    in_flight += 1
+                state["processed"] += len(items)
+                run_processed += len(items)
+                if not completed:
+                    # ページ途中で打ち切った場合はページ先頭から再開する（処理済み行は再開時にスキップ）
+                    drain_all()
+                    write_checkpoint(page_start_state)
+                    break
+                state["continuation"] = continuation
+                counters = {
+                    k: v for k, v in state.items() if k not in ("embedded", "failed")
+                }
+                pending.append(("page", counters, continuation))
+            drain_all()
+
+        if completed and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        if peek_vector_index(KNOWLEDGE_VECTOR_INDEX) is not None:
+            self.get_knowledge_vector_index(refresh=True)
+
+        elapsed = time.perf_counter() - started
+        return {
+            "processed": state["processed"],
+            "embedded": state["embedded"],
+            "skipped": state["skipped"],
+            "empty": state["empty"],
+            "failed": state["failed"],
+            "resumed": resumed,
+            "completed": completed,
+            "elapsed_sec": round(elapsed, 2),
+            "rows_per_sec": round(run_processed / elapsed, 2) if elapsed else 0.0,
+            "tokens_per_sec": round(run_tokens / elapsed, 2) if elapsed else 0.0,
+        }
+
+    def get_knowledge_snapshot(self, refresh: bool = False) -> KnowledgeSnapshot:
+        """
+        プロセス内で共有するナレッジ一覧のスナップショットを返す
+        初回のみ全件取得し、以降は `_ts` による差分取得と保存/削除フックで最新化する
+        取得する項目は KNOWLEDGE_SNAPSHOT_FIELDS のみ（ベクトル等の大きな項目は読み込まない）
+        """
+        fields = _projection(KNOWLEDGE_SNAPSHOT_FIELDS)
+
+        def load_all() -> List[Dict]:
+            return self.cosmosdb.search_container_by_query(
+                container_name="knowledge_entry",
+                query=f"SELECT {fields} FROM c",
+                parameters=[],
+                database_name="CONTRACT",
+            )
+
+        def load_since(ts: int) -> List[Dict]:
+            return self.cosmosdb.search_container_by_query(
+                container_name="knowledge_entry",
+                query=f"SELECT {fields} FROM c WHERE c._ts >= @ts",
+                parameters=[{"name": "@ts", "value": ts}],
+                database_name="CONTRACT",
+            )
+
+        store = get_snapshot_store(KNOWLEDGE_SNAPSHOT, load_all, load_since)
+        return store.get(refresh=refresh)
+
+    def get_knowledge_all(self, refresh: bool = False) -> List[Dict]:
+        """
+        共有スナップショットからナレッジ全件を返す（get_knowledge_list() の全件取得の代替）
+        要素は複製なので変更してよい（KNOWLEDGE_SNAPSHOT_FIELDS の項目のみで、ベクトルは含まない）
+        """
+        return self.get_knowledge_snapshot(refresh=refresh).to_list()
+
+    def get_knowledge_text_index(self, refresh: bool = False) -> NgramTextIndex:
+        """
+        共有スナップショットから構築したn-gram全文索引を返す（プロセス内で共有）
+        スナップショットが差分更新されていれば、変更分のみ索引へ反映する
+        """
+        snapshot = self.get_knowledge_snapshot()
+
+        def load() -> NgramTextIndex:
+            index = NgramTextIndex(KNOWLEDGE_TEXT_FIELDS, KNOWLEDGE_INDEX_FIELDS)
+            index.sync(snapshot.items, snapshot.version)
+            return index
+
+        index = get_text_index(KNOWLEDGE_TEXT_INDEX, load, refresh=refresh)
+        if index.version != snapshot.version:
+            index.sync(snapshot.items, snapshot.version)
+        return index
+
+    def search_knowledge_text(
+        self,
+        query: str,
+        contract_type: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        ナレッジをキーワードで全文検索する（空白区切りはAND、`|` / ` OR ` 区切りはOR）
+        番号のみの検索語は、番号が完全一致するナレッジを先頭にする（"12" は No.12 → No.112 等の順）
+        Returns:
+            List[Dict]: スコア降順の [{"id", "score", id/番号/種別/タイトル}]
+        """
+        hits = self.get_knowledge_text_index().search(query)
+        number = normalize_text(query)
+        if number.isdigit():
+            hits.sort(key=lambda h: normalize_text(h.get("knowledge_number")) != number)
+        if contract_type:
+            hits = [h for h in hits if h.get("contract_type") == contract_type]
+        return hits[:limit] if limit is not None else hits
+
+    def _on_knowledge_saved(self, saved_items: List[Dict]) -> None:
+        """保存後フック: ロード済みのスナップショット・全文索引・ベクトル索引を同期する"""
+        store = peek_snapshot_store(KNOWLEDGE_SNAPSHOT)
+        if store is not None:
+            store.apply_saved(
+                {f: k[f] for f in KNOWLEDGE_SNAPSHOT_FIELDS if f in k} for k in saved_items
+            )
+        text_index = peek_text_index(KNOWLEDGE_TEXT_INDEX)
+        if text_index is not None:
+            for knowledge in saved_items:
+                text_index.upsert(knowledge)
+        index = peek_vector_index(KNOWLEDGE_VECTOR_INDEX)
+        if index is None or not saved_items:
+            return
+        for knowledge in saved_items:
+            vector = get_valid_knowledge_vector(knowledge)
+            if vector:
+                index.upsert(
+                    knowledge["id"],
+                    vector,
+                    {f: knowledge.get(f) for f in KNOWLEDGE_PAYLOAD_FIELDS},
+                )
+            else:
+                index.delete(knowledge["id"])
+        save_vector_index(KNOWLEDGE_VECTOR_INDEX)
+
+    def _on_knowledge_deleted(self, knowledge_ids: List[str]) -> None:
+        """削除後フック: ロード済みのスナップショット・全文索引・ベクトル索引から除外する"""
+        store = peek_snapshot_store(KNOWLEDGE_SNAPSHOT)
+        if store is not None:
+            store.apply_deleted(knowledge_ids)
+        text_index = peek_text_index(KNOWLEDGE_TEXT_INDEX)
+        if text_index is not None:
+            for knowledge_id in knowledge_ids:
+                text_index.delete(knowledge_id)
+        index = peek_vector_index(KNOWLEDGE_VECTOR_INDEX)
+        if index is None:
+            return
+        for knowledge_id in knowledge_ids:
+            index.delete(knowledge_id)
+        save_vector_index(KNOWLEDGE_VECTOR_INDEX)
+
     def get_knowledge_list(
         self, contract_type: Optional[str] = None, search_text: Optional[str] = None
     ) -> List[Dict]:
@@ -48,8 +460,14 @@ class KnowledgeAPI:
             contract_type (str, optional): 契約種別でフィルター
             search_text (str, optional): テキスト検索でフィルター
         Returns:
-            List[Dict]: ナレッジ一覧
+            List[Dict]: ナレッジ一覧（テキスト検索時は関連度順）
         """
+        if search_text and search_text.strip():
+            # テキスト検索はローカルの全文索引で行い、本文は共有スナップショットから返す
+            snapshot = self.get_knowledge_snapshot()
+            hits = self.search_knowledge_text(search_text, contract_type=contract_type)
+            return [snapshot.get(h["id"]) for h in hits if snapshot.get(h["id"])]
+
         query = "SELECT * FROM c WHERE 1=1"
         parameters = []
 
@@ -57,16 +475,6 @@ class KnowledgeAPI:
             query += " AND c.contract_type = @contract_type"
             parameters.append({"name": "@contract_type", "value": contract_type})
 
-        if search_text:
-            query += """ AND (
-                CONTAINS(c.knowledge_title, @search_text) OR 
-                CONTAINS(c.review_points, @search_text) OR 
-                CONTAINS(c.action_plan, @search_text) OR
-                CONTAINS(c.target_clause, @search_text) OR
-                CONTAINS(c.clause_sample, @search_text)
-            )"""
-            parameters.append({"name": "@search_text", "value": search_text})
-
         results = self.cosmosdb.search_container_by_query(
             container_name="knowledge_entry",
             query=query,
@@ -76,17 +484,69 @@ class KnowledgeAPI:
 
         return results
 
+    def get_knowledge_index(
+        self, contract_type: Optional[str] = None, search_text: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        ナビゲーション用の軽量インデックス（id・番号・種別・タイトルのみ、knowledge_number順）を返す
+        キーワード指定時はローカルの全文索引で関連度順に、それ以外はサーバ側で絞り込む
+        本文はページ表示時に get_knowledge_by_ids(ids, fields=KNOWLEDGE_LIST_FIELDS) で取得する
+        """
+        if search_text and search_text.strip():
+            return self.search_knowledge_text(search_text, contract_type=contract_type)
+        where, parameters = _knowledge_filter(contract_type)
+        results = self.cosmosdb.search_container_by_query(
+            container_name="knowledge_entry",
+            query=f"SELECT {_projection(KNOWLEDGE_INDEX_FIELDS)} FROM c {where}",
+            parameters=parameters,
+            database_name="CONTRACT",
+        )
+
+        def number(k: Dict) -> float:
+            try:
+                return float(k.get("knowledge_number"))
+            except (TypeError, ValueError):
+                return math.inf
+
+        return sorted(results, key=number)
+
     def get_knowledge_by_id(self, knowledge_id: str) -> Optional[Dict]:
         """
-        指定されたIDのナレッジを取得する
+        指定されたIDのナレッジを取得する（knowledge_numberが分かればポイント読み取り）
+        """
+        return self.cosmosdb.read_item_by_id(
+            container_name="knowledge_entry",
+            item_id=knowledge_id,
+            database_name="CONTRACT",
+        )
+
+    def get_knowledge_by_ids(
+        self, knowledge_ids: List[str], fields: Optional[List[str]] = None
+    ) -> Dict[str, Dict]:
+        """
+        複数IDのナレッジをまとめて取得する（{id: knowledge}、存在しないIDは含まない）
+        Args:
+            fields (list, optional): 取得する項目（指定時は1回のクエリで射影して取得。未指定時は全項目）
         """
-        results = self.cosmosdb.query_data_from_container(
+        if fields is not None:
+            ids = list(dict.fromkeys(str(i) for i in knowledge_ids if i is not None))
+            if not ids:
+                return {}
+            items = self.cosmosdb.search_container_by_query(
+                container_name="knowledge_entry",
+                query=(
+                    f"SELECT {_projection(['id', *[f for f in fields if f != 'id']])} "
+                    "FROM c WHERE ARRAY_CONTAINS(@ids, c.id)"
+                ),
+                parameters=[{"name": "@ids", "value": ids}],
+                database_name="CONTRACT",
+            )
+            return {str(k["id"]): k for k in items}
+        return self.cosmosdb.read_items_by_ids(
             container_name="knowledge_entry",
-            column_name="id",
-            column_value=knowledge_id,
+            ids=knowledge_ids,
             database_name="CONTRACT",
         )
-        return results[0] if results else None
 
     def save_knowledge(self, knowledge_data: Dict) -> Dict:
         """
@@ -98,21 +558,131 @@ class KnowledgeAPI:
         JST = timezone(timedelta(hours=9))
         now_jst = datetime.now(JST)
 
-        # 既存データがあればcreated_atを引き継ぐ
+        # 既存データがあればcreated_atと、渡されていない項目（一覧の射影に含まれないベクトル等）を引き継ぐ
         existing = None
         if "id" in knowledge_data:
             existing = self.get_knowledge_by_id(knowledge_data["id"])
+        if existing:
+            for f, v in existing.items():
+                if f not in COSMOS_SYSTEM_FIELDS:
+                    knowledge_data.setdefault(f, v)
         if existing and "created_at" in existing:
             knowledge_data["created_at"] = existing["created_at"]
         else:
             knowledge_data["created_at"] = now_jst.isoformat()
         knowledge_data["updated_at"] = now_jst.isoformat()
 
-        return self.cosmosdb.upsert_to_container(
+        saved = self.cosmosdb.upsert_to_container(
             container_name="knowledge_entry",
             data=knowledge_data,
             database_name="CONTRACT",
         )
+        self._on_knowledge_saved([saved])
+        return saved
+
+    def save_knowledge_bulk(
+        self,
+        records: List[Dict],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        chunk_size: int = 50,
+        max_workers: int = 8,
+        baseline: Optional[List[Dict]] = None,
+    ) -> Dict:
+        """
+        編集済みのナレッジを一括保存する（変更のあったレコードのみ）
+        編集前のレコード（baseline）の同一idのレコードと項目ごとに比較し、変更された項目のみを
+        保存時点のレコードに上書きして `upsert_many` で並列保存する。
+        変更判定は共有スナップショットで行い、変更のあったレコードのみ全項目（ベクトル等を含む）をまとめて読み込む。
+        編集画面を開いた後に他のユーザーが更新したレコード・項目は、この編集で変更していなければ上書きしない。
+        created_at は保存時点のレコードの値を引き継ぐ。
+        Args:
+            records (List[Dict]): 編集後のレコード（idが無いものは新規として保存）
+            baseline (List[Dict], optional): 編集画面に読み込んだ時点のレコード（records と同じ形式）。
+                未指定時はスナップショットのレコードと比較する
+            progress_callback (callable, optional): (保存済み件数, 保存対象件数) を受け取る
+            chunk_size (int): 進捗通知の単位（件）
+            max_workers (int): 同時に書き込むパーティション数の上限
+        Returns:
+            Dict: total / changed / unchanged / succeeded / failed（id, knowledge_number, error）/ request_charge / elapsed_sec
+        """
+        started = time.perf_counter()
+        snapshot = self.get_knowledge_snapshot()
+        now_jst = datetime.now(JST).isoformat()
+
+        baseline_by_id = {b["id"]: b for b in baseline or [] if b.get("id")}
+
+        edited = []
+        for record in records:
+            existing = snapshot.get(record["id"]) if record.get("id") else None
+            loaded = (
+                baseline_by_id.get(record.get("id"))
+                if baseline is not None
+                else existing
+            )
+            if loaded is not None:
+                edits = {
+                    f: v for f, v in record.items() if not _same_value(loaded.get(f), v)
+                }
+                if not edits:
+                    continue
+            else:
+                edits = record
+            edited.append((record, existing, edits))
+
+        # スナップショットはベクトル等を持たないため、上書き元は保存対象のレコードのみ全項目を読み込む
+        current_by_id = self.get_knowledge_by_ids(
+            [record["id"] for record, existing, _ in edited if existing is not None]
+        )
+        changed = []
+        for record, existing, edits in edited:
+            if existing is not None:
+                existing = current_by_id.get(record["id"], existing)
+            item = {**existing, **edits} if existing is not None else dict(record)
+            for f in COSMOS_SYSTEM_FIELDS:
+                item.pop(f, None)
+            if not item.get("id"):
+                item["id"] = str(uuid.uuid4())
+            item["created_at"] = (existing or {}).get("created_at") or now_jst
+            item["updated_at"] = now_jst
+            changed.append(item)
+
+        saved_items, failed, request_charge = [], [], 0.0
+        if progress_callback:
+            progress_callback(0, len(changed))
+        for start in range(0, len(changed), max(1, chunk_size)):
+            chunk = changed[start : start + chunk_size]
+            result = self.cosmosdb.upsert_many(
+                container_name="knowledge_entry",
+                items=chunk,
+                database_name="CONTRACT",
+                partition_key_column_name="knowledge_number",
+                max_workers=max_workers,
+            )
+            request_charge += result.request_charge
+            succeeded = set(result.succeeded)
+            saved_items.extend(item for item in chunk if item["id"] in succeeded)
+            by_id = {item["id"]: item for item in chunk}
+            failed.extend(
+                {
+                    "id": r.id,
+                    "knowledge_number": by_id.get(r.id, {}).get("knowledge_number"),
+                    "error": r.error,
+                }
+                for r in result.failed
+            )
+            if progress_callback:
+                progress_callback(start + len(chunk), len(changed))
+
+        self._on_knowledge_saved(saved_items)
+        return {
+            "total": len(records),
+            "changed": len(changed),
+            "unchanged": len(records) - len(changed),
+            "succeeded": len(saved_items),
+            "failed": failed,
+            "request_charge": round(request_charge, 2),
+            "elapsed_sec": round(time.perf_counter() - started, 3),
+        }
 
     def delete_knowledge(self, knowledge_data: Dict) -> Dict:
         """
@@ -121,11 +691,13 @@ class KnowledgeAPI:
         if "id" not in knowledge_data:
             raise ValueError("ID is required to delete knowledge.")
 
-        return self.cosmosdb.delete_data_from_container_by_column(
+        deleted_ids = self.cosmosdb.delete_data_from_container_by_column(
             container_name="knowledge_entry",
             column_name="knowledge_number",
             column_value=knowledge_data["knowledge_number"],
             partition_key_column_name="knowledge_number",
             database_name="CONTRACT",
         )
+        self._on_knowledge_deleted(deleted_ids)
+        return deleted_ids
     
\ No newline at end of file
@@ -2,15 +2,20 @@
 
 from os import environ
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 from azure.cosmos import CosmosClient
 from azure.cosmos.exceptions import (
+    CosmosBatchOperationError,
     CosmosHttpResponseError,
     CosmosResourceNotFoundError,
     CosmosResourceExistsError,
 )
 import os
+import threading
+import time
 import uuid
 from dotenv import load_dotenv
 import streamlit as st
@@ -25,6 +30,109 @@ def get_cosmosdb_client():
     return CosmosClient(url=endpoint, credential=key)
 
 
+# トランザクションバッチ1回あたりの最大操作数（Cosmos DBの上限）
+TRANSACTIONAL_BATCH_MAX_OPERATIONS = 100
+# スロットリング/一時エラーとして再試行するステータス
+RETRYABLE_STATUS_CODES = {429, 449}
+
+# 既知のパーティションキー列（未登録のコンテナはコンテナ定義から取得）
+PARTITION_KEY_COLUMNS = {
+    ("CONTRACT", "knowledge_entry"): "knowledge_number",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_key_value(value):
+    """整数値のfloat（pandas経由の 12.0 等）はintにそろえる（パーティションキー値の指定用）"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _key_value_variants(value) -> list:
+    """値の型の違いを吸収するための候補（12 / 12.0 / "12" を同一視する）"""
+    variants = [value]
+    if isinstance(value, str):
+        try:
+            number = float(value.strip())
+        except ValueError:
+            return variants
+        variants.append(_normalize_key_value(number))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        variants.append(str(_normalize_key_value(value)))
+    return list(dict.fromkeys(variants))
+
+
+_container_clients: Dict[tuple, Any] = {}
+_container_clients_lock = threading.Lock()
+_partition_key_paths: Dict[tuple, str] = {}
+# (database, container) -> {id: パーティションキー値}
+_id_partition_keys: Dict[tuple, Dict[str, Any]] = {}
+_id_partition_keys_lock = threading.Lock()
+
+
+@dataclass
+class BulkItemResult:
+    id: str
+    status_code: int
+    request_charge: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 300 or (
+            self.status_code == 404 and self.error is None
+        )
+
+
+@dataclass
+class BulkResult:
+    items: List[BulkItemResult] = field(default_factory=list)
+    request_charge: float = 0.0
+    batches: int = 0
+    retries: int = 0
+    # トランザクションバッチが失敗して個別実行に切り替えたパーティション（partition / error）
+    batch_fallbacks: List[Dict[str, Any]] = field(default_factory=list)
+    elapsed_sec: float = 0.0
+
+    @property
+    def succeeded(self) -> List[str]:
+        return [r.id for r in self.items if r.ok]
+
+    @property
+    def failed(self) -> List[BulkItemResult]:
+        return [r for r in self.items if not r.ok]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "total": len(self.items),
+            "succeeded": len(self.succeeded),
+            "failed": len(self.failed),
+            "request_charge": round(self.request_charge, 2),
+            "batches": self.batches,
+            "retries": self.retries,
+            "batch_fallbacks": len(self.batch_fallbacks),
+            "elapsed_sec": round(self.elapsed_sec, 2),
+        }
+
+
+def _retry_after_sec(e: Exception, default: float) -> float:
+    """`x-ms-retry-after-ms` ヘッダから待機秒数を返す"""
+    headers = getattr(e, "headers", None) or {}
+    try:
+        return float(headers.get("x-ms-retry-after-ms")) / 1000.0
+    except (TypeError, ValueError):
+        return default
+
+
+def _request_charge(headers: Optional[dict]) -> float:
+    try:
+        return float((headers or {}).get("x-ms-request-charge", 0.0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
 class AzureCosmosDB:
     def __init__(self):
         """CosmosDBクライアントの初期化（@st.cache_resource経由のみ）"""
@@ -33,11 +141,325 @@ class AzureCosmosDB:
     # 既存のユーティリティメソッド -------------------
 
     def get_container_client(self, database_name: str, container_name: str):
-        """コンテナクライアントを取得"""
-        database = self.client.get_database_client(database_name)
-        container = database.get_container_client(container_name)
+        """コンテナクライアントを取得（クライアントごとにキャッシュ）"""
+        key = (id(self.client), database_name, container_name)
+        with _container_clients_lock:
+            container = _container_clients.get(key)
+            if container is None:
+                database = self.client.get_database_client(database_name)
+                container = database.get_container_client(container_name)
+                _container_clients[key] = container
         return container
 
+    def get_partition_key_path(self, database_name: str, container_name: str) -> str:
+        """コンテナのパーティションキー列名を返す（例: "/knowledge_number" → "knowledge_number"）"""
+        known = PARTITION_KEY_COLUMNS.get((database_name, container_name))
+        if known:
+            return known
+        key = (id(self.client), database_name, container_name)
+        path = _partition_key_paths.get(key)
+        if path is None:
+            container = self.get_container_client(database_name, container_name)
+            path = container.read()["partitionKey"]["paths"][0].lstrip("/")
+            _partition_key_paths[key] = path
+        return path
+
+    # ポイント読み取り -------------------
+
+    def remember_partition_keys(
+        self, container_name: str, items: List[dict], database_name: str = None
+    ) -> None:
+        """取得/保存したアイテムの id→パーティションキー値 を記録する（登録済みの列のみ）"""
+        pk = PARTITION_KEY_COLUMNS.get((database_name, container_name))
+        if pk is None:
+            pk = _partition_key_paths.get((id(self.client), database_name, container_name))
+        if pk is None:
+            return
+        with _id_partition_keys_lock:
+            known = _id_partition_keys.setdefault((database_name, container_name), {})
+            for item in items:
+                if isinstance(item, dict) and "id" in item and pk in item:
+                    known[str(item["id"])] = item[pk]
+
+    def _lookup_partition_key(
+        self, container_name: str, item_id: str, database_name: str = None
+    ):
+        with _id_partition_keys_lock:
+            known = _id_partition_keys.get((database_name, container_name), {})
+            return known.get(str(item_id))
+
+    def _forget_partition_key(
+        self, container_name: str, item_id: str, database_name: str = None
+    ) -> None:
+        with _id_partition_keys_lock:
+            _id_partition_keys.get((database_name, container_name), {}).pop(
+                str(item_id), None
+            )
+
+    def read_item_by_id(
+        self, container_name: str, item_id: str, database_name: str = None
+    ) -> Optional[dict]:
+        """
+        idを指定して1件取得する
+        パーティションキー値が分かる場合（パーティションキーがid、または記録済み）は read_item によるポイント読み取り、
+        分からない場合のみパラメータ化したクロスパーティションクエリで取得し、パーティションキー値を記録する。
+        """
+        found = self.read_items_by_ids(container_name, [item_id], database_name)
+        return found.get(str(item_id))
+
+    def read_items_by_ids(
+        self, container_name: str, ids: List[str], database_name: str = None
+    ) -> Dict[str, dict]:
+        """
+        複数idをまとめて取得する（{id: item}、存在しないidは含まない）
+        パーティションキー値ごとに、1件なら read_item、複数なら ARRAY_CONTAINS の単一パーティションクエリで取得する。
+        パーティションキー値が不明なidは1回のクロスパーティションクエリでまとめて取得する。
+        """
+        container = self.get_container_client(database_name, container_name)
+        pk = self.get_partition_key_path(database_name, container_name)
+        ids = list(dict.fromkeys(str(i) for i in ids if i is not None))
+        by_partition: Dict[Any, List[str]] = {}
+        unknown: List[str] = []
+        for item_id in ids:
+            if pk == "id":
+                by_partition.setdefault(item_id, []).append(item_id)
+                continue
+            value = self._lookup_partition_key(container_name, item_id, database_name)
+            if value is None:
+                unknown.append(item_id)
+            else:
+                by_partition.setdefault(value, []).append(item_id)
+
+        found: Dict[str, dict] = {}
+        for value, partition_ids in by_partition.items():
+            if len(partition_ids) == 1:
+                try:
+                    item = container.read_item(
+                        item=partition_ids[0], partition_key=value
+                    )
+                    found[str(item["id"])] = item
+                except CosmosResourceNotFoundError:
+                    pass
+            else:
+                for item in container.query_items(
+                    query="SELECT * FROM c WHERE ARRAY_CONTAINS(@ids, c.id)",
+                    parameters=[{"name": "@ids", "value": partition_ids}],
+                    partition_key=value,
+                ):
+                    found[str(item["id"])] = item
+            # 記録したパーティションキー値が古い（キー値が変更された）場合は再検索する
+            for item_id in partition_ids:
+                if item_id not in found and pk != "id":
+                    self._forget_partition_key(container_name, item_id, database_name)
+                    unknown.append(item_id)
+
+        if unknown:
+            items = list(
+                container.query_items(
+                    query="SELECT * FROM c WHERE ARRAY_CONTAINS(@ids, c.id)",
+                    parameters=[{"name": "@ids", "value": unknown}],
+                    enable_cross_partition_query=True,
+                )
+            )
+            self.remember_partition_keys(container_name, items, database_name)
+            for item in items:
+                found[str(item["id"])] = item
+        return found
+
+    def _run_with_retry(
+        self, func: Callable[[], Any], result: BulkResult, max_retries: int
+    ) -> Any:
+        """429/449の場合はretry-afterに従って再試行する"""
+        delay = 0.5
+        for attempt in range(max_retries + 1):
+            try:
+                return func()
+            except CosmosHttpResponseError as e:
+                if e.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                    raise
+                result.retries += 1
+                time.sleep(_retry_after_sec(e, delay))
+                delay = min(delay * 2, 8)
+
+    def _execute_partition(
+        self,
+        container,
+        partition_key,
+        operations: List[tuple],
+        result: BulkResult,
+        lock: threading.Lock,
+        max_retries: int,
+    ) -> List[BulkItemResult]:
+        """
+        同一パーティションの操作をトランザクションバッチで実行する
+        バッチが失敗した場合は1件ずつ実行し直して個別の結果を返す
+        """
+        item_results: List[BulkItemResult] = []
+        for start in range(0, len(operations), TRANSACTIONAL_BATCH_MAX_OPERATIONS):
+            chunk = operations[start : start + TRANSACTIONAL_BATCH_MAX_OPERATIONS]
+            ids = [item_id for item_id, _ in chunk]
+            try:
+                responses = self._run_with_retry(
+                    lambda: container.execute_item_batch(
+                        batch_operations=[op for _, op in chunk],
+                        partition_key=partition_key,
+                    ),
+                    result,
+                    max_retries,
+                )
+                with lock:
+                    result.batches += 1
+                for item_id, response in zip(ids, responses):
+                    charge = float(response.get("requestCharge", 0.0) or 0.0)
+                    item_results.append(
+                        BulkItemResult(item_id, int(response.get("statusCode", 200)), charge)
+                    )
+                    with lock:
+                        result.request_charge += charge
+                continue
+            except CosmosBatchOperationError as e:
+                error = f"index={e.error_index}: {e.message}"
+            except CosmosHttpResponseError as e:
+                error = e.message
+            # 失敗は結果に記録し、各アイテムを個別に実行する
+            logger.warning(
+                "トランザクションバッチが失敗したため個別に実行します (partition=%s): %s",
+                partition_key,
+                error,
+            )
+            with lock:
+                result.batch_fallbacks.append(
+                    {"partition": partition_key, "error": error}
+                )
+            for item_id, (op_type, args) in chunk:
+                headers = {}
+
+                def hook(response_headers, _body, headers=headers):
+                    headers.update(response_headers or {})
+
+                try:
+                    self._run_with_retry(
+                        lambda: getattr(container, f"{op_type}_item")(
+                            *args,
+                            **({"partition_key": partition_key} if op_type == "delete" else {}),
+                            response_hook=hook,
+                        ),
+                        result,
+                        max_retries,
+                    )
+                    status = 204 if op_type == "delete" else 200
+                    item_results.append(
+                        BulkItemResult(item_id, status, _request_charge(headers))
+                    )
+                except CosmosResourceNotFoundError:
+                    # 削除対象が既に無い場合は成功扱い
+                    item_results.append(BulkItemResult(item_id, 404))
+                except CosmosHttpResponseError as e:
+                    item_results.append(
+                        BulkItemResult(item_id, e.status_code or 500, error=e.message)
+                    )
+                with lock:
+                    result.request_charge += _request_charge(headers)
+        return item_results
+
+    def _bulk_execute(
+        self,
+        container_name: str,
+        operations: List[tuple],
+        database_name: str,
+        max_workers: int,
+        max_retries: int,
+    ) -> BulkResult:
+        """(partition_key, id, (op_type, args)) の一覧をパーティションごとに並列実行する"""
+        started = time.perf_counter()
+        container = self.get_container_client(database_name, container_name)
+        by_partition: Dict[Any, List[tuple]] = {}
+        for partition_key, item_id, op in operations:
+            by_partition.setdefault(partition_key, []).append((item_id, op))
+        result = BulkResult()
+        lock = threading.Lock()
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [
+                executor.submit(
+                    self._execute_partition,
+                    container,
+                    partition_key,
+                    ops,
+                    result,
+                    lock,
+                    max_retries,
+                )
+                for partition_key, ops in by_partition.items()
+            ]
+            for future in futures:
+                result.items.extend(future.result())
+        result.elapsed_sec = time.perf_counter() - started
+        return result
+
+    def upsert_many(
+        self,
+        container_name: str,
+        items: List[dict],
+        database_name: str = None,
+        partition_key_column_name: str = None,
+        max_workers: int = 8,
+        max_retries: int = 5,
+    ) -> BulkResult:
+        """
+        複数アイテムを一括upsertする
+        パーティションキーごとにまとめてトランザクションバッチ（最大100件）で実行し、
+        パーティション間はスレッドプールで並列化する。429/449はretry-afterに従い再試行する。
+        Args:
+            partition_key_column_name (str, optional): 未指定時はコンテナ定義から取得
+            max_workers (int): 同時実行するパーティション数の上限
+        Returns:
+            BulkResult: アイテムごとのステータス・RU消費量と集計
+        """
+        pk = partition_key_column_name or self.get_partition_key_path(
+            database_name, container_name
+        )
+        operations = []
+        for item in items:
+            # データにIDが含まれていない場合は追加
+            if "id" not in item:
+                item["id"] = str(uuid.uuid4())
+            operations.append((item.get(pk), item["id"], ("upsert", (item,))))
+        result = self._bulk_execute(
+            container_name, operations, database_name, max_workers, max_retries
+        )
+        succeeded = set(result.succeeded)
+        self.remember_partition_keys(
+            container_name,
+            [item for item in items if item["id"] in succeeded],
+            database_name,
+        )
+        return result
+
+    def delete_many(
+        self,
+        container_name: str,
+        items: List[dict],
+        database_name: str = None,
+        partition_key_column_name: str = None,
+        max_workers: int = 8,
+        max_retries: int = 5,
+    ) -> BulkResult:
+        """
+        複数アイテムを一括削除する（items は id とパーティションキー列を含むdict）
+        既に存在しないアイテムは成功（404）として扱う。
+        Returns:
+            BulkResult: アイテムごとのステータス・RU消費量と集計
+        """
+        pk = partition_key_column_name or self.get_partition_key_path(
+            database_name, container_name
+        )
+        operations = [
+            (item.get(pk), item["id"], ("delete", (item["id"],))) for item in items
+        ]
+        return self._bulk_execute(
+            container_name, operations, database_name, max_workers, max_retries
+        )
+
     def upsert_to_container(
         self, container_name: str, data: dict, database_name: str = None
     ):
@@ -50,6 +472,7 @@ class AzureCosmosDB:
             data["id"] = str(uuid.uuid4())
 
         upsert_item = container.upsert_item(body=data)
+        self.remember_partition_keys(container_name, [upsert_item], database)
         return upsert_item
 
     def delete_data_from_container_by_column(
@@ -60,30 +483,50 @@ class AzureCosmosDB:
         partition_key_column_name: str,
         database_name: str = None,
     ):
-        """列と値を指定してデータを削除する"""
+        """
+        列と値を指定してデータを削除する（削除したアイテムのidリストを返す）
+        パーティションキー列で絞り込む場合は単一パーティションのクエリで検索し、見つからなければ
+        値の型の違い（12 / 12.0 / "12"）を考慮したクロスパーティションのクエリで検索し直す。
+        削除に失敗したアイテムはログに記録し、戻り値に含めない。
+        """
         database = database_name
         container = self.get_container_client(database, container_name)
+        columns = f"c.id, c.{partition_key_column_name}"
 
-        # クエリを使って指定したカラムに一致するアイテムを検索
-        query = f"SELECT * FROM c WHERE c.{column_name} = @value"
-        parameters = [{"name": "@value", "value": column_value}]
+        # クエリを使って指定したカラムに一致するアイテムを検索（削除に必要な列のみ取得）
+        items_to_delete = []
+        if column_name == partition_key_column_name:
+            items_to_delete = list(
+                container.query_items(
+                    query=f"SELECT {columns} FROM c WHERE c.{column_name} = @value",
+                    parameters=[{"name": "@value", "value": column_value}],
+                    partition_key=_normalize_key_value(column_value),
+                )
+            )
+        if not items_to_delete:
+            items_to_delete = list(
+                container.query_items(
+                    query=(
+                        f"SELECT {columns} FROM c "
+                        f"WHERE ARRAY_CONTAINS(@values, c.{column_name})"
+                    ),
+                    parameters=[
+                        {"name": "@values", "value": _key_value_variants(column_value)}
+                    ],
+                    enable_cross_partition_query=True,
+                )
+            )
 
-        # クエリを実行して一致するアイテムを取得
-        items_to_delete = container.query_items(
-            query=query, parameters=parameters, enable_cross_partition_query=True
+        # 一致したアイテムをまとめて削除
+        result = self.delete_many(
+            container_name,
+            items_to_delete,
+            database_name=database,
+            partition_key_column_name=partition_key_column_name,
         )
-
-        # アイテムが見つかったら削除
-        for item in items_to_delete:
-            try:
-                container.delete_item(
-                    item=item, partition_key=item[partition_key_column_name]
-                )
-                print(f"アイテム {item['id']} を削除しました。")
-            except CosmosResourceNotFoundError:
-                print(f"アイテム {item['id']} は既に削除されています。")
-            except Exception as e:
-                print(f"アイテム {item['id']} の削除中にエラーが発生しました: {e}")
+        for r in result.failed:
+            logger.error("アイテム %s の削除中にエラーが発生しました: %s", r.id, r.error)
+        return result.succeeded
 
     def query_data_from_container(
         self,
@@ -133,10 +576,37 @@ class AzureCosmosDB:
         database = database_name
         container = self.get_container_client(database, container_name)
 
-        results = container.query_items(
-            query=query, parameters=parameters, enable_cross_partition_query=True
+        results = list(
+            container.query_items(
+                query=query, parameters=parameters, enable_cross_partition_query=True
+            )
         )
-        return list(results)
+        self.remember_partition_keys(container_name, results, database)
+        return results
+
+    def iter_query_pages(
+        self,
+        container_name: str,
+        query: str,
+        parameters: list,
+        page_size: int = 100,
+        continuation_token: Optional[str] = None,
+        database_name: str = None,
+    ):
+        """
+        カスタムクエリをページ単位で取得する
+        Yields:
+            tuple: (ページ内アイテムのリスト, 次ページの継続トークン（最終ページはNone）)
+        """
+        container = self.get_container_client(database_name, container_name)
+        pager = container.query_items(
+            query=query,
+            parameters=parameters,
+            enable_cross_partition_query=True,
+            max_item_count=page_size,
+        ).by_page(continuation_token)
+        for page in pager:
+            yield list(page), pager.continuation_token
 
     def search_similar_vectors(
         self,
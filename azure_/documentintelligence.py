@@ -1,8 +1,11 @@
 # pip install python-dotenv
 # pip install azure-ai-documentintelligence==1.0.2
 
+import asyncio
 import os
 import json
+import time
+from typing import Optional
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.core.credentials import AzureKeyCredential
 from dotenv import load_dotenv
@@ -33,3 +36,79 @@ def get_document_intelligence_ocr():
             return result
 
     return _DocumentIntelligenceOCR(client)
+
+
+class AsyncDocumentIntelligenceOCR:
+    """
+    aioクライアントによる非同期のprebuilt-layout解析（要 aiohttp）
+    - 同時解析数はセマフォで制限（`DOCUMENT_INTELLIGENCE_MAX_CONCURRENCY`、既定4）
+    - ポーリングはイベントループ上で `asyncio.sleep` により行うため、待機中もスレッドを占有しない
+      （間隔は `DOCUMENT_INTELLIGENCE_POLL_INTERVAL_SEC`、既定1秒）
+    `async with AsyncDocumentIntelligenceOCR() as ocr:` で使用する。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+    ):
+        load_dotenv()
+        self.endpoint = os.getenv("DOCUMENT_INTELLIGENCE_ENDPOINT")
+        self.key = os.getenv("DOCUMENT_INTELLIGENCE_API_KEY")
+        self.max_concurrency = max_concurrency or int(
+            os.getenv("DOCUMENT_INTELLIGENCE_MAX_CONCURRENCY", "4")
+        )
+        self.poll_interval = (
+            poll_interval
+            if poll_interval is not None
+            else float(os.getenv("DOCUMENT_INTELLIGENCE_POLL_INTERVAL_SEC", "1"))
+        )
+        self.client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    def _get_client(self):
+        # キャッシュヒットや.docxのみの場合に接続を作らないよう、初回の解析時に生成する
+        if self.client is None:
+            from azure.ai.documentintelligence.aio import (
+                DocumentIntelligenceClient as AsyncDocumentIntelligenceClient,
+            )
+
+            self.client = AsyncDocumentIntelligenceClient(
+                self.endpoint, AzureKeyCredential(self.key)
+            )
+        return self.client
+
+    async def __aexit__(self, *exc):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    async def _analyze(self, file_path: str):
+        with open(file_path, "rb") as f:
+            body = f.read()
+        poller = await self._get_client().begin_analyze_document(
+            "prebuilt-layout",
+            body=body,
+            output_content_format="markdown",
+            polling_interval=self.poll_interval,
+        )
+        return await poller.result()
+
+    async def analyze_document(self, file_path: str, timings: Optional[dict] = None):
+        """
+        1ファイルを解析して結果を返す（同時実行数の上限まで並行に投入される）
+        timings を渡すと、解析枠の待ち時間 `queued_sec` と解析時間 `analyze_sec` を書き込む
+        """
+        queued = time.perf_counter()
+        async with self._semaphore:
+            submitted = time.perf_counter()
+            try:
+                return await self._analyze(file_path)
+            finally:
+                if timings is not None:
+                    timings["queued_sec"] = round(submitted - queued, 3)
+                    timings["analyze_sec"] = round(time.perf_counter() - submitted, 3)
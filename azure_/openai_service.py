@@ -2,15 +2,35 @@
 # pip install python-dotenv
 
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI, AzureOpenAI
+import asyncio
 import os
 import streamlit as st
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from services.token_counter import EMBEDDING_ENCODING, count_tokens, truncate_tokens
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# 埋め込みAPIの1入力あたりの最大トークン数
+EMBEDDING_MAX_INPUT_TOKENS = 8191
 
 
 @st.cache_resource
 def get_openai_client():
     """OpenAIクライアントをキャッシュして返す"""
+    return AzureOpenAI(**_get_client_params())
+
+
+def get_async_openai_client() -> AsyncAzureOpenAI:
+    """
+    非同期OpenAIクライアントを返す。
+    イベントループに紐づくためキャッシュせず、呼び出し側で `async with` してクローズする。
+    """
+    return AsyncAzureOpenAI(**_get_client_params())
+
+
+def _get_client_params() -> dict:
     load_dotenv()
     api_key = os.getenv("OPENAI_API_KEY")
     api_version = os.getenv("OPENAI_API_VERSION")
@@ -19,11 +39,55 @@ def get_openai_client():
         raise ValueError(
             "OPENAI_API_KEY/OPENAI_API_VERSION/OPENAI_API_BASE が未設定です。"
         )
-    return AzureOpenAI(
-        api_key=api_key,
-        api_version=api_version,
-        azure_endpoint=azure_endpoint,
-    )
+    return {
+        "api_key": api_key,
+        "api_version": api_version,
+        "azure_endpoint": azure_endpoint,
+    }
+
+
+def plan_embedding_batches(
+    texts: List[str],
+    max_batch_size: int = 256,
+    max_batch_tokens: int = 100_000,
+) -> tuple[List[str], List[int], List[List[int]]]:
+    """
+    埋め込み入力を重複排除し、件数・トークン数の上限内のバッチに分割する
+    Returns:
+      unique_texts: 重複排除・切り詰め後のテキスト（初出順）
+      positions   : 入力テキストごとの unique_texts 上のインデックス
+      batches     : unique_texts のインデックスのバッチ
+    """
+    unique_texts: List[str] = []
+    index_by_text: dict[str, int] = {}
+    positions: List[int] = []
+    for text in texts:
+        idx = index_by_text.get(text)
+        if idx is None:
+            idx = len(unique_texts)
+            index_by_text[text] = idx
+            unique_texts.append(
+                truncate_tokens(text, EMBEDDING_MAX_INPUT_TOKENS, EMBEDDING_ENCODING)
+            )
+        positions.append(idx)
+
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for idx, text in enumerate(unique_texts):
+        tokens = count_tokens(text, EMBEDDING_ENCODING)
+        if current and (
+            len(current) >= max_batch_size
+            or current_tokens + tokens > max_batch_tokens
+        ):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(idx)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return unique_texts, positions, batches
 
 
 class AzureOpenAIService:
@@ -37,41 +101,108 @@ class AzureOpenAIService:
 
     def get_emb_3_small(self, doc):
         response = (
-            self.client.embeddings.create(input=doc, model="text-embedding-3-small")
+            self.client.embeddings.create(input=doc, model=EMBEDDING_MODEL)
             .data[0]
             .embedding
         )
         return response
 
-    def get_openai_response_gpt41(self, messages):
+    def get_embeddings_batch(
+        self,
+        texts: List[str],
+        max_batch_size: int = 256,
+        max_batch_tokens: int = 100_000,
+        max_workers: int = 4,
+    ) -> List[List[float]]:
+        """
+        複数テキストを配列入力でまとめて埋め込む（入力順を保持）
+        同一テキストは1回だけ送信し、件数・トークン数の上限でバッチ分割して並列実行する。
+        空文字は埋め込みAPIがエラーとなるため、呼び出し側で除外すること。
+        """
+        if not texts:
+            return []
+        unique_texts, positions, batches = plan_embedding_batches(
+            texts, max_batch_size, max_batch_tokens
+        )
+
+        def embed(batch: List[int]) -> List[List[float]]:
+            response = self.client.embeddings.create(
+                input=[unique_texts[i] for i in batch], model=EMBEDDING_MODEL
+            )
+            return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+        vectors: List[Optional[List[float]]] = [None] * len(unique_texts)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as ex:
+            for batch, result in zip(batches, ex.map(embed, batches)):
+                for i, vector in zip(batch, result):
+                    vectors[i] = vector
+        return [vectors[p] for p in positions]
+
+    async def aget_embeddings_batch(
+        self,
+        texts: List[str],
+        max_batch_size: int = 256,
+        max_batch_tokens: int = 100_000,
+        max_concurrency: int = 4,
+    ) -> List[List[float]]:
+        """`get_embeddings_batch` の非同期版"""
+        if not texts:
+            return []
+        unique_texts, positions, batches = plan_embedding_batches(
+            texts, max_batch_size, max_batch_tokens
+        )
+        sem = asyncio.Semaphore(max(1, max_concurrency))
+        vectors: List[Optional[List[float]]] = [None] * len(unique_texts)
+
+        async with get_async_openai_client() as client:
+
+            async def embed(batch: List[int]) -> None:
+                async with sem:
+                    response = await client.embeddings.create(
+                        input=[unique_texts[i] for i in batch], model=EMBEDDING_MODEL
+                    )
+                for i, d in zip(batch, sorted(response.data, key=lambda d: d.index)):
+                    vectors[i] = d.embedding
+
+            await asyncio.gather(*[embed(batch) for batch in batches])
+        return [vectors[p] for p in positions]
+
+    def get_openai_response_gpt41(self, messages, format: Optional[Any] = None):
+        # format: response_format（例: services.structured_output.build_response_format の戻り値）
+        params = {} if format is None else {"response_format": format}
         response = self.client.chat.completions.create(
             messages=messages,
             temperature=0.0,
             frequency_penalty=0.0,
             presence_penalty=0.0,
             model="gpt-4.1",
+            **params,
         )
         answer = response.choices[0].message.content
         return answer
 
-    def get_openai_response_gpt41mini(self, messages):
+    def get_openai_response_gpt41mini(self, messages, format: Optional[Any] = None):
+        params = {} if format is None else {"response_format": format}
         response = self.client.chat.completions.create(
             messages=messages,
             temperature=0.0,
             frequency_penalty=0.0,
             presence_penalty=0.0,
             model="gpt-4.1-mini",
+            **params,
         )
         answer = response.choices[0].message.content
         return answer
 
-    def get_openai_response_gpt41nano(self, messages):
+    def get_openai_response_gpt41nano(self, messages, format: Optional[Any] = None):
+        params = {} if format is None else {"response_format": format}
         response = self.client.chat.completions.create(
             messages=messages,
             temperature=0.0,
             frequency_penalty=0.0,
             presence_penalty=0.0,
             model="gpt-4.1-nano",
+            **params,
         )
         answer = response.choices[0].message.content
         return answer
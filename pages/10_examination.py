@@ -6,17 +6,23 @@ import json
 import logging
 from api.contract_api import ContractAPI
 from api.knowledge_api import KnowledgeAPI
-from api.examination_api import examination_api
+from api.examination_api import run_examination_job
+from api.examination_session import ExaminationSession
 from api import async_llm_service
 from services.document_input import extract_text_from_document
+from services import job_runner
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 import tempfile
 import os
+import uuid
 from datetime import datetime
 
 st.set_page_config(layout="wide")
 
+# 審査ジョブの進捗をポーリングする間隔（秒）
+EXAM_JOB_POLL_SEC = float(os.getenv("EXAM_JOB_POLL_SEC", "1"))
+
 
 def export_knowledge_to_csv(knowledge_data):
     """
@@ -79,6 +85,13 @@ def reset_review_status():
     st.session_state["clause_review_status"] = {}
     if "analyzed_clauses" in st.session_state:
         del st.session_state["analyzed_clauses"]
+    if "exam_clause_fingerprints" in st.session_state:
+        del st.session_state["exam_clause_fingerprints"]
+    st.session_state.pop("exam_last_run", None)
+    # 別の契約書の審査ジョブが実行中ならキャンセルする
+    job = st.session_state.pop("exam_job", None)
+    if job:
+        job_runner.get_job_runner().cancel(job["id"])
 
 
 def initialize_clause_status(clauses):
@@ -219,6 +232,183 @@ def build_mapping_debug_info(knowledge_all, clauses, mapping_response, trace):
     }
 
 
+def get_exam_session() -> ExaminationSession:
+    """
+    審査結果・ナレッジの索引を返す（結果リスト・ナレッジリストが差し替わった時のみ再構築）
+    審査実行時に作った索引（条項⇔ナレッジの対応を含む）はそのまま再利用する
+    """
+    analyzed = st.session_state.get("analyzed_clauses") or []
+    knowledge = st.session_state.get(
+        "exam_filtered_knowledge", st.session_state.get("knowledge_all", [])
+    )
+    session = st.session_state.get("exam_session")
+    if session is None or not session.is_built_from(analyzed, knowledge):
+        session = ExaminationSession([], knowledge, analyzed_clauses=analyzed)
+        st.session_state["exam_session"] = session
+    return session
+
+
+def submit_examination_job(knowledge, clauses, run_id=None, **kwargs) -> str:
+    """
+    マッピング→審査をジョブランナーに投入し、ジョブIDをセッションに保存する
+    （スクリプトの実行はブロックせず、進捗は render_examination_job_progress でポーリングする）
+    run_id を指定すると同じ実行台帳で再実行する（成功済みの単位は再利用され、失敗分のみ再実行）
+    """
+    run_id = run_id or uuid.uuid4().hex
+    # 「失敗分を再実行」用に同じ入力を保持する
+    st.session_state["exam_last_run"] = {
+        "run_id": run_id,
+        "knowledge": knowledge,
+        "clauses": clauses,
+        "kwargs": kwargs,
+        "failed_units": [],
+    }
+    runner = job_runner.get_job_runner()
+    job_id = runner.submit(
+        "examination",
+        lambda progress: run_examination_job(
+            progress, knowledge_all=knowledge, clauses=clauses, run_id=run_id, **kwargs
+        ),
+        meta={
+            "title": kwargs.get("title", ""),
+            "llm_model": kwargs.get("llm_model"),
+            "clause_count": len(clauses),
+            "run_id": run_id,
+        },
+    )
+    st.session_state["exam_job"] = {
+        "id": job_id,
+        "knowledge": knowledge,
+        "clauses": clauses,
+        "llm_model": kwargs.get("llm_model"),
+    }
+    st.session_state["exam_job_seen"] = 0
+    return job_id
+
+
+def apply_examination_job_result(job: dict, context: dict):
+    """完了したジョブの結果をセッションに反映する（失敗・キャンセル時はメッセージを表示）"""
+    status = job["status"]
+    progress = job.get("progress", {})
+    last_run = st.session_state.get("exam_last_run")
+    if last_run is not None:
+        if status == job_runner.SUCCEEDED:
+            last_run["failed_units"] = job["result"].get("failed_units", [])
+        elif status == job_runner.FAILED:
+            # 台帳全体ではなく、この実行で失敗した単位（ジョブが進捗に残したもの）を使う
+            last_run["failed_units"] = progress.get("failed_units", [])
+    with st.sidebar:
+        if status == job_runner.CANCELLED:
+            st.warning("審査をキャンセルしました。")
+        elif status == job_runner.INTERRUPTED:
+            st.warning("審査が中断されました。再度実行してください。")
+        elif status == job_runner.FAILED:
+            if progress.get("stage") == "mapping":
+                st.error(f"ナレッジマッピングでエラーが発生しました: {job.get('error')}")
+            else:
+                st.error(f"審査処理でエラーが発生しました: {job.get('error')}")
+    if status != job_runner.SUCCEEDED:
+        return
+
+    result = job["result"]
+    knowledge = context["knowledge"]
+    st.session_state["exam_mapping_debug_info"] = build_mapping_debug_info(
+        knowledge,
+        context["clauses"],
+        result["mapping_response"],
+        result["mapping_trace"],
+    )
+    if result["status"] == "no_mapping":
+        with st.sidebar:
+            st.warning(
+                "ナレッジと条項の対応付けができませんでした。対象条項条件や入力条文を確認してください。"
+            )
+        return
+
+    st.session_state["exam_examination_trace"] = result["trace"]
+    analyzed_clauses = result["analyzed_clauses"]
+    if not analyzed_clauses:
+        with st.sidebar:
+            st.info("審査結果がありません。")
+        return
+    # 審査の索引（描画・CSV出力で共有）
+    run_session = ExaminationSession(result["clauses_augmented"], knowledge)
+    st.session_state["analyzed_clauses"] = analyzed_clauses
+    run_session.bind_results(analyzed_clauses)
+    st.session_state["exam_session"] = run_session
+    st.session_state["exam_clause_fingerprints"] = {
+        "llm_model": context["llm_model"],
+        "fingerprints": result["fingerprints"],
+    }
+    update_review_status_from_analysis(analyzed_clauses)
+    st.session_state["exam_page_status"] = "examination"
+    st.session_state["no_target_knowledges"] = [
+        run_session.get_knowledge(kid) for kid in result["no_target_knowledge_ids"]
+    ]
+
+
+def sync_examination_job():
+    """
+    投入済みの審査ジョブの状態を取得し、完了していれば結果を反映する
+    Returns:
+        dict or None: 実行中/待機中のジョブ（部分結果を含む）。ジョブが無い・完了済みならNone
+    """
+    context = st.session_state.get("exam_job")
+    if not context:
+        return None
+    runner = job_runner.get_job_runner()
+    job = runner.get(context["id"])
+    if job is None:
+        st.session_state.pop("exam_job", None)
+        return None
+    if job["status"] in job_runner.FINISHED_STATUSES:
+        st.session_state.pop("exam_job", None)
+        runner.forget(context["id"])
+        apply_examination_job_result(job, context)
+        return None
+    # 確定済みの条項の審査状態を反映（結果欄は部分結果から描画する）
+    update_review_status_from_analysis(job["partial"])
+    st.session_state["exam_job_seen"] = len(job["partial"])
+    return job
+
+
+@st.fragment(run_every=EXAM_JOB_POLL_SEC)
+def render_examination_job_progress():
+    """
+    実行中の審査ジョブの進捗バーとキャンセルボタン（この部分のみ定期的に再実行する）
+    新しい条項の結果が確定した・ジョブが完了した時点でページ全体を再実行して反映する
+    """
+    context = st.session_state.get("exam_job")
+    if not context:
+        return
+    runner = job_runner.get_job_runner()
+    job = runner.get(context["id"])
+    if (
+        job is None
+        or job["status"] in job_runner.FINISHED_STATUSES
+        or len(job["partial"]) != st.session_state.get("exam_job_seen", 0)
+    ):
+        st.rerun()
+    progress = job.get("progress", {})
+    total = progress.get("total") or 0
+    done = progress.get("done") or 0
+    if job["status"] == job_runner.QUEUED:
+        text = "審査待ち（他の審査の完了を待っています）..."
+    elif progress.get("stage") == "mapping":
+        text = "ナレッジマッピング中..."
+    else:
+        text = f"審査中... {done}/{total} 条項"
+        if progress.get("last_clause_number"):
+            text += f"（{progress['last_clause_number']} 完了）"
+    col_progress, col_cancel = st.columns([9, 1])
+    with col_progress:
+        st.progress(min(done / total, 1.0) if total else 0.0, text=text)
+    with col_cancel:
+        if st.button("キャンセル", key="exam_job_cancel"):
+            runner.cancel(context["id"])
+            st.rerun()
+
+
 async def run_examination_chat(prompt: str, llm_model: str) -> str:
     """サイドバーでの審査チャット呼び出し"""
     context = build_chat_context()
@@ -244,6 +434,7 @@ async def run_examination_chat(prompt: str, llm_model: str) -> str:
             "question": prompt,
             "context_json": json.dumps(context, ensure_ascii=False),
         },
+        model=llm_model,
     )
 
 
@@ -283,7 +474,7 @@ def main():
     if "knowledge_all" not in st.session_state:
         try:
             kn_api = st.session_state["knowledge_api"]
-            st.session_state["knowledge_all"] = kn_api.get_knowledge_list()
+            st.session_state["knowledge_all"] = kn_api.get_knowledge_all()
         except Exception:
             st.session_state["knowledge_all"] = []
 
@@ -387,6 +578,9 @@ def main():
             st.error("ナレッジが取得できませんでした。再読み込み後も改善しない場合は接続設定を確認してください。")
             return
 
+        # 投入済みの審査ジョブの反映（実行中なら部分結果を表示する）
+        running_job = sync_examination_job()
+
         col_partys, col_contract_type = st.columns([2, 1])
         # --- contract type ---------------------------------------------------------
         with col_contract_type:
@@ -430,13 +624,18 @@ def main():
 
         # --- introductionを条項リストの1つ目として表示 ---
         st.subheader("条文")
+        # 審査中の進捗表示欄
+        if running_job is not None:
+            render_examination_job_progress()
+            exam_session = ExaminationSession(
+                [],
+                st.session_state["exam_job"]["knowledge"],
+                analyzed_clauses=running_job["partial"],
+            )
+        else:
+            exam_session = get_exam_session()
         # introduction部分
-        intro_analyzed = None
-        if st.session_state.get("analyzed_clauses"):
-            for analyzed in st.session_state["analyzed_clauses"]:
-                if analyzed.get("clause_number") == "前文":
-                    intro_analyzed = analyzed
-                    break
+        intro_analyzed = exam_session.get_result("前文")
 
         # expanderの展開状態を決定
         intro_has_amendment = intro_analyzed and bool(
@@ -472,17 +671,12 @@ def main():
                 )
                 # 審査結果（懸念事項）の表示（introduction用）
                 if intro_analyzed:
-                    call_analyze_function(intro_analyzed)
+                    call_analyze_function(intro_analyzed, exam_session)
 
         # 通常の条項リスト
         for idx, clause in enumerate(st.session_state["exam_clauses"]):
             # 対応する審査結果を検索
-            clause_analyzed = None
-            if st.session_state.get("analyzed_clauses"):
-                for analyzed in st.session_state["analyzed_clauses"]:
-                    if analyzed.get("clause_number") == clause.get("clause_number"):
-                        clause_analyzed = analyzed
-                        break
+            clause_analyzed = exam_session.get_result(clause.get("clause_number"))
 
             # expanderの展開状態を決定
             clause_has_amendment = clause_analyzed and bool(
@@ -519,7 +713,7 @@ def main():
 
                     # 審査結果（懸念事項）の表示
                     if clause_analyzed:
-                        call_analyze_function(clause_analyzed)
+                        call_analyze_function(clause_analyzed, exam_session)
 
         def collect_exam_clauses():
             clauses = []
@@ -558,100 +752,95 @@ def main():
                 key="sidebar_llm_model",
             )
             debug_mode = st.checkbox("デバッグ表示", key="exam_debug")
+            incremental_mode = st.checkbox(
+                "差分審査（変更された条項のみ再審査）",
+                value=True,
+                key="exam_incremental",
+            )
+            prefilter_top_k = st.number_input(
+                "マッピング候補の事前絞り込み件数（0=全件送信）",
+                min_value=0,
+                max_value=200,
+                value=0,
+                step=5,
+                key="exam_prefilter_top_k",
+                help="条項ごとに埋め込み類似度の上位k件のナレッジのみをマッピングLLMに送信します。",
+            )
+            pack_token_budget = st.number_input(
+                "審査のまとめ上限トークン数（0=ナレッジごとに個別審査）",
+                min_value=0,
+                max_value=100000,
+                value=async_llm_service.get_review_pack_token_budget(),
+                step=1000,
+                key="exam_pack_token_budget",
+                help="対象条項が同じナレッジを、このトークン数まで1回のLLM呼び出しにまとめて審査します。",
+            )
 
-            # 審査開始ボタン（条件付き表示）
-            if st.button("審査開始", type="primary"):
-                with st.spinner("審査中...", show_time=True):
-                    contract_type = st.session_state["exam_contract_type"]
-                    background_info = st.session_state["exam_background"]
-                    partys = [
+            # 前回の審査で失敗した単位（マッピングチャンク・ナレッジ審査・条項要約）のみ再実行
+            last_run = st.session_state.get("exam_last_run")
+            if last_run and last_run["failed_units"]:
+                st.warning(
+                    f"前回の審査で {len(last_run['failed_units'])} 件の処理が失敗しました。"
+                )
+                if st.button(
+                    "失敗分を再実行",
+                    disabled=running_job is not None,
+                    help="成功済みの結果は再利用し、失敗した処理のみLLMを呼び直して結果に反映します。",
+                ):
+                    submit_examination_job(
+                        last_run["knowledge"],
+                        last_run["clauses"],
+                        run_id=last_run["run_id"],
+                        **last_run["kwargs"],
+                    )
+                    st.rerun()
+                if debug_mode:
+                    with st.expander("失敗した処理", expanded=False):
+                        st.json(last_run["failed_units"])
+
+            # 審査開始ボタン（条件付き表示、審査ジョブの実行中は無効）
+            if st.button(
+                "審査開始", type="primary", disabled=running_job is not None
+            ):
+                # 差分審査: 同一モデルの前回結果があれば変更条項のみ再審査
+                previous = st.session_state.get("exam_clause_fingerprints")
+                previous_analyzed_clauses = None
+                previous_fingerprints = None
+                if (
+                    incremental_mode
+                    and previous
+                    and previous.get("llm_model") == llm_model
+                    and st.session_state.get("analyzed_clauses")
+                ):
+                    previous_analyzed_clauses = st.session_state["analyzed_clauses"]
+                    previous_fingerprints = previous.get("fingerprints", {})
+                submit_examination_job(
+                    st.session_state.get("exam_filtered_knowledge", []),
+                    collect_exam_clauses(),
+                    contract_type=st.session_state["exam_contract_type"],
+                    background_info=st.session_state["exam_background"],
+                    partys=[
                         p.strip()
                         for p in st.session_state["exam_partys"].split(",")
                         if p.strip()
-                    ]
-                    title = st.session_state["exam_title"]
-                    clauses = collect_exam_clauses()
-                    # knowledgeとclauseのマッピング結果を取得
-                    try:
-                        (
-                            mapping_response,
-                            clauses_augmented,
-                            mapping_trace,
-                        ) = asyncio.run(
-                            async_llm_service.amatching_clause_and_knowledge(
-                                st.session_state.get("exam_filtered_knowledge", []),
-                                clauses,
-                            )
-                        )
-                    except Exception as e:
-                        st.error(f"ナレッジマッピングでエラーが発生しました: {e}")
-                        return
-
-                    # マッピング結果が全て空なら警告して終了
-                    mapped_total = sum(
-                        len(m.get("clause_number", [])) for m in mapping_response or []
-                    )
-                    st.session_state["exam_mapping_debug_info"] = (
-                        build_mapping_debug_info(
-                            st.session_state.get("exam_filtered_knowledge", []),
-                            clauses,
-                            mapping_response,
-                            mapping_trace,
-                        )
-                    )
-                    if mapped_total == 0:
-                        st.warning(
-                            "ナレッジと条項の対応付けができませんでした。対象条項条件や入力条文を確認してください。"
-                        )
-                        if debug_mode:
-                            debug_info = st.session_state["exam_mapping_debug_info"]
-                            if debug_info:
-                                with st.expander("デバッグ情報", expanded=True):
-                                    st.json(debug_info)
-                        return
-
-                    # 関連条項が無いナレッジを抽出
-                    no_target_knowledges = []
-                    for m in mapping_response:
-                        if not m.get("clause_number"):
-                            kid = m["knowledge_id"]
-                            kn = next(
-                                (
-                                    k
-                                    for k in st.session_state.get(
-                                        "exam_filtered_knowledge", []
-                                    )
-                                    if str(k.get("id")) == str(kid)
-                                ),
-                                None,
-                            )
-                            if kn:
-                                no_target_knowledges.append(kn)
-                    try:
-                        analyzed_clauses = examination_api(
-                            contract_type=contract_type,
-                            background_info=background_info,
-                            partys=partys,
-                            title=title,
-                            clauses=clauses_augmented,
-                            knowledge_all=st.session_state.get(
-                                "exam_filtered_knowledge", []
-                            ),
-                            llm_model=llm_model,
-                        )
-                        if not analyzed_clauses:
-                            st.info("審査結果がありません。")
-                        else:
-                            st.session_state["analyzed_clauses"] = analyzed_clauses
-                            # 審査結果から状態を更新
-                            update_review_status_from_analysis(analyzed_clauses)
-                            st.session_state["exam_page_status"] = "examination"
-                            st.session_state["no_target_knowledges"] = (
-                                no_target_knowledges
-                            )
-                            st.rerun()
-                    except Exception as e:
-                        st.error(f"審査処理でエラーが発生しました: {e}")
+                    ],
+                    title=st.session_state["exam_title"],
+                    llm_model=llm_model,
+                    prefilter_top_k=int(prefilter_top_k) or None,
+                    previous_analyzed_clauses=previous_analyzed_clauses,
+                    previous_fingerprints=previous_fingerprints,
+                    pack_token_budget=int(pack_token_budget),
+                    get_knowledge_vector_index=st.session_state[
+                        "knowledge_api"
+                    ].get_knowledge_vector_index,
+                )
+                st.rerun()
+            if debug_mode and st.session_state.get("exam_mapping_debug_info"):
+                with st.expander("マッピングのデバッグ情報", expanded=False):
+                    st.json(st.session_state["exam_mapping_debug_info"])
+            if debug_mode and st.session_state.get("exam_examination_trace"):
+                with st.expander("審査の所要時間", expanded=False):
+                    st.json(st.session_state["exam_examination_trace"])
             st.markdown("---")
             st.subheader("審査チャット")
 
@@ -737,6 +926,7 @@ def main():
                 clause_review_status=st.session_state.get("clause_review_status", {}),
                 examination_datetime=now,
                 llm_model=st.session_state.get("sidebar_llm_model", "gpt-4.1"),
+                session=get_exam_session(),
             )
 
             st.download_button(
@@ -758,7 +948,7 @@ def main():
             )
 
 
-def call_analyze_function(analyzed):
+def call_analyze_function(analyzed, session: ExaminationSession):
     if analyzed.get("amendment_clause"):
         st.markdown("---")
         col1, col2 = st.columns([1, 9])
@@ -796,14 +986,8 @@ def call_analyze_function(analyzed):
         else:
             if not isinstance(knowledge_ids, list):
                 knowledge_ids = [knowledge_ids]
-            knowledge_all = st.session_state.get(
-                "exam_filtered_knowledge", st.session_state.get("knowledge_all", [])
-            )
             for kid in knowledge_ids:
-                kn = next(
-                    (k for k in knowledge_all if str(k.get("id")) == str(kid)),
-                    None,
-                )
+                kn = session.get_knowledge(kid)
                 if kn:
                     knowledge_number = kn.get("knowledge_number", "")
                     with st.container():
@@ -5,7 +5,7 @@ from pathlib import Path
 from typing import Any, Dict, List
 
 import streamlit as st
-from api.knowledge_api import KnowledgeAPI
+from api.knowledge_api import KNOWLEDGE_LIST_FIELDS, KnowledgeAPI
 from collections import deque
 from jsonschema import Draft202012Validator, ValidationError
 from services.admin_auth import check_admin_auth, show_admin_sidebar
@@ -29,29 +29,32 @@ def load_schema():
         ENTRY_VALIDATOR = None
 
 
-def apply_filters(all_items, ctype: str, q: str):
-    """契約種別とテキストで絞り込み"""
-    q = (q or "").strip().lower()
+def load_index(api):
+    """絞り込み条件に合うナレッジの軽量インデックス（id/番号/タイトル）をサーバ側で取得し直す"""
+    ctype = st.session_state.get("contract_filter", "すべて")
+    st.session_state["knowledge_index"] = api.get_knowledge_index(
+        contract_type=None if ctype == "すべて" else ctype,
+        search_text=st.session_state.get("q", ""),
+    )
+    st.session_state.pop("knowledge_page_items", None)
 
-    def hit(k):
-        if ctype and ctype != "すべて" and k.get("contract_type") != ctype:
-            return False
-        if not q:
-            return True
-        blob = " ".join(
-            str(k.get(f, ""))
-            for f in [
-                "knowledge_number",
-                "knowledge_title",
-                "review_points",
-                "action_plan",
-                "clause_sample",
-                "target_clause",
-            ]
-        ).lower()
-        return q in blob
 
-    return [k for k in all_items if hit(k)]
+def on_filter_change():
+    """絞り込み条件の変更時: インデックスを取り直して1ページ目に戻す"""
+    load_index(st.session_state["knowledge_api"])
+    st.session_state["page"] = 1
+
+
+def load_page_items(api, rows):
+    """表示中のページのナレッジ本文のみを一覧項目に絞って取得する（同じページの再描画では再取得しない）"""
+    ids = tuple(str(k["id"]) for k in rows)
+    cached = st.session_state.get("knowledge_page_items")
+    if cached and cached["ids"] == ids:
+        return cached["items"]
+    found = api.get_knowledge_by_ids(list(ids), fields=KNOWLEDGE_LIST_FIELDS) if ids else {}
+    items = [found[i] for i in ids if i in found]
+    st.session_state["knowledge_page_items"] = {"ids": ids, "items": items}
+    return items
 
 
 def validate_upload(text: str) -> Dict[str, Any]:
@@ -111,16 +114,9 @@ def show_delete_dialog():
         if st.button("OK", key="delete_ok_dialog"):
             try:
                 api.delete_knowledge(st.session_state["selected"])
-                st.session_state["knowledge_all"] = api.get_knowledge_list()
-                st.session_state["knowledge_filtered"] = apply_filters(
-                    st.session_state["knowledge_all"],
-                    st.session_state.get("contract_filter", "すべて"),
-                    st.session_state.get("q", ""),
-                )
-                if st.session_state["knowledge_all"]:
-                    st.session_state["selected"] = st.session_state["knowledge_all"][0]
-                else:
-                    st.session_state["selected"] = {}
+                load_index(api)
+                # 次の描画で表示ページの先頭を選択する
+                st.session_state.pop("selected", None)
                 st.session_state["knowledge_page_status"] = "delete"
                 st.rerun()
             except Exception as e:
@@ -139,17 +135,11 @@ def main():
     api = st.session_state["knowledge_api"]
 
     # ---------------- 初期ロードと状態 ----------------
-    if "knowledge_all" not in st.session_state:
+    if "knowledge_index" not in st.session_state:
         try:
-            st.session_state["knowledge_all"] = api.get_knowledge_list()
+            load_index(api)
         except Exception:
-            st.session_state["knowledge_all"] = []
-
-    if "knowledge_filtered" not in st.session_state:
-        st.session_state["knowledge_filtered"] = st.session_state["knowledge_all"]
-
-    if "selected" not in st.session_state and st.session_state["knowledge_all"]:
-        st.session_state["selected"] = st.session_state["knowledge_all"][0]
+            st.session_state["knowledge_index"] = []
 
     if "knowledge_page_status" not in st.session_state:
         st.session_state["knowledge_page_status"] = "default"
@@ -158,6 +148,21 @@ def main():
     st.session_state.setdefault("page_size", PAGE_SIZE_DEFAULT)
     st.session_state.setdefault("page", 1)
 
+    # ---- ページネーション（インデックスで位置を決め、表示ページの本文のみ取得）----
+    rows, page, max_page, start, end, total = paginate(
+        st.session_state["knowledge_index"],
+        st.session_state["page"],
+        st.session_state["page_size"],
+    )
+    st.session_state["page"] = page
+    try:
+        subset = load_page_items(api, rows)
+    except Exception:
+        subset = []
+
+    if "selected" not in st.session_state and subset:
+        st.session_state["selected"] = subset[0]
+
     left_col, right_col = st.columns([1, 2])
 
     with left_col:
@@ -176,13 +181,23 @@ def main():
         if not type_names:
             type_names = ["汎用", "秘密保持", "業務委託", "共同開発", "共同出願"]
 
-        # ---- ページネーション ----
-        subset, page, max_page, start, end, total = paginate(
-            st.session_state["knowledge_filtered"],
-            st.session_state["page"],
-            st.session_state["page_size"],
-        )
-        st.session_state["page"] = page
+        # ---- 絞り込み（キーワードはローカルの全文索引で関連度順に検索）----
+        filter_cols = st.columns([1, 2])
+        with filter_cols[0]:
+            st.selectbox(
+                "契約種別で絞り込み",
+                ["すべて"] + type_names,
+                key="contract_filter",
+                on_change=on_filter_change,
+            )
+        with filter_cols[1]:
+            st.text_input(
+                "キーワード",
+                key="q",
+                placeholder="空白区切りでAND、| でOR",
+                on_change=on_filter_change,
+            )
+
         is_admin = check_admin_auth()
 
         with st.expander("JSONアップロード（knowledge_llm_entryスキーマ検証）", expanded=False):
@@ -216,14 +231,8 @@ def main():
                                 saved_count += 1
                             st.session_state["knowledge_last_upload_token"] = token
                             st.success(f"JSONから {saved_count} 件を登録しました。")
-                            st.session_state["knowledge_all"] = api.get_knowledge_list()
-                            st.session_state["knowledge_filtered"] = apply_filters(
-                                st.session_state["knowledge_all"],
-                                st.session_state.get("contract_filter", "すべて"),
-                                st.session_state.get("q", ""),
-                            )
-                            if st.session_state["knowledge_all"]:
-                                st.session_state["selected"] = st.session_state["knowledge_all"][0]
+                            load_index(api)
+                            st.session_state.pop("selected", None)
                             st.rerun()
                         except Exception as e:
                             st.error(f"登録に失敗しました: {e}")
@@ -351,7 +360,7 @@ def main():
                     )
 
             if save_btn:
-                # 保存 → 成功時に全件リロードして現在の選択を維持
+                # 保存 → 成功時にインデックスを取り直して現在の選択を維持
                 data = dict(selected)
                 data.update(
                     {
@@ -367,13 +376,7 @@ def main():
                 try:
                     saved = api.save_knowledge(data)
                     st.session_state["selected"] = saved
-                    st.session_state["knowledge_all"] = api.get_knowledge_list()
-                    # フィルタリングされたリストを更新
-                    st.session_state["knowledge_filtered"] = apply_filters(
-                        st.session_state["knowledge_all"],
-                        st.session_state.get("contract_filter", "すべて"),
-                        st.session_state.get("q", ""),
-                    )
+                    load_index(api)
                     st.session_state["knowledge_page_status"] = "save"
                     st.rerun()
                 except Exception as e:
@@ -92,7 +92,7 @@ def main():
     # データロード
     if "knowledge_all" not in st.session_state:
         try:
-            st.session_state["knowledge_all"] = api.get_knowledge_list()
+            st.session_state["knowledge_all"] = api.get_knowledge_all()
         except Exception as e:
             st.error(f"データの取得に失敗しました: {e}")
             st.session_state["knowledge_all"] = []
@@ -168,39 +168,42 @@ def main():
                 # DataFrameをナレッジデータに変換
                 updated_knowledge_list = convert_df_to_knowledge(edited_df)
 
-                # 各ナレッジを更新
-                success_count = 0
-                error_count = 0
-
+                # 変更のあったナレッジのみ一括保存
                 progress_bar = st.progress(0)
                 status_text = st.empty()
 
-                for i, knowledge in enumerate(updated_knowledge_list):
-                    try:
-                        api.save_knowledge(knowledge)
-                        success_count += 1
-                    except Exception as e:
-                        st.warning(
-                            f"ナレッジNo.{knowledge.get('knowledge_number')}の更新に失敗: {e}"
-                        )
-                        error_count += 1
-
-                    # プログレス更新
-                    progress = (i + 1) / len(updated_knowledge_list)
-                    progress_bar.progress(progress)
-                    status_text.text(f"更新中... {i + 1}/{len(updated_knowledge_list)}")
+                def on_progress(done, total):
+                    progress_bar.progress(done / total if total else 1.0)
+                    status_text.text(f"更新中... {done}/{total}")
+
+                # 編集画面に読み込んだ時点の値と比較し、この編集で変更した項目のみを保存する
+                result = api.save_knowledge_bulk(
+                    updated_knowledge_list,
+                    progress_callback=on_progress,
+                    baseline=convert_df_to_knowledge(df),
+                )
 
                 # 完了メッセージ
                 progress_bar.empty()
                 status_text.empty()
 
-                if error_count == 0:
-                    st.success(f"全{success_count}件のナレッジを正常に更新しました。")
+                for f in result["failed"]:
+                    st.warning(
+                        f"ナレッジNo.{f.get('knowledge_number')}の更新に失敗: {f.get('error')}"
+                    )
+                if result["changed"] == 0:
+                    st.info("変更されたナレッジはありません。")
+                elif not result["failed"]:
+                    st.success(
+                        f"変更のあった{result['succeeded']}件のナレッジを正常に更新しました。"
+                    )
                 else:
-                    st.warning(f"更新完了: 成功{success_count}件、失敗{error_count}件")
+                    st.warning(
+                        f"更新完了: 成功{result['succeeded']}件、失敗{len(result['failed'])}件"
+                    )
 
                 # データを再読み込み
-                st.session_state["knowledge_all"] = api.get_knowledge_list()
+                st.session_state["knowledge_all"] = api.get_knowledge_all()
                 st.rerun()
 
             except Exception as e:
@@ -1,3 +1,4 @@
+import asyncio
 import json, os
 import tempfile
 from pathlib import Path
@@ -8,7 +9,7 @@ from jsonschema import Draft202012Validator, ValidationError
 
 from api.knowledge_api import KnowledgeAPI
 from azure_.openai_service import AzureOpenAIService
-from services.document_input import extract_text_from_document
+from services.document_input import aextract_documents
 
 st.set_page_config(page_title="ナレッジ創出（LLM）", layout="wide")
 
@@ -123,30 +124,64 @@ def render_text_with_breaks(content: str) -> str:
 
 
 def extract_texts(files) -> List[str]:
-    texts: List[str] = []
-    for f in files:
+    """
+    添付ファイルをテキスト化する（添付順で返す）
+    PDF/Wordは aextract_documents で一括投入し、OCR・条文分割を並行に実行する
+    """
+    texts: List[str] = [""] * len(files)
+    doc_jobs: Dict[int, str] = {}
+    for i, f in enumerate(files):
         try:
             ext = Path(f.name).suffix.lower()
             if ext in (".pdf", ".docx"):
                 tmp = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
                 tmp.write(f.getvalue())
                 tmp.flush()
-                tmp_path = tmp.name
+                doc_jobs[i] = tmp.name
                 tmp.close()
-                try:
-                    doc = extract_text_from_document(tmp_path)
-                    texts.append(flatten_document_result(doc))
-                finally:
-                    try:
-                        Path(tmp_path).unlink(missing_ok=True)
-                    except Exception as cleanup_err:
-                        append_debug_log({"file_cleanup_error": str(cleanup_err)})
             else:
-                texts.append(f.getvalue().decode("utf-8", errors="ignore"))
+                texts[i] = f.getvalue().decode("utf-8", errors="ignore")
         except Exception as e:
             err_msg = f"file:{getattr(f,'name','unknown')} error:{e}"
             append_debug_log({"file_error": err_msg})
-            texts.append(err_msg if DEBUG_MODE else "")
+            texts[i] = err_msg if DEBUG_MODE else ""
+    if not doc_jobs:
+        return texts
+
+    file_indices = list(doc_jobs)
+
+    async def run():
+        async for item in aextract_documents(list(doc_jobs.values())):
+            i = file_indices[item["index"]]
+            name = getattr(files[i], "name", "unknown")
+            append_debug_log(
+                {
+                    "file_extract": {
+                        "file": name,
+                        "cached": item.get("cached"),
+                        "ocr_sec": item.get("ocr_sec"),
+                        "latency_sec": item.get("latency_sec"),
+                    }
+                }
+            )
+            if "error" in item:
+                err_msg = f"file:{name} error:{item['error']}"
+                append_debug_log({"file_error": err_msg})
+                # 条文分割のみ失敗した場合は分割前のテキストを使う
+                texts[i] = item.get("raw_text") or (err_msg if DEBUG_MODE else "")
+            else:
+                texts[i] = flatten_document_result(item["result"])
+
+    try:
+        asyncio.run(run())
+    except Exception as e:
+        append_debug_log({"file_error": f"extract_failed: {e}"})
+    finally:
+        for tmp_path in doc_jobs.values():
+            try:
+                Path(tmp_path).unlink(missing_ok=True)
+            except Exception as cleanup_err:
+                append_debug_log({"file_cleanup_error": str(cleanup_err)})
     return texts
 
 
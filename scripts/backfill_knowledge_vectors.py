@@ -24,10 +24,46 @@ def main():
         default=None,
         help="処理件数を制限する（先頭から）",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="1回の埋め込みリクエストに含める件数",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=8,
+        help="同時upsert数の上限",
+    )
+    parser.add_argument(
+        "--max-batches-in-flight",
+        type=int,
+        default=2,
+        help="埋め込み済みでupsert完了待ちのバッチ数の上限（埋め込みとupsertを重ねて実行）",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="チェックポイントファイルのパス（既定: .cache/backfill_knowledge_vectors.json）",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="チェックポイントを無視して先頭から処理する",
+    )
     args = parser.parse_args()
 
     api = KnowledgeAPI()
-    result = api.backfill_vectors(force=args.force, limit=args.limit)
+    result = api.backfill_vectors(
+        force=args.force,
+        limit=args.limit,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+        max_batches_in_flight=args.max_batches_in_flight,
+        checkpoint_path=args.checkpoint,
+        resume=not args.no_resume,
+    )
     print(result)
 
 
@@ -0,0 +1,387 @@
+"""
+フォルダ単位で契約書（.docx/.pdf）を一括審査するスクリプト
+抽出（OCR）→マッピング→審査を文書単位でパイプライン実行し、文書ごとにJSONLとCSV（画面の審査結果CSVと同形式）を出力する。
+LLMの同時実行数・RPM/TPMは api.async_llm_service の上限（全文書で共有）、OCRの同時解析数は --max-ocr で制御する。
+例:
+    python scripts/batch_examination.py contracts/ --contract-type 業務委託契約
+    python scripts/batch_examination.py "legacy/**/*.pdf" --contract-type NDA --max-documents 8
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from api import async_llm_service
+from api.contract_api import ContractAPI
+from api.examination_api import run_examination_job
+from api.examination_session import ExaminationSession
+from api.knowledge_api import KnowledgeAPI
+from services.document_input import aextract_documents
+from services.llm_rate_limiter import get_rate_limiter
+
+DOCUMENT_EXTENSIONS = (".docx", ".pdf")
+
+
+def collect_document_paths(patterns: list) -> list:
+    """ディレクトリ（再帰）またはglobパターンから対象ファイルを重複なく集める"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matched = glob.glob(os.path.join(pattern, "**", "*"), recursive=True)
+        else:
+            matched = glob.glob(pattern, recursive=True)
+        for path in sorted(matched):
+            if os.path.isfile(path) and path.lower().endswith(DOCUMENT_EXTENSIONS):
+                paths.append(os.path.abspath(path))
+    return list(dict.fromkeys(paths))
+
+
+def filter_knowledge_by_contract_type(knowledge_all: list, contract_type: str) -> list:
+    """審査画面と同じ絞り込み（汎用=全件、それ以外=指定種別+汎用）"""
+    if not contract_type or contract_type == "汎用":
+        return list(knowledge_all)
+    return [k for k in knowledge_all if k.get("contract_type") in [contract_type, "汎用"]]
+
+
+def build_exam_clauses(extracted: dict) -> list:
+    """抽出結果を審査画面と同じ条文リスト（前文+条項）に変換する"""
+    clauses = [{"clause_number": "前文", "clause": extracted.get("introduction", "")}]
+    for c in extracted.get("clauses", []):
+        clauses.append(
+            {"clause_number": c.get("clause_number", ""), "clause": c.get("text", "")}
+        )
+    return clauses
+
+
+def build_review_status(clauses: list, analyzed_clauses: list) -> dict:
+    status = {c["clause_number"]: "unreviewed" for c in clauses if c["clause_number"]}
+    for analyzed in analyzed_clauses:
+        num = analyzed.get("clause_number", "")
+        if num in status:
+            status[num] = (
+                "reviewed_concern" if analyzed.get("amendment_clause") else "reviewed_safe"
+            )
+    return status
+
+
+class DocumentProgress:
+    """run_examination_job の進捗を受け取り、ステージの所要時間を記録する"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stage_started = {}
+        self.partial = []
+
+    def update(self, **fields) -> None:
+        stage = fields.get("stage")
+        if stage and stage not in self.stage_started:
+            self.stage_started[stage] = time.perf_counter()
+            print(f"[{self.name}] {stage} 開始 (total={fields.get('total')})")
+
+    def add_partial(self, item) -> None:
+        self.partial.append(item)
+
+
+def output_stem(file_path: str, used: set) -> str:
+    """出力ファイル名（同名ファイルは連番を付けて区別）"""
+    stem = Path(file_path).stem
+    name, n = stem, 1
+    while name in used:
+        n += 1
+        name = f"{stem}_{n}"
+    used.add(name)
+    return name
+
+
+def write_document_outputs(
+    output_dir: Path,
+    stem: str,
+    file_path: str,
+    extracted: dict,
+    clauses: list,
+    result: dict,
+    knowledge: list,
+    contract_api: ContractAPI,
+    args,
+) -> None:
+    """文書ごとのJSONL（1行=1条項）とCSV（審査画面と同形式）を書き出す"""
+    session = ExaminationSession(result["clauses_augmented"], knowledge)
+    session.bind_results(result["analyzed_clauses"])
+    with open(output_dir / f"{stem}.jsonl", "w", encoding="utf-8") as f:
+        for c in session.clauses:
+            analyzed = session.get_result(c["clause_number"]) or {}
+            record = {
+                "file_path": file_path,
+                "title": extracted.get("title", ""),
+                "clause_number": c["clause_number"],
+                "clause": c["clause"],
+                "concern": analyzed.get("concern", ""),
+                "amendment_clause": analyzed.get("amendment_clause", ""),
+                "knowledge_ids": analyzed.get("knowledge_ids", []),
+                "knowledge_numbers": [
+                    k.get("knowledge_number")
+                    for k in (session.get_knowledge(kid) for kid in analyzed.get("knowledge_ids", []))
+                    if k
+                ],
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    csv_data = contract_api.export_examination_result_to_csv(
+        analyzed_clauses=result["analyzed_clauses"],
+        original_clauses=clauses,
+        contract_info={
+            "title": extracted.get("title", ""),
+            "contract_type": args.contract_type,
+            "partys": args.partys,
+            "background": args.background,
+        },
+        clause_review_status=build_review_status(clauses, result["analyzed_clauses"]),
+        examination_datetime=datetime.now().strftime("%Y%m%d%H%M%S"),
+        llm_model=args.llm_model,
+        session=session,
+    )
+    with open(output_dir / f"{stem}.csv", "w", encoding="utf-8", newline="") as f:
+        f.write(csv_data)
+
+
+async def run_batch(
+    paths: list,
+    knowledge: list,
+    contract_api: ContractAPI,
+    knowledge_api: KnowledgeAPI,
+    args,
+) -> dict:
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    doc_semaphore = asyncio.Semaphore(args.max_documents)
+    used_stems = set()
+    summaries = []
+    partys = [p.strip() for p in args.partys.split(",") if p.strip()]
+
+    async def examine(item: dict) -> dict:
+        file_path = item["file_path"]
+        name = Path(file_path).name
+        summary = {
+            "file_path": file_path,
+            "extract_sec": item.get("latency_sec"),
+            "ocr_sec": item.get("ocr_sec"),
+            "extract_cached": item.get("cached", False),
+        }
+        if "error" in item:
+            summary.update(status="failed", error=f"抽出に失敗しました: {item['error']}")
+            return summary
+        clauses = build_exam_clauses(item["result"])
+        progress = DocumentProgress(name)
+        async with doc_semaphore:
+            exam_started = time.perf_counter()
+            try:
+                result = await run_examination_job(
+                    progress,
+                    contract_type=args.contract_type,
+                    background_info=args.background,
+                    partys=partys,
+                    title=extracted.get("title", ""),
+                    clauses=clauses,
+                    knowledge_all=knowledge,
+                    llm_model=args.llm_model,
+                    prefilter_top_k=args.prefilter_top_k or None,
+                    pack_token_budget=args.pack_token_budget,
+                    get_knowledge_vector_index=knowledge_api.get_knowledge_vector_index,
+                )
+            except Exception as e:
+                summary.update(status="failed", error=f"審査に失敗しました: {e}")
+                return summary
+            finished = time.perf_counter()
+        if args.eval_prefilter_recall and args.prefilter_top_k:
+            # 検証用: 絞り込みなしのマッピングを正解として事前絞り込みの再現率を測る
+            try:
+                summary["prefilter_recall"] = (
+                    await async_llm_service.aevaluate_prefilter_recall(
+                        knowledge,
+                        clauses,
+                        args.prefilter_top_k,
+                        vector_index=await asyncio.to_thread(
+                            knowledge_api.get_knowledge_vector_index
+                        ),
+                    )
+                )
+            except Exception as e:
+                print(f"[{name}] 事前絞り込みの再現率の評価に失敗しました: {e}")
+        review_started = progress.stage_started.get("review", finished)
+        summary.update(
+            status=result["status"],
+            clauses=len(clauses),
+            concerns=sum(1 for a in result["analyzed_clauses"] if a.get("amendment_clause")),
+            mapping_sec=round(review_started - exam_started, 3),
+            review_sec=round(finished - review_started, 3),
+            review_trace=result["trace"],
+        )
+        stem = output_stem(file_path, used_stems)
+        summary["output"] = stem
+        await asyncio.to_thread(
+            write_document_outputs,
+            output_dir,
+            stem,
+            file_path,
+            extracted,
+            clauses,
+            result,
+            knowledge,
+            contract_api,
+            args,
+        )
+        return summary
+
+    # 抽出の完了した文書から順にマッピング・審査へ流す
+    tasks = []
+    async for item in aextract_documents(
+        paths,
+        audit_clause_boundaries=not args.no_audit,
+        use_cache=not args.no_cache,
+        max_concurrency=args.max_ocr,
+    ):
+        print(f"[{Path(item['file_path']).name}] 抽出完了 ({item.get('latency_sec')}s)")
+        tasks.append(asyncio.ensure_future(examine(item)))
+    for future in asyncio.as_completed(tasks):
+        summary = await future
+        summaries.append(summary)
+        print(
+            f"[{Path(summary['file_path']).name}] {summary['status']}"
+            + (f": {summary['error']}" if summary.get("error") else "")
+        )
+
+    total_sec = time.perf_counter() - started
+    # 評価した文書の正解組を合算した再現率
+    recall_docs = [s["prefilter_recall"] for s in summaries if s.get("prefilter_recall")]
+    prefilter_recall = None
+    if recall_docs:
+        reference_pairs = sum(r["reference_pairs"] for r in recall_docs)
+        prefilter_recall = {
+            "documents": len(recall_docs),
+            "reference_pairs": reference_pairs,
+            "recall_at_k": {
+                k: (
+                    sum(r["hits_at_k"].get(k, 0) for r in recall_docs) / reference_pairs
+                    if reference_pairs
+                    else None
+                )
+                for k in recall_docs[0]["hits_at_k"]
+            },
+        }
+    succeeded = [s for s in summaries if s["status"] == "ok"]
+    clause_count = sum(s.get("clauses", 0) for s in succeeded)
+    return {
+        "documents": len(paths),
+        "succeeded": len(succeeded),
+        "no_mapping": sum(1 for s in summaries if s["status"] == "no_mapping"),
+        "failed": sum(1 for s in summaries if s["status"] == "failed"),
+        "clauses": clause_count,
+        "total_sec": round(total_sec, 3),
+        "documents_per_min": round(len(succeeded) / total_sec * 60, 2) if total_sec else None,
+        "clauses_per_sec": round(clause_count / total_sec, 3) if total_sec else None,
+        "stage_sum_sec": {
+            stage: round(sum(s.get(stage) or 0.0 for s in summaries), 3)
+            for stage in ("extract_sec", "ocr_sec", "mapping_sec", "review_sec")
+        },
+        "prefilter_recall": prefilter_recall,
+        "review_cache": async_llm_service.get_review_cache().stats(),
+        "rate_limiter": get_rate_limiter(args.llm_model).stats(),
+        "per_document": sorted(summaries, key=lambda s: s["file_path"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="フォルダ/globで指定した契約書を一括審査し、文書ごとにJSONL/CSVを出力する"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="対象ディレクトリ（再帰）またはglobパターン（.docx/.pdf）",
+    )
+    parser.add_argument("--contract-type", required=True, help="契約種別（ナレッジの絞り込みに使用）")
+    parser.add_argument("--partys", default="", help="契約当事者（カンマ区切り、全文書共通）")
+    parser.add_argument("--background", default="", help="背景情報（全文書共通）")
+    parser.add_argument("--llm-model", default=async_llm_service.DEFAULT_MODEL, help="審査に使うLLMモデル")
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="出力先（既定: batch_output/<実行日時>）",
+    )
+    parser.add_argument(
+        "--max-documents",
+        type=int,
+        default=int(os.getenv("BATCH_EXAM_MAX_DOCUMENTS", "4")),
+        help="同時にマッピング・審査する文書数（既定: BATCH_EXAM_MAX_DOCUMENTS または4）",
+    )
+    parser.add_argument(
+        "--max-ocr",
+        type=int,
+        default=None,
+        help="OCRの同時解析数（既定: DOCUMENT_INTELLIGENCE_MAX_CONCURRENCY）",
+    )
+    parser.add_argument(
+        "--prefilter-top-k",
+        type=int,
+        default=0,
+        help="マッピング候補の事前絞り込み件数（0=全件送信）",
+    )
+    parser.add_argument(
+        "--eval-prefilter-recall",
+        action="store_true",
+        help="検証用: 文書ごとに絞り込みなしのマッピングも実行し、事前絞り込みの再現率を summary.json に出力する",
+    )
+    parser.add_argument(
+        "--pack-token-budget",
+        type=int,
+        default=None,
+        help="審査のまとめ上限トークン数（既定: LLM_REVIEW_PACK_TOKENS、0=無効）",
+    )
+    parser.add_argument("--no-audit", action="store_true", help="条文境界のLLM監査を行わない")
+    parser.add_argument("--no-cache", action="store_true", help="抽出キャッシュを使わない")
+    args = parser.parse_args()
+
+    paths = collect_document_paths(args.paths)
+    if not paths:
+        print("対象ファイル（.docx/.pdf）が見つかりませんでした。")
+        sys.exit(1)
+    if args.output_dir is None:
+        args.output_dir = str(
+            ROOT / "batch_output" / datetime.now().strftime("%Y%m%d%H%M%S")
+        )
+
+    knowledge_api = KnowledgeAPI()
+    knowledge = filter_knowledge_by_contract_type(
+        knowledge_api.get_knowledge_all(), args.contract_type
+    )
+    if not knowledge:
+        print("ナレッジが取得できませんでした。接続設定を確認してください。")
+        sys.exit(1)
+    print(f"対象 {len(paths)} 件 / ナレッジ {len(knowledge)} 件 / 出力先 {args.output_dir}")
+
+    summary = asyncio.run(
+        run_batch(paths, knowledge, ContractAPI(), knowledge_api, args)
+    )
+    with open(Path(args.output_dir) / "summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(
+        json.dumps(
+            {k: v for k, v in summary.items() if k != "per_document"},
+            ensure_ascii=False,
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("OPENAI_API_KEY", "dummy")
+
+from api.knowledge_api import KnowledgeAPI
+
+# テスト実行例:
+# py scripts/functional_test_knowledge_text_search.py  # 擬似データでナレッジのキーワード検索を確認
+
+KNOWLEDGE = [
+    {
+        "id": f"k{no}",
+        "knowledge_number": number,
+        "contract_type": "秘密保持",
+        "knowledge_title": title,
+        "target_clause": target,
+        "review_points": "",
+        "action_plan": "",
+        "clause_sample": "",
+        "_etag": f"e{no}",
+        "_ts": 1,
+    }
+    for no, number, title, target in [
+        (1, 1, "秘密情報の定義", "秘密情報"),
+        (12, 12, "損害賠償の上限", "損害賠償"),
+        (112, 112.0, "有効期間12か月", "有効期間"),
+        (120, 120, "準拠法", "準拠法"),
+    ]
+]
+
+
+class _FakeCosmosDB:
+    """スナップショットのロード用（全件/差分とも擬似データを返す）"""
+
+    def search_container_by_query(self, container_name, query, parameters, database_name=None):
+        return [dict(k) for k in KNOWLEDGE]
+
+
+def _search(api: KnowledgeAPI, text: str) -> list:
+    return [k.get("knowledge_number") for k in api.get_knowledge_index(search_text=text)]
+
+
+def check_search() -> list[str]:
+    api = KnowledgeAPI.__new__(KnowledgeAPI)
+    api.cosmosdb = _FakeCosmosDB()
+    errors = []
+
+    numbers = _search(api, "12")
+    if not numbers or numbers[0] != 12:
+        errors.append(f'"12" の先頭が No.12 ではない: {numbers}')
+    if set(numbers) != {12, 112.0, 120}:
+        errors.append(f'"12" の一致が想定と異なる: {numbers}')
+    numbers = _search(api, "１１２")
+    if not numbers or numbers[0] != 112:
+        errors.append(f'全角 "１１２" の先頭が No.112 ではない: {numbers}')
+    numbers = _search(api, "損害")
+    if numbers != [12]:
+        errors.append(f'"損害" の一致が想定と異なる: {numbers}')
+    numbers = _search(api, "1")
+    if not numbers or numbers[0] != 1 or len(numbers) != len(KNOWLEDGE):
+        errors.append(f'"1" の一致が想定と異なる: {numbers}')
+    return errors
+
+
+def main() -> int:
+    errors = check_search()
+    for error in errors:
+        print(f"NG: {error}")
+    print("OK" if not errors else f"{len(errors)} 件の不一致")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
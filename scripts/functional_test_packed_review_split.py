@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# キャッシュ・実行台帳は一時ディレクトリに作る
+os.environ["APP_CACHE_DIR"] = tempfile.mkdtemp(prefix="packed_review_split_")
+os.environ.setdefault("OPENAI_API_KEY", "dummy")
+
+from api import async_llm_service
+from api.async_llm_service import _split_packed_review_results, run_batch_reviews
+from services.run_ledger import get_run_ledger
+
+# テスト実行例:
+# py scripts/functional_test_packed_review_split.py  # 擬似LLMでまとめ審査の振り分けを確認
+
+CLAUSES = [
+    {"clause_number": "1", "clause": "第1条 本契約の目的は..."},
+    {"clause_number": "2", "clause": "第2条 秘密情報とは..."},
+]
+
+
+def _knowledge(kid: str) -> dict:
+    return {
+        "id": kid,
+        "target_clause": "秘密保持",
+        "knowledge_title": f"ナレッジ{kid}",
+        "review_points": "範囲",
+        "action_plan": "限定する",
+        "clause_sample": "",
+    }
+
+
+ITEMS = [{"clauses": CLAUSES, "knowledge": [_knowledge(kid)]} for kid in ("k1", "k2")]
+
+
+def _row(num: str, kid: str, concern=None) -> dict:
+    return {
+        "clause_number": num,
+        "concern": concern,
+        "amendment_clause": None,
+        "knowledge_ids": [kid],
+    }
+
+
+def check_split() -> list[str]:
+    errors = []
+    complete = [_row("1", "k1", "懸念"), _row("2", "k1"), _row("1", "k2"), _row("2", "k2")]
+    split = _split_packed_review_results(complete, ITEMS)
+    if split[0] is None or split[0][0]["concern"] != "懸念" or split[1] is None:
+        errors.append(f"全行ありの振り分けが不正: {split}")
+    # k2 の条項2が漏れた応答: k2 は「懸念なし」ではなく結果なし（None）になる
+    missing = [_row("1", "k1"), _row("2", "k1"), _row("1", "k2")]
+    split = _split_packed_review_results(missing, ITEMS)
+    if split[0] is None:
+        errors.append("漏れの無いナレッジ(k1)が結果なしになった")
+    if split[1] is not None:
+        errors.append(f"行の漏れたナレッジ(k2)が結果として扱われた: {split[1]}")
+    return errors
+
+
+async def check_retry() -> list[str]:
+    errors = []
+    calls = []
+
+    async def fake_invoke(chain, prompt, model=None):
+        knowledge = json.loads(prompt.split("【審査知見（knowledge）】\n")[1].split("\n")[0])
+        kids = [k["id"] for k in knowledge]
+        calls.append(kids)
+        if len(kids) > 1:
+            # まとめ審査では k2 の条項2を返さない
+            rows = [_row("1", "k1"), _row("2", "k1"), _row("1", "k2")]
+        else:
+            rows = [_row(c["clause_number"], kids[0], f"個別:{kids[0]}") for c in CLAUSES]
+        return json.dumps({"results": rows}, ensure_ascii=False)
+
+    async_llm_service.ainvoke_with_limit = fake_invoke
+    ledger = get_run_ledger("functional-test")
+    trace = {}
+    results = await run_batch_reviews(
+        ITEMS, pack_token_budget=100000, ledger=ledger, trace=trace
+    )
+    if trace.get("packed_incomplete_items") != 1 or trace.get("packed_retried_items") != 1:
+        errors.append(f"個別再実行の集計が不正: {trace}")
+    if calls != [["k1", "k2"], ["k2"]]:
+        errors.append(f"k2 のみ個別に再実行されるべき: {calls}")
+    if [r["concern"] for r in results[1]] != ["個別:k2", "個別:k2"]:
+        errors.append(f"k2 の結果が個別審査の結果になっていない: {results[1]}")
+    if ledger.summary().get("knowledge_review", {}).get("ok") != 2:
+        errors.append(f"台帳の記録が不正: {ledger.summary()}")
+    # 2回目はキャッシュから返り、漏れた行の代わりに個別審査の結果が保存されている
+    calls.clear()
+    results = await run_batch_reviews(ITEMS, pack_token_budget=100000)
+    if calls or [r["concern"] for r in results[1]] != ["個別:k2", "個別:k2"]:
+        errors.append(f"キャッシュの内容が不正: calls={calls} results={results[1]}")
+    return errors
+
+
+def main() -> int:
+    errors = check_split() + asyncio.run(check_retry())
+    for error in errors:
+        print(f"NG: {error}")
+    print("OK" if not errors else f"{len(errors)} 件の不一致")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CACHE_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", ".cache")
+)
+
+
+def get_cache_dir() -> str:
+    """キャッシュ保存先ディレクトリ（`APP_CACHE_DIR` で変更可）"""
+    return os.getenv("APP_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+
+def make_cache_key(payload: Any) -> str:
+    """JSON化可能な値から内容アドレス（SHA-256）キーを生成"""
+    blob = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class DiskLruCache:
+    """
+    SQLiteを使ったプロセス/セッション横断のキー・バリューキャッシュ。
+    値はJSONで保存し、件数・容量の上限を超えたら最終アクセスが古い順に削除する。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 5000,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """キーに対応する値を返す。無ければNone（LRU順序を更新）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """値を保存し、上限超過分を古い順に削除する"""
+        blob = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob.encode("utf-8")), now, now),
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """ヒット/ミス件数と現在の件数・容量を返す"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total,
+            }
+
+    def _evict_locked(self) -> None:
+        entries, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM cache ORDER BY accessed_at ASC"
+        ).fetchall()
+        victims = []
+        for key, size in rows:
+            if entries <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            entries -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+
+_caches: dict[str, DiskLruCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_disk_cache(
+    name: str,
+    max_entries: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+) -> DiskLruCache:
+    """
+    名前ごとのキャッシュをプロセス内で共有して返す。
+    上限は `<NAME>_CACHE_MAX_ENTRIES` / `<NAME>_CACHE_MAX_MB` でも指定できる。
+    """
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            env_prefix = name.upper()
+            if max_entries is None:
+                max_entries = int(os.getenv(f"{env_prefix}_CACHE_MAX_ENTRIES", "5000"))
+            if max_bytes is None:
+                max_bytes = (
+                    int(os.getenv(f"{env_prefix}_CACHE_MAX_MB", "256")) * 1024 * 1024
+                )
+            path = os.path.join(get_cache_dir(), f"{name}.sqlite3")
+            cache = DiskLruCache(path, max_entries=max_entries, max_bytes=max_bytes)
+            _caches[name] = cache
+        return cache
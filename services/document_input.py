@@ -1,8 +1,31 @@
 # pip install python-docx
 
-from typing import Callable, Optional
+import asyncio
+import hashlib
+import time
+from typing import AsyncIterator, Callable, Optional
 
 from services.boundary_audit import LlmAuditConfig, split_tail_sections
+from services.disk_cache import DiskLruCache, get_disk_cache, make_cache_key
+
+# 抽出・分割ロジック（OCRモデル/オプション、分割ルール、監査プロンプト）を変えたら上げる
+DOCUMENT_EXTRACTOR_VERSION = "1"
+DOCUMENT_CHUNKER_VERSION = "1"
+DOCUMENT_LAYOUT_MODEL = "prebuilt-layout"
+
+
+def get_document_cache() -> DiskLruCache:
+    """抽出段落・条文分割結果のキャッシュ（`<APP_CACHE_DIR>/document.sqlite3`）"""
+    return get_disk_cache("document")
+
+
+def file_sha256(file_path: str) -> str:
+    """ファイル内容のSHA-256（一時ファイル名に依存しないキャッシュキー用）"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 
 def split_document_paragraphs(
@@ -177,87 +200,162 @@ def _merge_clauses_with_llm(
     return merged
 
 
-def extract_text_from_document(
-    file_path: str, *, audit_clause_boundaries: bool = True
-) -> dict:
+def _extract_docx_text(file_path: str) -> str:
+    """
+    .docx 内の“可視テキスト”をできるだけ取りこぼしなく抽出する。
+    - SDT(コンテンツコントロール)配下のテキストも含む
+    - 本文に加え、ヘッダー/フッター、脚注/文末脚注、コメントも対象
+    - 段落(w:p)ごとに w:t を結合し、行として積む
+    - 変更履歴の削除(w:del)配下の文字は除外
+    """
+    import zipfile
+    import lxml.etree as etree
+
+    ns = {"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"}
+
+    def _read_xml(z: zipfile.ZipFile, name: str):
+        try:
+            return etree.fromstring(z.read(name))
+        except KeyError:
+            return None
+
+    with zipfile.ZipFile(file_path) as z:
+        # 見に行くパーツ（存在するものだけ処理）
+        parts = ['word/document.xml']
+        parts += [n for n in z.namelist() if n.startswith('word/header')]
+        parts += [n for n in z.namelist() if n.startswith('word/footer')]
+        for extra in ('word/footnotes.xml', 'word/endnotes.xml', 'word/comments.xml'):
+            if extra in z.namelist():
+                parts.append(extra)
+
+        lines = []
+        for name in parts:
+            root = _read_xml(z, name)
+            if root is None:
+                continue
+
+            # パーツ内の“段落ごと”に、削除履歴を除いた w:t を順序通り収集
+            for p in root.xpath('.//w:p', namespaces=ns):
+                # 段落内のテキストノード（w:t）を、w:del の配下は除外して集める
+                ts = p.xpath('.//w:t[not(ancestor::w:del)]/text()', namespaces=ns)
+                line = ''.join(ts).strip()
+                if line:
+                    lines.append(line)
+
+        return '\n'.join(lines)
+
+
+def _ocr_result_paragraphs(result) -> Optional[list[str]]:
+    """Document Intelligenceの解析結果から段落テキストを取り出す（段落が無ければNone）"""
+    ocr_paragraphs = getattr(result, "paragraphs", None)
+    if not ocr_paragraphs:
+        return None
+    lines = []
+    for p in ocr_paragraphs:
+        content = p.get("content") if isinstance(p, dict) else getattr(p, "content", "")
+        if content:
+            lines.append(content)
+    return lines
+
+
+def _paragraphs_cache_key(file_path: str) -> str:
     import os
-    from azure_.documentintelligence import get_document_intelligence_ocr
 
-    def extract_text_including_sdt(file_path: str) -> str:
-        """
-        .docx 内の“可視テキスト”をできるだけ取りこぼしなく抽出する。
-        - SDT(コンテンツコントロール)配下のテキストも含む
-        - 本文に加え、ヘッダー/フッター、脚注/文末脚注、コメントも対象
-        - 段落(w:p)ごとに w:t を結合し、行として積む
-        - 変更履歴の削除(w:del)配下の文字は除外
-        """
-        import zipfile
-        import lxml.etree as etree
-
-        ns = {"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"}
-
-        def _read_xml(z: zipfile.ZipFile, name: str):
-            try:
-                return etree.fromstring(z.read(name))
-            except KeyError:
-                return None
-
-        with zipfile.ZipFile(file_path) as z:
-            # 見に行くパーツ（存在するものだけ処理）
-            parts = ['word/document.xml']
-            parts += [n for n in z.namelist() if n.startswith('word/header')]
-            parts += [n for n in z.namelist() if n.startswith('word/footer')]
-            for extra in ('word/footnotes.xml', 'word/endnotes.xml', 'word/comments.xml'):
-                if extra in z.namelist():
-                    parts.append(extra)
-
-            lines = []
-            for name in parts:
-                root = _read_xml(z, name)
-                if root is None:
-                    continue
-
-                # パーツ内の“段落ごと”に、削除履歴を除いた w:t を順序通り収集
-                for p in root.xpath('.//w:p', namespaces=ns):
-                    # 段落内のテキストノード（w:t）を、w:del の配下は除外して集める
-                    ts = p.xpath('.//w:t[not(ancestor::w:del)]/text()', namespaces=ns)
-                    line = ''.join(ts).strip()
-                    if line:
-                        lines.append(line)
-
-            return '\n'.join(lines)
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in (".docx", ".pdf"):
+        raise ValueError("対応していないファイル形式です")
+    return make_cache_key(
+        {
+            "kind": "paragraphs",
+            "sha256": file_sha256(file_path),
+            "ext": ext,
+            "extractor": DOCUMENT_EXTRACTOR_VERSION,
+            "model": DOCUMENT_LAYOUT_MODEL if ext == ".pdf" else None,
+            "output_content_format": "markdown" if ext == ".pdf" else None,
+        }
+    )
+
 
+_PDF_PARAGRAPHS_ERROR = {
+    "error": "PDF抽出で result.paragraphs.content が取得できませんでした。",
+    "raw_text": "",
+}
+
+
+def extract_document_paragraphs(file_path: str, *, use_cache: bool = True) -> dict:
+    """
+    .docx / .pdf から段落テキストを抽出する（PDFはDocument Intelligenceのprebuilt-layout）
+    結果はファイル内容のSHA-256 + 抽出バージョン + オプションをキーにキャッシュする（エラーはキャッシュしない）
+    Returns:
+        dict: {"paragraphs": [...], "cached": bool} または {"error", "raw_text"}
+    """
+    from azure_.documentintelligence import get_document_intelligence_ocr
+
+    cache_key = _paragraphs_cache_key(file_path)
+    if use_cache:
+        cached = get_document_cache().get(cache_key)
+        if cached is not None:
+            return {"paragraphs": cached, "cached": True}
 
     # ファイル種別判定
-    ext = os.path.splitext(file_path)[1].lower()
-    text = ""
-    paragraphs = []
-    if ext == ".docx":
-        text = extract_text_including_sdt(file_path)
-        paragraphs = text.splitlines()
-    elif ext in [".pdf"]:
-        ocr = get_document_intelligence_ocr()
-        result = ocr.analyze_document(file_path)
-        ocr_paragraphs = getattr(result, "paragraphs", None)
-        if ocr_paragraphs:
-            lines = []
-            for p in ocr_paragraphs:
-                content = p.get("content") if isinstance(p, dict) else getattr(p, "content", "")
-                if content:
-                    lines.append(content)
-            paragraphs = lines
-            text = "\n".join(lines)
-        else:
-            return {
-                "error": "PDF抽出で result.paragraphs.content が取得できませんでした。",
-                "raw_text": "",
-            }
+    if file_path.lower().endswith(".docx"):
+        paragraphs = _extract_docx_text(file_path).splitlines()
     else:
-        raise ValueError("対応していないファイル形式です")
+        ocr = get_document_intelligence_ocr()
+        paragraphs = _ocr_result_paragraphs(ocr.analyze_document(file_path))
+        if paragraphs is None:
+            return dict(_PDF_PARAGRAPHS_ERROR)
+    if use_cache:
+        get_document_cache().set(cache_key, paragraphs)
+    return {"paragraphs": paragraphs, "cached": False}
 
+
+def split_document_paragraphs_cached(
+    paragraphs: list[str],
+    *,
+    audit_clause_boundaries: bool = True,
+    use_cache: bool = True,
+) -> dict:
+    """
+    split_document_paragraphs（末尾監査・条文境界監査のLLM呼び出しを含む）の結果を
+    段落内容のハッシュ + 分割バージョン + オプションをキーにキャッシュする（エラーはキャッシュしない）
+    """
+    cache_key = make_cache_key(
+        {
+            "kind": "chunked",
+            "paragraphs": make_cache_key(paragraphs),
+            "chunker": DOCUMENT_CHUNKER_VERSION,
+            "enable_tail_audit": True,
+            "audit_clause_boundaries": audit_clause_boundaries,
+        }
+    )
+    if use_cache:
+        cached = get_document_cache().get(cache_key)
+        if cached is not None:
+            return cached
     chunked = split_document_paragraphs(
         paragraphs, enable_tail_audit=True, audit_clause_boundaries=audit_clause_boundaries
     )
+    if use_cache and "error" not in chunked:
+        get_document_cache().set(cache_key, chunked)
+    return chunked
+
+
+def extract_text_from_document(
+    file_path: str, *, audit_clause_boundaries: bool = True, use_cache: bool = True
+) -> dict:
+    """
+    契約書ファイルから表題・前文・条文・署名欄・別紙を抽出する
+    同じ内容のファイルの再アップロードでは、OCRと境界監査のLLM呼び出しをキャッシュで省略する
+    """
+    extracted = extract_document_paragraphs(file_path, use_cache=use_cache)
+    if "error" in extracted:
+        return extracted
+    chunked = split_document_paragraphs_cached(
+        extracted["paragraphs"],
+        audit_clause_boundaries=audit_clause_boundaries,
+        use_cache=use_cache,
+    )
     if "error" in chunked:
         return chunked
     final_output = {
@@ -270,6 +368,89 @@ def extract_text_from_document(
     return final_output
 
 
+async def aextract_documents(
+    file_paths: list[str],
+    *,
+    audit_clause_boundaries: bool = True,
+    use_cache: bool = True,
+    max_concurrency: Optional[int] = None,
+) -> AsyncIterator[dict]:
+    """
+    複数ファイルを並行に抽出し、完了した順にyieldする（extract_text_from_document の非同期・複数版）
+    - PDFは AsyncDocumentIntelligenceOCR で一括投入し、同時解析数 `max_concurrency` の範囲で並行にポーリング
+    - .docx の読み取りと条文分割（LLM監査を含む）はスレッドで実行し、OCRの完了したファイルから順に進める
+    - キャッシュは extract_text_from_document と共通
+    - 抽出・条文分割の失敗は "error"（段落が取れていれば "raw_text" も）に入れ、"result" は成功時のみ
+    - 時間はファイルごと: queued_sec はOCRの解析枠の待ち、ocr_sec は解析、latency_sec は待ちを除いた処理全体、
+      finished_sec は一括投入からの完了時刻
+    Yields:
+        dict: {"index", "file_path", "result" or "error", "cached", "queued_sec", "ocr_sec", "latency_sec", "finished_sec"}
+    """
+    from azure_.documentintelligence import AsyncDocumentIntelligenceOCR
+
+    started = time.perf_counter()
+
+    async def extract_one(ocr, index: int, file_path: str) -> dict:
+        item = {
+            "index": index,
+            "file_path": file_path,
+            "cached": False,
+            "queued_sec": 0.0,
+            "ocr_sec": 0.0,
+        }
+        file_started = time.perf_counter()
+        try:
+            cache_key = await asyncio.to_thread(_paragraphs_cache_key, file_path)
+            paragraphs = get_document_cache().get(cache_key) if use_cache else None
+            if paragraphs is not None:
+                item["cached"] = True
+            elif file_path.lower().endswith(".docx"):
+                text = await asyncio.to_thread(_extract_docx_text, file_path)
+                paragraphs = text.splitlines()
+            else:
+                timings = {}
+                try:
+                    result = await ocr.analyze_document(file_path, timings=timings)
+                finally:
+                    item["queued_sec"] = timings.get("queued_sec", 0.0)
+                    item["ocr_sec"] = timings.get("analyze_sec", 0.0)
+                paragraphs = _ocr_result_paragraphs(result)
+            if paragraphs is None:
+                chunked = dict(_PDF_PARAGRAPHS_ERROR)
+            else:
+                if use_cache and not item["cached"]:
+                    get_document_cache().set(cache_key, paragraphs)
+                chunked = await asyncio.to_thread(
+                    split_document_paragraphs_cached,
+                    paragraphs,
+                    audit_clause_boundaries=audit_clause_boundaries,
+                    use_cache=use_cache,
+                )
+            if "error" in chunked:
+                item["error"] = chunked["error"]
+                item["raw_text"] = chunked.get("raw_text", "")
+            else:
+                item["result"] = chunked
+        except Exception as e:
+            item["error"] = str(e)
+        finished = time.perf_counter()
+        item["latency_sec"] = round(finished - file_started - item["queued_sec"], 3)
+        item["finished_sec"] = round(finished - started, 3)
+        return item
+
+    async with AsyncDocumentIntelligenceOCR(max_concurrency=max_concurrency) as ocr:
+        tasks = [
+            asyncio.ensure_future(extract_one(ocr, i, path))
+            for i, path in enumerate(file_paths)
+        ]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
 if __name__ == "__main__":
     import tkinter as tk
     import os
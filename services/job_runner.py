@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional
+
+from services.disk_cache import get_cache_dir
+
+# ジョブの状態
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"  # プロセス再起動等で実行中のまま失われたジョブ
+FINISHED_STATUSES = {SUCCEEDED, FAILED, CANCELLED, INTERRUPTED}
+
+
+class JobProgress:
+    """ジョブ関数に渡す進捗の書き込み口（ジョブのスレッドから呼ぶ）"""
+
+    def __init__(self, job: "Job"):
+        self._job = job
+
+    def update(self, **fields: Any) -> None:
+        """進捗（stage/done/total/message 等）を更新する"""
+        with self._job.lock:
+            self._job.progress.update(fields)
+            self._job.updated_at = time.time()
+
+    def add_partial(self, item: Any) -> None:
+        """確定した部分結果を追加する（ポーリング側で逐次表示する用）"""
+        with self._job.lock:
+            self._job.partial.append(item)
+            self._job.updated_at = time.time()
+
+
+class Job:
+    def __init__(self, job_id: str, kind: str, meta: Optional[dict] = None):
+        self.id = job_id
+        self.kind = kind
+        self.meta = dict(meta or {})
+        self.status = QUEUED
+        self.progress: dict = {}
+        self.partial: list = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.updated_at = self.created_at
+        self.future: Optional[Future] = None
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "meta": dict(self.meta),
+                "status": self.status,
+                "progress": dict(self.progress),
+                "partial": list(self.partial),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "updated_at": self.updated_at,
+            }
+
+
+class JobRunner:
+    """
+    ワーカースレッド上の常駐イベントループで非同期ジョブを実行する。
+    - submit でジョブIDを即時に返し、呼び出し側（Streamlitのスクリプト）は get でポーリングする
+    - 同時実行数は `JOB_RUNNER_MAX_CONCURRENCY`（既定4）、超過分は queued で待機
+    - cancel で実行中のタスクをキャンセル
+    - 状態と結果は `<APP_CACHE_DIR>/jobs/<job_id>.json` に保存し、ページ遷移・再接続後も取得できる
+      （`JOB_RESULT_TTL_SEC`（既定86400）より古いファイルは submit 時に削除）
+    結果・部分結果はJSON化可能な値にすること。
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, store_dir: Optional[str] = None):
+        self.max_concurrency = max_concurrency or int(
+            os.getenv("JOB_RUNNER_MAX_CONCURRENCY", "4")
+        )
+        self.store_dir = store_dir or os.path.join(get_cache_dir(), "jobs")
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._jobs: dict[str, Job] = {}
+        self._jobs_lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run_loop, args=(ready,), name="job-runner", daemon=True
+        )
+        self._thread.start()
+        ready.wait()
+
+    def _run_loop(self, ready: threading.Event) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        ready.set()
+        self._loop.run_forever()
+
+    # 保存 -------------------
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.store_dir, f"{job_id}.json")
+
+    def _persist(self, job: Job) -> None:
+        snapshot = job.snapshot()
+        tmp = f"{self._path(job.id)}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, default=str)
+            os.replace(tmp, self._path(job.id))
+        except Exception as e:
+            print(f"job {job.id}: 保存に失敗しました: {e}")
+
+    def _purge_expired(self) -> None:
+        ttl = float(os.getenv("JOB_RESULT_TTL_SEC", "86400"))
+        now = time.time()
+        for name in os.listdir(self.store_dir):
+            path = os.path.join(self.store_dir, name)
+            try:
+                if now - os.path.getmtime(path) > ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # 実行 -------------------
+
+    async def _execute(
+        self, job: Job, fn: Callable[[JobProgress], Awaitable[Any]]
+    ) -> None:
+        try:
+            async with self._semaphore:
+                with job.lock:
+                    job.status = RUNNING
+                    job.started_at = job.updated_at = time.time()
+                self._persist(job)
+                result = await fn(JobProgress(job))
+            with job.lock:
+                job.result = result
+                job.status = SUCCEEDED
+        except asyncio.CancelledError:
+            with job.lock:
+                job.status = CANCELLED
+        except Exception as e:
+            with job.lock:
+                job.status = FAILED
+                job.error = f"{type(e).__name__}: {e}"
+        finally:
+            with job.lock:
+                job.finished_at = job.updated_at = time.time()
+            self._persist(job)
+
+    def submit(
+        self,
+        kind: str,
+        fn: Callable[[JobProgress], Awaitable[Any]],
+        meta: Optional[dict] = None,
+    ) -> str:
+        """
+        ジョブを登録してIDを返す
+        Args:
+            kind (str): ジョブ種別（例: "examination"）
+            fn: JobProgress を受け取るコルーチン関数（ワーカーのイベントループ上で実行される）
+            meta (dict, optional): 表示用の付帯情報（JSON化可能な値）
+        """
+        self._purge_expired()
+        job = Job(uuid.uuid4().hex, kind, meta)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+        self._persist(job)
+        job.future = asyncio.run_coroutine_threadsafe(self._execute(job, fn), self._loop)
+        return job.id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """ジョブの状態・進捗・部分結果・結果を返す（メモリに無ければ保存ファイルから）"""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if snapshot.get("status") not in FINISHED_STATUSES:
+            snapshot["status"] = INTERRUPTED
+        return snapshot
+
+    def cancel(self, job_id: str) -> bool:
+        """実行中/待機中のジョブをキャンセルする"""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.future is None or job.future.done():
+            return False
+        return job.future.cancel()
+
+    def forget(self, job_id: str) -> None:
+        """完了したジョブをメモリから外す（保存ファイルはTTLまで残る）"""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status in FINISHED_STATUSES:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._jobs_lock:
+            jobs = list(self._jobs.values())
+        counts: dict[str, int] = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"max_concurrency": self.max_concurrency, "jobs": counts}
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """プロセス内で共有するジョブランナーを返す（初回呼び出しでワーカースレッドを起動）"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
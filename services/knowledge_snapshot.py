@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Callable, Iterable, Mapping, Optional
+
+
+class KnowledgeSnapshot:
+    """
+    ある時点のナレッジ一覧（読み取り専用）。
+    要素は読み取り専用のビュー（MappingProxyType）で保持し、to_list / get は複製を返す。
+    更新時は新しいスナップショットを作って差し替えるため、取得済みのものは変化しない。
+    """
+
+    def __init__(self, items: Iterable[Mapping], version: int = 0):
+        self.items: tuple[Mapping, ...] = tuple(
+            k if isinstance(k, MappingProxyType) else MappingProxyType(dict(k))
+            for k in items
+        )
+        self.by_id: dict[str, Mapping] = {str(k.get("id")): k for k in self.items}
+        self.version = version
+        self.max_ts = max((int(k.get("_ts") or 0) for k in self.items), default=0)
+        self.created_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def to_list(self) -> list[dict]:
+        """ページ側で編集・並べ替えをしても共有データに影響しないよう要素ごとに複製して返す"""
+        return [dict(k) for k in self.items]
+
+    def get(self, knowledge_id: str) -> Optional[dict]:
+        """指定idのナレッジの複製を返す（無ければNone）"""
+        item = self.by_id.get(str(knowledge_id))
+        return dict(item) if item is not None else None
+
+    def merged(
+        self,
+        upserts: Iterable[Mapping] = (),
+        deleted_ids: Iterable[str] = (),
+    ) -> "KnowledgeSnapshot":
+        """差分を反映した新しいスナップショットを返す（元の順序を維持し、新規は末尾に追加）"""
+        upserts = {str(k.get("id")): k for k in upserts}
+        deleted = {str(i) for i in deleted_ids}
+        items = []
+        for k in self.items:
+            item_id = str(k.get("id"))
+            if item_id in deleted:
+                continue
+            items.append(upserts.pop(item_id, k))
+        items.extend(k for item_id, k in upserts.items() if item_id not in deleted)
+        return KnowledgeSnapshot(items, version=self.version + 1)
+
+
+class KnowledgeSnapshotStore:
+    """
+    プロセス内で共有するナレッジのスナップショット。
+    - 初回は全件ロード
+    - `KNOWLEDGE_SNAPSHOT_REFRESH_SEC`（既定30）経過後の取得時は `_ts` 以降の差分のみ取得して反映
+    - `KNOWLEDGE_SNAPSHOT_FULL_RELOAD_SEC`（既定600）経過後は全件再ロード（他プロセスでの削除を反映）
+    - 保存/削除フックから apply_saved / apply_deleted で即時反映
+    ロードはロックの外で行い、完了後に新しいスナップショットへ差し替える（ロード中の読み取りは待たせない）。
+    ロードは同時に1つだけ行い、ロード中に反映された保存/削除はロード結果に再適用する。
+    """
+
+    def __init__(
+        self,
+        load_all: Callable[[], list[dict]],
+        load_since: Callable[[int], list[dict]],
+    ):
+        self._load_all = load_all
+        self._load_since = load_since
+        self._snapshot: Optional[KnowledgeSnapshot] = None
+        self._refreshed_at = 0.0
+        self._full_loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        # ロード中に apply_saved / apply_deleted された変更（ロード結果に再適用する）
+        self._pending: Optional[list[tuple[str, list]]] = None
+        self.full_loads = 0
+        self.delta_loads = 0
+
+    def get(self, refresh: bool = False) -> KnowledgeSnapshot:
+        """
+        現在のスナップショットを返す（必要に応じて差分更新/全件再ロード）
+        ロード済みのスナップショットがあり、他のスレッドがロード中の場合は待たずに現在のものを返す
+        （refresh=True の場合は待ってから再ロードする）
+        """
+        requested_at = time.time()
+        with self._lock:
+            if self._snapshot is not None and not refresh and not self._stale_locked():
+                return self._snapshot
+            blocking = refresh or self._snapshot is None
+        if not self._load_lock.acquire(blocking=blocking):
+            with self._lock:
+                return self._snapshot
+        try:
+            with self._lock:
+                snapshot = self._snapshot
+                full = (
+                    snapshot is None
+                    or (refresh and self._full_loaded_at < requested_at)
+                    or self._stale_locked(full=True)
+                )
+                if not full and not self._stale_locked():
+                    return snapshot
+                self._pending = []
+            try:
+                if full:
+                    loaded = KnowledgeSnapshot(self._load_all())
+                else:
+                    # _tsは秒単位のため同一秒の更新を取りこぼさないよう >= で取得する
+                    changed = self._load_since(snapshot.max_ts)
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                now = time.time()
+                current = self._snapshot
+                if full:
+                    version = current.version + 1 if current else 0
+                    updated = KnowledgeSnapshot(loaded.items, version=version)
+                    self._full_loaded_at = now
+                    self.full_loads += 1
+                else:
+                    updated = current
+                    if any(
+                        current.by_id.get(str(k.get("id"))) is None
+                        or current.by_id[str(k.get("id"))].get("_etag") != k.get("_etag")
+                        for k in changed
+                    ):
+                        updated = current.merged(upserts=changed)
+                    self.delta_loads += 1
+                # ロード中の保存/削除はロード結果より新しいので最後に適用する
+                for kind, values in self._pending:
+                    if kind == "saved":
+                        updated = updated.merged(upserts=values)
+                    else:
+                        updated = updated.merged(deleted_ids=values)
+                self._pending = None
+                self._snapshot = updated
+                self._refreshed_at = now
+                return updated
+        finally:
+            self._load_lock.release()
+
+    def _stale_locked(self, full: bool = False) -> bool:
+        """差分更新（full=Trueなら全件再ロード）の時期を過ぎているか（_lock取得中に呼ぶ）"""
+        now = time.time()
+        if now - self._full_loaded_at > float(
+            os.getenv("KNOWLEDGE_SNAPSHOT_FULL_RELOAD_SEC", "600")
+        ):
+            return True
+        if full:
+            return False
+        return now - self._refreshed_at > float(
+            os.getenv("KNOWLEDGE_SNAPSHOT_REFRESH_SEC", "30")
+        )
+
+    def peek(self) -> Optional[KnowledgeSnapshot]:
+        """ロード済みのスナップショットのみを返す（未ロードならNone。更新フック用）"""
+        with self._lock:
+            return self._snapshot
+
+    def apply_saved(self, items: Iterable[Mapping]) -> None:
+        items = list(items)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("saved", items))
+            if self._snapshot is not None:
+                self._snapshot = self._snapshot.merged(upserts=items)
+
+    def apply_deleted(self, knowledge_ids: Iterable[str]) -> None:
+        knowledge_ids = list(knowledge_ids)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("deleted", knowledge_ids))
+            if self._snapshot is not None:
+                self._snapshot = self._snapshot.merged(deleted_ids=knowledge_ids)
+
+    def invalidate(self) -> None:
+        """次回取得時に全件再ロードさせる"""
+        with self._lock:
+            self._full_loaded_at = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._snapshot) if self._snapshot else 0,
+                "version": self._snapshot.version if self._snapshot else None,
+                "full_loads": self.full_loads,
+                "delta_loads": self.delta_loads,
+            }
+
+
+_stores: dict[str, KnowledgeSnapshotStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(
+    name: str,
+    load_all: Callable[[], list[dict]],
+    load_since: Callable[[int], list[dict]],
+) -> KnowledgeSnapshotStore:
+    """名前ごとのスナップショットストアをプロセス内で共有して返す"""
+    with _stores_lock:
+        store = _stores.get(name)
+        if store is None:
+            store = KnowledgeSnapshotStore(load_all, load_since)
+            _stores[name] = store
+        return store
+
+
+def peek_snapshot_store(name: str) -> Optional[KnowledgeSnapshotStore]:
+    """作成済みのストアのみを返す（未作成ならNone。更新フック用）"""
+    with _stores_lock:
+        return _stores.get(name)
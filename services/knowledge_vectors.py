@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import hashlib
+from typing import Optional
+
+# ナレッジのベクトルと、ベクトル化したテキストのハッシュを保存する項目
+KNOWLEDGE_VECTOR_FIELD = "target_clause_vector"
+KNOWLEDGE_VECTOR_HASH_FIELD = "target_clause_vector_hash"
+
+
+def knowledge_vector_text(knowledge: dict) -> str:
+    """ナレッジのベクトル化対象テキスト（target_clause）"""
+    return str(knowledge.get("target_clause") or "").strip()
+
+
+def knowledge_vector_hash(knowledge: dict) -> str:
+    """ベクトル化対象テキストのSHA-256"""
+    return hashlib.sha256(knowledge_vector_text(knowledge).encode("utf-8")).hexdigest()
+
+
+def get_valid_knowledge_vector(knowledge: dict) -> Optional[list[float]]:
+    """
+    保存済みベクトルが現在のtarget_clauseに対応していれば返す（ハッシュ不一致ならNone）
+    ハッシュ未記録の既存ベクトルは有効とみなす。
+    """
+    vector = knowledge.get(KNOWLEDGE_VECTOR_FIELD)
+    if not vector:
+        return None
+    stored_hash = knowledge.get(KNOWLEDGE_VECTOR_HASH_FIELD)
+    if stored_hash and stored_hash != knowledge_vector_hash(knowledge):
+        return None
+    return vector
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import Any, Mapping, Optional
+
+
+def _parse_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_retry_after(headers: Optional[Mapping[str, Any]]) -> Optional[float]:
+    """`retry-after-ms` / `retry-after`（秒）ヘッダから待機秒数を返す"""
+    if not headers:
+        return None
+    lowered = {str(k).lower(): v for k, v in dict(headers).items()}
+    ms = _parse_float(lowered.get("retry-after-ms"))
+    if ms is not None:
+        return max(ms / 1000.0, 0.0)
+    sec = _parse_float(lowered.get("retry-after"))
+    if sec is not None:
+        return max(sec, 0.0)
+    return None
+
+
+class TokenBucketRateLimiter:
+    """
+    デプロイメントごとのリクエスト数(RPM)・トークン数(TPM)を管理するトークンバケット。
+    - 上限は1分あたりの値で、経過時間に応じて連続的に補充する（上限未設定なら無制限）
+    - Azureの `x-ratelimit-limit-*` / `x-ratelimit-remaining-*` ヘッダで上限と残量を補正する
+    - 429受信時は `retry-after` の間、全呼び出しを停止する
+    スレッド（Streamlitセッション）・イベントループを跨いで共有できるよう、状態はthreading.Lockで保護する。
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests_available = float(rpm) if rpm else 0.0
+        self.tokens_available = float(tpm) if tpm else 0.0
+        self.blocked_until = 0.0
+        self.updated_at = time.monotonic()
+        self.throttled = 0
+        self.waited_sec = 0.0
+        self._lock = threading.Lock()
+
+    def _refill_locked(self, now: float) -> None:
+        elapsed = max(now - self.updated_at, 0.0)
+        self.updated_at = now
+        if self.rpm:
+            self.requests_available = min(
+                float(self.rpm), self.requests_available + elapsed * self.rpm / 60.0
+            )
+        if self.tpm:
+            self.tokens_available = min(
+                float(self.tpm), self.tokens_available + elapsed * self.tpm / 60.0
+            )
+
+    def _try_acquire_locked(self, tokens: int, now: float) -> float:
+        """取得できれば0、できなければ待機すべき秒数を返す"""
+        self._refill_locked(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        wait = 0.0
+        if self.rpm and self.requests_available < 1.0:
+            wait = max(wait, (1.0 - self.requests_available) * 60.0 / self.rpm)
+        if self.tpm:
+            # 1リクエストでバケット容量を超える場合は満杯になるまで待って通す
+            need = min(float(tokens), float(self.tpm))
+            if self.tokens_available < need:
+                wait = max(wait, (need - self.tokens_available) * 60.0 / self.tpm)
+        if wait > 0:
+            return wait
+        if self.rpm:
+            self.requests_available -= 1.0
+        if self.tpm:
+            self.tokens_available -= float(tokens)
+        return 0.0
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """リクエスト1件と推定トークン数を確保できるまで待機し、待機秒数を返す"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait = self._try_acquire_locked(tokens, time.monotonic())
+            if wait <= 0:
+                if waited:
+                    with self._lock:
+                        self.waited_sec += waited
+                return waited
+            wait = min(wait, 60.0)
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def update_from_headers(self, headers: Optional[Mapping[str, Any]]) -> None:
+        """レスポンスヘッダの上限・残量でバケットを補正する"""
+        if not headers:
+            return
+        lowered = {str(k).lower(): v for k, v in dict(headers).items()}
+        limit_requests = _parse_float(lowered.get("x-ratelimit-limit-requests"))
+        limit_tokens = _parse_float(lowered.get("x-ratelimit-limit-tokens"))
+        remaining_requests = _parse_float(lowered.get("x-ratelimit-remaining-requests"))
+        remaining_tokens = _parse_float(lowered.get("x-ratelimit-remaining-tokens"))
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            if limit_requests:
+                self.rpm = limit_requests
+            if limit_tokens:
+                self.tpm = limit_tokens
+            # 上限が不明な場合は観測した残量の最大値を上限とみなす
+            if remaining_requests is not None:
+                if not limit_requests and remaining_requests > (self.rpm or 0):
+                    self.rpm = remaining_requests
+                # サーバ側の残量の方が少なければそちらに合わせる（他プロセスの消費分を反映）
+                self.requests_available = min(
+                    self.requests_available or remaining_requests, remaining_requests
+                )
+            if remaining_tokens is not None:
+                if not limit_tokens and remaining_tokens > (self.tpm or 0):
+                    self.tpm = remaining_tokens
+                self.tokens_available = min(
+                    self.tokens_available or remaining_tokens, remaining_tokens
+                )
+
+    def penalize(self, retry_after: float) -> None:
+        """429受信時: retry_after秒間は新規呼び出しを止め、残量を空にする"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill_locked(now)
+            self.blocked_until = max(self.blocked_until, now + max(retry_after, 0.0))
+            self.requests_available = min(self.requests_available, 0.0)
+            self.tokens_available = min(self.tokens_available, 0.0)
+            self.throttled += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "requests_available": self.requests_available,
+                "tokens_available": self.tokens_available,
+                "throttled": self.throttled,
+                "waited_sec": self.waited_sec,
+            }
+
+
+_limiters: dict[str, TokenBucketRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(deployment: str) -> TokenBucketRateLimiter:
+    """
+    デプロイメントごとのレートリミッタをプロセス内で共有して返す。
+    初期上限は `LLM_RPM_<MODEL>` / `LLM_TPM_<MODEL>` → `LLM_RPM` / `LLM_TPM`（未設定ならヘッダから学習）。
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(deployment)
+        if limiter is None:
+            suffix = re.sub(r"\W", "_", deployment).upper()
+            rpm = _parse_float(os.getenv(f"LLM_RPM_{suffix}", os.getenv("LLM_RPM")))
+            tpm = _parse_float(os.getenv(f"LLM_TPM_{suffix}", os.getenv("LLM_TPM")))
+            limiter = TokenBucketRateLimiter(rpm=rpm, tpm=tpm)
+            _limiters[deployment] = limiter
+        return limiter
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from services.disk_cache import get_cache_dir
+
+# 作業単位の種別
+MAPPING_CHUNK = "mapping_chunk"
+KNOWLEDGE_REVIEW = "knowledge_review"
+CLAUSE_SUMMARY = "clause_summary"
+
+OK = "ok"
+FAILED = "failed"
+
+
+class RunLedgerStore:
+    """
+    審査の実行単位（run_id）ごとに、作業単位（マッピングのチャンク・ナレッジ審査・条項要約）の
+    入力ハッシュと結果/エラーを記録するSQLite台帳。
+    `RUN_LEDGER_TTL_SEC`（既定86400）より古い記録は起動時に削除する。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS units (
+                run_id TEXT NOT NULL,
+                unit_key TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, unit_key)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_units_updated ON units(updated_at)"
+        )
+        ttl = float(os.getenv("RUN_LEDGER_TTL_SEC", "86400"))
+        self._conn.execute("DELETE FROM units WHERE updated_at < ?", (time.time() - ttl,))
+        self._conn.commit()
+
+    def get(self, run_id: str, unit_key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, status, result, error, attempts FROM units "
+                "WHERE run_id = ? AND unit_key = ?",
+                (run_id, unit_key),
+            ).fetchone()
+        if row is None:
+            return None
+        kind, status, result, error, attempts = row
+        return {
+            "kind": kind,
+            "status": status,
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "attempts": attempts,
+        }
+
+    def record(
+        self,
+        run_id: str,
+        unit_key: str,
+        kind: str,
+        status: str,
+        result: Any = None,
+        error: Optional[str] = None,
+    ) -> None:
+        blob = json.dumps(result, ensure_ascii=False) if status == OK else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO units (run_id, unit_key, kind, status, result, error, attempts, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT(run_id, unit_key) DO UPDATE SET "
+                "status = excluded.status, result = excluded.result, error = excluded.error, "
+                "attempts = units.attempts + 1, updated_at = excluded.updated_at",
+                (run_id, unit_key, kind, status, blob, error, time.time()),
+            )
+            self._conn.commit()
+
+    def list_units(self, run_id: str) -> list[dict]:
+        """run_id の全単位（結果本文を除く、更新順）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT unit_key, kind, status, error, attempts FROM units "
+                "WHERE run_id = ? ORDER BY updated_at",
+                (run_id,),
+            ).fetchall()
+        return [
+            {"unit_key": key, "kind": kind, "status": status, "error": error, "attempts": attempts}
+            for key, kind, status, error, attempts in rows
+        ]
+
+
+class RunLedger:
+    """
+    1回の審査（run_id）の台帳。各処理は作業単位の入力ハッシュで lookup し、
+    成功済みなら結果を再利用、未実行/失敗なら実行して record する。
+    同じ run_id で再実行すると失敗した単位のみがLLMを呼び直し、成功済みの結果とマージされる。
+    """
+
+    def __init__(self, store: RunLedgerStore, run_id: str):
+        self.store = store
+        self.run_id = run_id
+        # この実行で参照した単位（入力が変わって使われなくなった過去の単位を集計から除く）
+        self._touched: set[str] = set()
+
+    def lookup(self, unit_key: str) -> Optional[Any]:
+        """成功済みの単位の結果を返す（未実行・失敗はNone）"""
+        self._touched.add(unit_key)
+        unit = self.store.get(self.run_id, unit_key)
+        if unit is None or unit["status"] != OK:
+            return None
+        return unit["result"]
+
+    def record_ok(self, unit_key: str, kind: str, result: Any) -> None:
+        self._touched.add(unit_key)
+        self.store.record(self.run_id, unit_key, kind, OK, result=result)
+
+    def record_failed(self, unit_key: str, kind: str, error: Any) -> None:
+        self._touched.add(unit_key)
+        self.store.record(self.run_id, unit_key, kind, FAILED, error=str(error))
+
+    def units(self) -> list[dict]:
+        """この実行で参照した単位（未参照の台帳インスタンスでは run_id の全単位）"""
+        units = self.store.list_units(self.run_id)
+        if self._touched:
+            units = [u for u in units if u["unit_key"] in self._touched]
+        return units
+
+    def summary(self) -> dict:
+        """{kind: {"ok": 件数, "failed": 件数}}"""
+        counts: dict[str, dict[str, int]] = {}
+        for unit in self.units():
+            kind_counts = counts.setdefault(unit["kind"], {})
+            kind_counts[unit["status"]] = kind_counts.get(unit["status"], 0) + 1
+        return counts
+
+    def failed_units(self) -> list[dict]:
+        return [u for u in self.units() if u["status"] == FAILED]
+
+
+_store: Optional[RunLedgerStore] = None
+_store_lock = threading.Lock()
+
+
+def get_run_ledger(run_id: str) -> RunLedger:
+    """run_id の台帳を返す（保存先は `<APP_CACHE_DIR>/run_ledger.sqlite3`、プロセス内で共有）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RunLedgerStore(os.path.join(get_cache_dir(), "run_ledger.sqlite3"))
+        return RunLedger(_store, run_id)
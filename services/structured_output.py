@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+from typing import Any, Optional
+
+from jsonschema import Draft202012Validator
+
+SCHEMA_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "configs", "examination")
+)
+
+_validators: dict[str, Draft202012Validator] = {}
+_validators_lock = threading.Lock()
+
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+
+
+def is_structured_output_enabled() -> bool:
+    """`LLM_STRUCTURED_OUTPUT=0` で response_format の指定を無効化（非対応のデプロイメント向け）"""
+    return os.getenv("LLM_STRUCTURED_OUTPUT", "1") != "0"
+
+
+def get_schema_validator(name: str) -> Draft202012Validator:
+    """`configs/examination/<name>.schema.json` のバリデータを返す（プロセス内で共有）"""
+    with _validators_lock:
+        validator = _validators.get(name)
+        if validator is None:
+            path = os.path.join(SCHEMA_DIR, f"{name}.schema.json")
+            with open(path, "r", encoding="utf-8") as f:
+                schema = json.load(f)
+            Draft202012Validator.check_schema(schema)
+            validator = Draft202012Validator(schema)
+            _validators[name] = validator
+        return validator
+
+
+def build_response_format(name: str) -> dict:
+    """Chat Completions の `response_format`（json_schema, strict）を作る"""
+    schema = dict(get_schema_validator(name).schema)
+    title = schema.pop("title", name)
+    schema.pop("$schema", None)
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": title, "schema": schema, "strict": True},
+    }
+
+
+def _wrap_bare_array(payload: Any, validator: Draft202012Validator) -> Any:
+    """配列のみが返った場合、ルートが「配列1項目のオブジェクト」のスキーマならその項目に包む"""
+    schema = validator.schema
+    if not isinstance(payload, list) or schema.get("type") != "object":
+        return payload
+    keys = [
+        k for k, v in schema.get("properties", {}).items() if v.get("type") == "array"
+    ]
+    if len(keys) == 1 and schema.get("required") == keys:
+        return {keys[0]: payload}
+    return payload
+
+
+def validate_json_text(text: str, name: str) -> tuple[Any, Optional[str]]:
+    """
+    JSON文字列をパースしてスキーマ検証する
+    Returns:
+        tuple: (パース結果 or None, エラーメッセージ or None)
+    """
+    validator = get_schema_validator(name)
+    try:
+        payload = json.loads(text)
+    except (TypeError, ValueError) as e:
+        return None, f"JSONとして解釈できません: {e}"
+    payload = _wrap_bare_array(payload, validator)
+    errors = sorted(validator.iter_errors(payload), key=lambda e: list(e.absolute_path))
+    if errors:
+        messages = [
+            f"{'/'.join(str(p) for p in e.absolute_path) or '(root)'}: {e.message}"
+            for e in errors[:5]
+        ]
+        return None, "スキーマに適合しません: " + "; ".join(messages)
+    return payload, None
+
+
+def repair_json_text(text: str) -> str:
+    """
+    よくある崩れのみを機械的に直す（LLMを呼ばない修復）
+    - コードブロック（```json ... ```）の除去
+    - 前後の説明文を除き、最初の { / [ から対応する最後の } / ] までを抽出
+    - 閉じ括弧直前の余分なカンマの除去
+    """
+    text = _CODE_FENCE.sub("", str(text or "")).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if starts:
+        start = min(starts)
+        end = text.rfind("}" if text[start] == "{" else "]")
+        if end > start:
+            text = text[start : end + 1]
+    return _TRAILING_COMMA.sub(r"\1", text)
+
+
+class StructuredOutputStats:
+    """構造化出力のパース結果の集計（修復の発生頻度の確認用）"""
+
+    def __init__(self):
+        self._counts = {"valid": 0, "local_repaired": 0, "llm_repaired": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str) -> None:
+        with self._lock:
+            self._counts[outcome] = self._counts.get(outcome, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+_stats = StructuredOutputStats()
+
+
+def get_structured_output_stats() -> StructuredOutputStats:
+    return _stats
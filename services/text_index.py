@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from typing import Callable, Iterable, Optional
+
+# 2/3-gram を索引する（1文字の検索語は正規化済みテキストを直接走査する）
+NGRAM_SIZES = (2, 3)
+_OR_SPLIT = re.compile(r"\s+OR\s+|\|")
+
+
+def normalize_text(text) -> str:
+    """NFKC正規化（全角英数→半角等）+ 小文字化 + 空白の圧縮（整数値のfloatは 12.0 → "12"）"""
+    if isinstance(text, float) and text.is_integer():
+        text = int(text)
+    text = unicodedata.normalize("NFKC", str(text or "")).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _ngrams(text: str, n: int) -> set[str]:
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+
+def parse_query(query: str) -> list[list[str]]:
+    """
+    検索語を OR グループ（AND 条件の語のリスト）に分解する
+    例: "損害 賠償 | 免責" → [["損害", "賠償"], ["免責"]]
+    """
+    groups = []
+    for part in _OR_SPLIT.split(str(query or "")):
+        terms = [t for t in normalize_text(part).split(" ") if t]
+        if terms:
+            groups.append(list(dict.fromkeys(terms)))
+    return groups
+
+
+class NgramTextIndex:
+    """
+    日本語向けの文字n-gram転置インデックス。
+    - 各フィールドの正規化テキストから2/3-gramのポスティング（gram → 文書番号の集合）を作る
+    - 検索語はn-gramのポスティングの積集合で候補を絞り、部分文字列一致で確認する（偽陽性なし）
+    - スコアはフィールド重み × 出現回数 × IDF の合計
+    - upsert/delete で1件ずつ差分反映、sync でスナップショットとの差分（_etag比較）のみ反映
+    """
+
+    def __init__(self, fields: dict[str, float], payload_fields: Optional[list[str]] = None):
+        self.fields = dict(fields)
+        self.payload_fields = list(payload_fields or [])
+        self.version = None
+        self._postings: dict[str, set[int]] = {}
+        self._docs: dict[int, dict] = {}
+        self._slots: dict[str, int] = {}
+        self._next_slot = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    # 更新 -------------------
+
+    def _doc_grams(self, texts: dict[str, str]) -> set[str]:
+        grams: set[str] = set()
+        for text in texts.values():
+            for n in NGRAM_SIZES:
+                grams.update(text[i : i + n] for i in range(len(text) - n + 1))
+        return grams
+
+    def _remove_locked(self, item_id: str) -> bool:
+        slot = self._slots.pop(item_id, None)
+        if slot is None:
+            return False
+        doc = self._docs.pop(slot)
+        # 文書ごとのgram集合は保持せず、削除時にテキストから再計算する（メモリ節約）
+        for gram in self._doc_grams(doc["texts"]):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(slot)
+                if not posting:
+                    del self._postings[gram]
+        return True
+
+    def _add_locked(self, item: dict) -> None:
+        item_id = str(item["id"])
+        self._remove_locked(item_id)
+        texts = {f: normalize_text(item.get(f)) for f in self.fields}
+        slot = self._next_slot
+        self._next_slot += 1
+        self._slots[item_id] = slot
+        self._docs[slot] = {
+            "id": item_id,
+            "etag": item.get("_etag"),
+            "texts": texts,
+            "payload": {f: item.get(f) for f in self.payload_fields if f in item},
+        }
+        postings = self._postings
+        for gram in self._doc_grams(texts):
+            posting = postings.get(gram)
+            if posting is None:
+                postings[gram] = {slot}
+            else:
+                posting.add(slot)
+
+    def upsert(self, item: dict) -> None:
+        with self._lock:
+            self._add_locked(item)
+
+    def delete(self, item_id: str) -> bool:
+        with self._lock:
+            return self._remove_locked(str(item_id))
+
+    def sync(self, items: Iterable[dict], version=None) -> int:
+        """itemsを正として、_etagが変わったもの・追加/削除されたもののみ反映し、反映件数を返す"""
+        changed = 0
+        with self._lock:
+            seen = set()
+            for item in items:
+                item_id = str(item["id"])
+                seen.add(item_id)
+                slot = self._slots.get(item_id)
+                etag = item.get("_etag")
+                if slot is not None and etag and self._docs[slot]["etag"] == etag:
+                    continue
+                self._add_locked(item)
+                changed += 1
+            for item_id in [i for i in self._slots if i not in seen]:
+                self._remove_locked(item_id)
+                changed += 1
+            self.version = version
+        return changed
+
+    # 検索 -------------------
+
+    def _match_term_locked(self, term: str) -> set[int]:
+        """語を含む文書番号の集合（n-gram積集合で候補を絞り、部分文字列で確認）"""
+        if len(term) < min(NGRAM_SIZES):
+            return {
+                slot
+                for slot, doc in self._docs.items()
+                if any(term in text for text in doc["texts"].values())
+            }
+        n = min(len(term), max(NGRAM_SIZES))
+        postings = [self._postings.get(g) for g in _ngrams(term, n)]
+        if not postings or any(p is None for p in postings):
+            return set()
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return candidates
+        if len(term) <= max(NGRAM_SIZES):
+            return candidates
+        return {
+            slot
+            for slot in candidates
+            if any(term in text for text in self._docs[slot]["texts"].values())
+        }
+
+    def search(self, query: str, limit: Optional[int] = None) -> list[dict]:
+        """
+        検索語（空白区切りはAND、`|` または ` OR ` 区切りはOR）に一致する文書をスコア降順で返す
+        Returns:
+            list: [{"id", "score", ...payload}]
+        """
+        groups = parse_query(query)
+        if not groups:
+            return []
+        with self._lock:
+            total = max(len(self._slots), 1)
+            term_docs: dict[str, set[int]] = {}
+            matched: set[int] = set()
+            for terms in groups:
+                group_docs = None
+                for term in terms:
+                    if term not in term_docs:
+                        term_docs[term] = self._match_term_locked(term)
+                    docs = term_docs[term]
+                    group_docs = set(docs) if group_docs is None else group_docs & docs
+                    if not group_docs:
+                        break
+                matched |= group_docs or set()
+            idfs = {
+                term: math.log(1.0 + total / len(docs))
+                for term, docs in term_docs.items()
+                if docs
+            }
+            scored = []
+            for slot in matched:
+                doc = self._docs[slot]
+                score = 0.0
+                for term, idf in idfs.items():
+                    if slot not in term_docs[term]:
+                        continue
+                    for field, weight in self.fields.items():
+                        count = doc["texts"][field].count(term)
+                        if count:
+                            score += weight * (1.0 + math.log(count)) * idf
+                scored.append((score, slot))
+            if limit is not None:
+                scored = heapq.nsmallest(limit, scored, key=lambda x: (-x[0], x[1]))
+            else:
+                scored.sort(key=lambda x: (-x[0], x[1]))
+            return [
+                {"id": self._docs[slot]["id"], "score": round(score, 4), **self._docs[slot]["payload"]}
+                for score, slot in scored
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "docs": len(self._slots),
+                "grams": len(self._postings),
+                "postings": sum(len(p) for p in self._postings.values()),
+                "version": self.version,
+            }
+
+
+_indexes: dict[str, NgramTextIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_text_index(
+    name: str, loader: Callable[[], NgramTextIndex], refresh: bool = False
+) -> NgramTextIndex:
+    """名前ごとの全文索引をプロセス内で共有して返す（初回またはrefresh時にloaderで構築）"""
+    with _indexes_lock:
+        index = _indexes.get(name)
+        if index is None or refresh:
+            index = loader()
+            _indexes[name] = index
+        return index
+
+
+def peek_text_index(name: str) -> Optional[NgramTextIndex]:
+    """構築済みの索引のみを返す（未構築ならNone。更新フック用）"""
+    with _indexes_lock:
+        return _indexes.get(name)
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+# 埋め込み/チャットモデルごとのトークナイザ
+EMBEDDING_ENCODING = "cl100k_base"
+CHAT_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(name: str):
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(name)
+    except Exception:
+        # オフライン等でエンコーディングが取得できない場合は概算にフォールバック
+        return None
+
+
+def count_tokens(text: str, encoding: str = CHAT_ENCODING) -> int:
+    """
+    テキストのトークン数を返す。
+    tiktokenが使えない場合は日本語を考慮した概算（1文字≒1トークン）を返す。
+    """
+    if not text:
+        return 0
+    enc = _get_encoding(encoding)
+    if enc is None:
+        return len(text)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(
+    text: str, max_tokens: int, encoding: str = CHAT_ENCODING
+) -> str:
+    """テキストを先頭から最大max_tokensトークンに切り詰める"""
+    if not text:
+        return text
+    enc = _get_encoding(encoding)
+    if enc is None:
+        return text[:max_tokens]
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
+
@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+
+from services.disk_cache import get_cache_dir
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """行ごとにL2正規化したfloat32の連続配列を返す"""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorIndex:
+    """
+    正規化済みベクトルを (n, d) のfloat32行列で保持するインメモリ索引。
+    検索は行列積1回 + argpartition でバッチのコサイン類似度top-kを返す。
+    """
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+        self.ids: list[str] = []
+        self.payloads: dict[str, dict] = {}
+        self.matrix = np.zeros((0, dim or 0), dtype=np.float32)
+        self._pos: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.updated_at = time.time()
+        # 元データ（Cosmos DB）から構築した時刻。差分反映では変わらず、鮮度の判定に使う
+        self.built_at = self.updated_at
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_items(
+        cls,
+        items: Iterable[dict],
+        vector_field: str,
+        payload_fields: Optional[list[str]] = None,
+    ) -> "VectorIndex":
+        """Cosmos DBのアイテム（id + ベクトル列）から索引を構築する"""
+        ids, vectors, payloads = [], [], {}
+        for item in items:
+            vector = item.get(vector_field)
+            if not vector:
+                continue
+            item_id = str(item["id"])
+            ids.append(item_id)
+            vectors.append(vector)
+            payloads[item_id] = {
+                f: item.get(f) for f in (payload_fields or []) if f in item
+            }
+        index = cls(dim=len(vectors[0]) if vectors else None)
+        if vectors:
+            index.matrix = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        index.ids = ids
+        index.payloads = payloads
+        index._pos = {item_id: i for i, item_id in enumerate(ids)}
+        return index
+
+    def upsert(self, item_id: str, vector: list[float], payload: Optional[dict] = None):
+        """1件追加/更新する（save_knowledge等のフックから呼ぶ）"""
+        row = normalize_rows(np.asarray(vector, dtype=np.float32))
+        item_id = str(item_id)
+        with self._lock:
+            if self.dim is None or len(self.ids) == 0:
+                self.dim = row.shape[1]
+                self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+            if row.shape[1] != self.dim:
+                raise ValueError(
+                    f"ベクトル次元が一致しません: {row.shape[1]} != {self.dim}"
+                )
+            # memmapは読み取り専用のため、更新時にメモリへ複製する
+            if not self.matrix.flags.writeable:
+                self.matrix = np.array(self.matrix)
+            pos = self._pos.get(item_id)
+            if pos is None:
+                self.matrix = np.ascontiguousarray(np.vstack([self.matrix, row]))
+                self._pos[item_id] = len(self.ids)
+                self.ids.append(item_id)
+            else:
+                self.matrix[pos] = row[0]
+            self.payloads[item_id] = payload or {}
+            self.updated_at = time.time()
+
+    def delete(self, item_id: str) -> bool:
+        """
+        1件削除する（末尾行を削除位置へ移す）
+        検索中のスレッドはロック外で取得済みの行列を使うため、行列・ペイロードは複製してから書き換える
+        """
+        item_id = str(item_id)
+        with self._lock:
+            pos = self._pos.pop(item_id, None)
+            if pos is None:
+                return False
+            last = len(self.ids) - 1
+            matrix = np.array(self.matrix[:last])
+            ids = list(self.ids)
+            if pos != last:
+                moved_id = ids[last]
+                matrix[pos] = self.matrix[last]
+                ids[pos] = moved_id
+                self._pos[moved_id] = pos
+            ids.pop()
+            payloads = dict(self.payloads)
+            payloads.pop(item_id, None)
+            self.matrix, self.ids, self.payloads = matrix, ids, payloads
+            self.updated_at = time.time()
+            return True
+
+    def get(self, item_id: str) -> Optional[tuple[np.ndarray, dict]]:
+        """idの正規化済みベクトル（複製）とペイロードを返す（未登録ならNone）"""
+        with self._lock:
+            pos = self._pos.get(str(item_id))
+            if pos is None:
+                return None
+            return np.array(self.matrix[pos]), dict(self.payloads.get(str(item_id), {}))
+
+    def search(self, queries, top_k: int = 5) -> list[list[dict]]:
+        """
+        クエリベクトル群 (m, d) に対し、それぞれ類似度上位top_k件を返す
+        Returns:
+            list: クエリごとの [{"id", "SimilarityScore", ...payload}] （類似度降順）
+        """
+        with self._lock:
+            matrix, ids, payloads = self.matrix, list(self.ids), self.payloads
+        q = normalize_rows(np.asarray(queries, dtype=np.float32))
+        if not ids:
+            return [[] for _ in range(q.shape[0])]
+        scores = q @ matrix.T
+        k = min(top_k, scores.shape[1])
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        rows = np.arange(scores.shape[0])[:, None]
+        order = np.argsort(-scores[rows, top], axis=1)
+        top = top[rows, order]
+        results = []
+        for qi in range(q.shape[0]):
+            hits = []
+            for pos in top[qi]:
+                item_id = ids[pos]
+                hit = {"id": item_id, **payloads.get(item_id, {})}
+                hit["SimilarityScore"] = float(scores[qi, pos])
+                hits.append(hit)
+            results.append(hits)
+        return results
+
+    def save(self, path: str) -> None:
+        """`<path>.npy`（行列）と `<path>.json`（id/ペイロード）にスナップショット保存"""
+        with self._lock:
+            matrix, ids, payloads = self.matrix, list(self.ids), dict(self.payloads)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_npy = f"{path}.tmp.npy"
+        np.save(tmp_npy, matrix)
+        os.replace(tmp_npy, f"{path}.npy")
+        tmp_json = f"{path}.json.tmp"
+        with open(tmp_json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"ids": ids, "payloads": payloads, "built_at": self.built_at},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_json, f"{path}.json")
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "VectorIndex":
+        """スナップショットを読み込む（mmap=Trueならメモリマップで開く）"""
+        matrix = np.load(f"{path}.npy", mmap_mode="r" if mmap else None)
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(dim=matrix.shape[1] if matrix.ndim == 2 else None)
+        index.matrix = matrix
+        index.ids = list(meta.get("ids", []))
+        index.payloads = meta.get("payloads", {})
+        index._pos = {item_id: i for i, item_id in enumerate(index.ids)}
+        index.updated_at = os.path.getmtime(f"{path}.npy")
+        index.built_at = float(meta.get("built_at") or index.updated_at)
+        return index
+
+
+_indexes: dict[str, VectorIndex] = {}
+_indexes_lock = threading.Lock()
+_pending_saves: dict[str, threading.Timer] = {}
+_build_locks: dict[str, threading.Lock] = {}
+
+
+def get_snapshot_path(name: str) -> str:
+    return os.path.join(get_cache_dir(), "vector_index", name)
+
+
+def _max_age_sec() -> float:
+    return float(os.getenv("VECTOR_INDEX_MAX_AGE_SEC", "3600"))
+
+
+def get_vector_index(
+    name: str, loader: Callable[[], VectorIndex], refresh: bool = False
+) -> VectorIndex:
+    """
+    名前ごとの索引をプロセス内で共有して返す。
+    構築から `VECTOR_INDEX_MAX_AGE_SEC`（既定3600）を過ぎたロード済み索引は読み直す。
+    読み直し時はスナップショット（構築から同じ秒数以内）を優先し、無ければloaderで構築して保存する。
+    構築は名前ごとのロックで直列化し、共有の索引表はロックせずに行う（他の索引の取得・更新フックを止めない）
+    """
+    max_age = _max_age_sec()
+
+    def fresh(index: Optional[VectorIndex]) -> bool:
+        return index is not None and time.time() - index.built_at <= max_age
+
+    with _indexes_lock:
+        current = _indexes.get(name)
+        if not refresh and fresh(current):
+            return current
+        build_lock = _build_locks.setdefault(name, threading.Lock())
+    with build_lock:
+        # 待っている間に他のスレッドが構築し直していればそれを使う
+        with _indexes_lock:
+            latest = _indexes.get(name)
+        if latest is not current and fresh(latest):
+            return latest
+        path = get_snapshot_path(name)
+        index = None
+        if not refresh and os.path.exists(f"{path}.npy"):
+            try:
+                snapshot = VectorIndex.load(path)
+                if fresh(snapshot):
+                    index = snapshot
+            except Exception:
+                index = None
+        if index is None:
+            index = loader()
+            index.save(path)
+        with _indexes_lock:
+            _indexes[name] = index
+        return index
+
+
+def peek_vector_index(name: str) -> Optional[VectorIndex]:
+    """ロード済みの索引のみを返す（未ロードならNone。更新フック用）"""
+    with _indexes_lock:
+        return _indexes.get(name)
+
+
+def _save_now(name: str) -> None:
+    with _indexes_lock:
+        _pending_saves.pop(name, None)
+        index = _indexes.get(name)
+    if index is not None:
+        index.save(get_snapshot_path(name))
+
+
+def save_vector_index(name: str) -> None:
+    """
+    ロード済み索引のスナップショット保存を予約する。
+    `VECTOR_INDEX_SAVE_DELAY_SEC`（既定30、0で即時）の間の保存要求はまとめて1回だけ書き出す
+    """
+    delay = float(os.getenv("VECTOR_INDEX_SAVE_DELAY_SEC", "30"))
+    if delay <= 0:
+        _save_now(name)
+        return
+    with _indexes_lock:
+        if name in _pending_saves or name not in _indexes:
+            return
+        timer = threading.Timer(delay, _save_now, args=(name,))
+        timer.daemon = True
+        _pending_saves[name] = timer
+    timer.start()
+
+
+@atexit.register
+def flush_vector_indexes() -> None:
+    """予約中のスナップショット保存を直ちに実行する（プロセス終了時にも呼ばれる）"""
+    with _indexes_lock:
+        pending = list(_pending_saves.items())
+    for name, timer in pending:
+        timer.cancel()
+        _save_now(name)